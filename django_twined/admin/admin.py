@@ -1,14 +1,22 @@
 import logging
 
 from django.conf import settings
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import PermissionDenied
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import redirect
-from django.urls import reverse
+from django.template.defaultfilters import linebreaksbr
+from django.urls import path, reverse
+from django.utils.html import format_html
 from jsoneditor.forms import JSONEditor
 from octue.log_handlers import LOG_RECORD_ATTRIBUTES_WITH_TIMESTAMP, create_octue_formatter
 
 from django_twined.fields import ValuesField
-from django_twined.models import Question, ServiceRevision, ServiceUsageEvent
+from django_twined.models import Question, QuestionEventSummary, ServiceRevision, ServiceUsageEvent
+from django_twined.models.querysets import QuestionAskReport
+from django_twined.models.service_usage_events import get_prefetched_events_attribute
 
 from .fieldsets import (
     question_basic_fieldset,
@@ -22,13 +30,43 @@ from .mixins import CreatableFieldsMixin
 
 log_formatter = create_octue_formatter(LOG_RECORD_ATTRIBUTES_WITH_TIMESTAMP, include_line_number=True, use_colour=False)
 
+DEFAULT_LOG_RECORDS_PREVIEW_SIZE = 100
+LOG_RECORDS_CHUNK_SIZE = 2000
+
+# The message kinds of the events shown (in the list of questions, or on a question's page) for questions without an
+# event summary, which are prefetched for them
+UNSUMMARISED_EVENT_KINDS = ("delivery_acknowledgement", "heartbeat")
+
+
+def get_reported_time(data, old_key):
+    """Get the datetime reported by a child service in the data of an event. This is backwards compatible with the old
+    names of the datetime fields of events from `octue` <= 0.50.1.
+
+    :param dict|None data: the data of the event
+    :param str old_key: the old name of the datetime field of the event
+    :return str|None:
+    """
+    if not data:
+        return None
+
+    return data.get("datetime") or data.get(old_key)
+
+
+def format_log_record(event):
+    """Format the log record contained in a log record service usage event as a line of text
+
+    :param django_twined.models.ServiceUsageEvent event:
+    :return str:
+    """
+    return log_formatter.format(logging.makeLogRecord(event.data["log_record"]))
+
 
 class QuestionAdmin(admin.ModelAdmin):
     """Subclass this QuestionAdmin to get started administering your question subclasses"""
 
     change_form_template = "django_twined/question_changeform.html"
     search_fields = ["id", "service_revision__name"]
-    list_display = ("id", "asked", "answered", "service_revision", "status")
+    list_display = ("id", "asked", "answered", "service_revision", "status", "latest_heartbeat")
     list_filter = (
         "asked",
         "service_revision__namespace",
@@ -74,6 +112,40 @@ class QuestionAdmin(admin.ModelAdmin):
     #     except AttributeError:
     #         return None
 
+    def get_queryset(self, request):
+        """Fetch the event summary of each question with it, so the question's events needn't be queried to display its
+        progress, and prefetch the events displayed for questions without a summary
+        """
+        unsummarised_events = ServiceUsageEvent.objects.filter(
+            question__event_summary__isnull=True, message_kind__in=UNSUMMARISED_EVENT_KINDS
+        ).order_by("publish_time", "id")
+
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("event_summary")
+            .prefetch_related(
+                Prefetch(
+                    "service_usage_events",
+                    queryset=unsummarised_events,
+                    to_attr=get_prefetched_events_attribute(UNSUMMARISED_EVENT_KINDS),
+                )
+            )
+        )
+
+    @staticmethod
+    def _get_event_summary(obj):
+        """Get the event summary of the question, or None if no events have been ingested for it. The display methods
+        fall back to querying the question's events when it has no summary (e.g. if its events were created directly,
+        or written to a sink other than the database).
+
+        :return django_twined.models.QuestionEventSummary|None:
+        """
+        try:
+            return obj.event_summary
+        except QuestionEventSummary.DoesNotExist:
+            return None
+
     @staticmethod
     def delivery_acknowledgement(obj):
         """Show the datetime the question was acknowledged by the child service. This method is backwards compatible
@@ -81,9 +153,13 @@ class QuestionAdmin(admin.ModelAdmin):
 
         :return str|None:
         """
-        return obj.delivery_acknowledgement.data.get("datetime") or obj.delivery_acknowledgement.data.get(
-            "delivery_time"
-        )
+        summary = QuestionAdmin._get_event_summary(obj)
+
+        if summary is None:
+            acknowledgement = obj.delivery_acknowledgement
+            return get_reported_time(acknowledgement and acknowledgement.data, "delivery_time")
+
+        return get_reported_time(summary.delivery_acknowledgement_data, "delivery_time")
 
     @staticmethod
     def exceptions(obj):
@@ -91,6 +167,11 @@ class QuestionAdmin(admin.ModelAdmin):
 
         :return list(dict):
         """
+        summary = QuestionAdmin._get_event_summary(obj)
+
+        if summary is not None and summary.exception_count == 0:
+            return []
+
         return [event.data for event in obj.exceptions]
 
     @staticmethod
@@ -100,21 +181,48 @@ class QuestionAdmin(admin.ModelAdmin):
 
         :return str|None:
         """
-        return obj.latest_heartbeat.data.get("datetime") or obj.latest_heartbeat.data.get("time")
+        summary = QuestionAdmin._get_event_summary(obj)
 
-    @staticmethod
-    def log_records(obj):
-        """Show any log records produced by the child service processing the question.
+        if summary is None:
+            heartbeat = obj.latest_heartbeat
+            return get_reported_time(heartbeat and heartbeat.data, "time")
+
+        return get_reported_time(summary.latest_heartbeat_data, "time")
+
+    def log_records(self, obj):
+        """Show the latest log records produced by the child service processing the question, with a link to all of them
+        (which are streamed, as there can be too many to render in the page). The number of log records shown is set by
+        the `TWINED_ADMIN_LOG_RECORDS_PREVIEW_SIZE` setting.
 
         :return str:
         """
-        records = []
+        summary = QuestionAdmin._get_event_summary(obj)
+
+        if summary is None:
+            count = ServiceUsageEvent.objects.filter(question_id=obj.pk, message_kind="log_record").count()
+        else:
+            count = summary.log_record_count
 
-        for event in obj.log_records:
-            record = logging.makeLogRecord(event.data["log_record"])
-            records.append(log_formatter.format(record))
+        if count == 0:
+            return ""
+
+        preview_size = getattr(settings, "TWINED_ADMIN_LOG_RECORDS_PREVIEW_SIZE", DEFAULT_LOG_RECORDS_PREVIEW_SIZE)
+
+        latest_events = (
+            ServiceUsageEvent.objects.filter(question_id=obj.pk, message_kind="log_record")
+            .order_by("-publish_time", "-id")
+            .only("data", "publish_time")[:preview_size]
+        )
 
-        return "\n".join(records)
+        records = [format_log_record(event) for event in reversed(latest_events)]
+
+        return format_html(
+            '<a href="{}">Showing the last {} of {} log records - view all</a><br>{}',
+            self._get_log_records_url(obj),
+            len(records),
+            count,
+            linebreaksbr("\n".join(records)),
+        )
 
     @staticmethod
     def monitor_messages(obj):
@@ -122,31 +230,109 @@ class QuestionAdmin(admin.ModelAdmin):
 
         :return list(dict):
         """
+        summary = QuestionAdmin._get_event_summary(obj)
+
+        if summary is not None and summary.monitor_message_count == 0:
+            return []
+
         return [event.data for event in obj.monitor_messages]
 
     @staticmethod
     def result(obj):
         """Show the result produced by the child service in response to the question.
 
-        :return dict:
+        :return dict|None:
         """
-        return obj.result.data
+        summary = QuestionAdmin._get_event_summary(obj)
+
+        if summary is None:
+            result = obj.result
+            return result and result.data
+
+        if summary.result_event_id is None:
+            return None
+
+        result = ServiceUsageEvent.objects.filter(id=summary.result_event_id).only("data").first()
+        return result and result.data
+
+    def get_urls(self):
+        """Add a URL to stream all the log records of a question"""
+        urls = [
+            path(
+                "<path:object_id>/log-records/",
+                self.admin_site.admin_view(self.log_records_view),
+                name=f"{self.opts.app_label}_{self.opts.model_name}_log_records",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def log_records_view(self, request, object_id):
+        """Stream all the log records of a question as plain text, fetching them from the database in chunks.
+
+        :return django.http.StreamingHttpResponse:
+        """
+        obj = self.get_object(request, unquote(object_id))
+
+        if obj is None:
+            raise Http404(f"Question {object_id} does not exist.")
+
+        if not self.has_view_permission(request, obj):
+            raise PermissionDenied
+
+        events = (
+            ServiceUsageEvent.objects.filter(question_id=obj.pk, message_kind="log_record")
+            .order_by("publish_time", "id")
+            .only("data", "publish_time")
+            .iterator(chunk_size=LOG_RECORDS_CHUNK_SIZE)
+        )
+
+        return StreamingHttpResponse(
+            (format_log_record(event) + "\n" for event in events),
+            content_type="text/plain; charset=utf-8",
+        )
+
+    def _get_log_records_url(self, obj):
+        return reverse(
+            f"{self.admin_site.name}:{self.opts.app_label}_{self.opts.model_name}_log_records",
+            args=[obj.pk],
+        )
 
     def ask_question(self, obj):
         """Override this to ask a question using an async task queue or other method. This will ask the question directly."""
         obj.ask()
 
-    def _launch_ask_question(self, request, queryset):
-        """Handler method to ask multiple question(s)"""
+    def ask_questions(self, queryset):
+        """Override this to ask multiple questions using an async task queue or other method. By default, unasked
+        questions are asked concurrently using `ask_many()`, unless `ask_question` has been overridden in which case it's
+        called for each unasked question in turn.
+
+        :return django_twined.models.querysets.QuestionAskReport:
+        """
+        if type(self).ask_question is QuestionAdmin.ask_question:
+            return queryset.ask_many()
 
-        ask_count = 0
+        report = QuestionAskReport()
         for obj in queryset.select_subclasses():
             if obj.asked is not None:
-                self.message_user(request, f"{obj!r} already asked - you can't re-ask questions")
+                report.already_asked.add(obj.id)
             else:
                 self.ask_question(obj)
-                ask_count += 1
+                report.asked[obj.id] = None
+
+        return report
+
+    def _launch_ask_question(self, request, queryset):
+        """Handler method to ask multiple question(s)"""
+
+        report = self.ask_questions(queryset)
+
+        for question_id in report.already_asked:
+            self.message_user(request, f"Question {question_id} already asked - you can't re-ask questions")
+
+        for question_id, error in report.failed.items():
+            self.message_user(request, f"Question {question_id} could not be asked: {error}", level=messages.ERROR)
 
+        ask_count = len(report.asked)
         if ask_count == 1:
             message = "1 question was asked"
         else:
@@ -200,6 +386,7 @@ class QuestionAdmin(admin.ModelAdmin):
         context.update(
             {
                 "has_duplicate_permission": self.has_duplicate_permission(request, obj),
+                "log_records_url": obj and self._get_log_records_url(obj),
                 "show_delete": obj is not None and obj.asked is None,
                 "show_duplicate": obj is not None and self.has_duplicate_permission(request, obj),
                 "show_save": obj is None or obj.asked is None,
@@ -240,9 +427,10 @@ class ServiceUsageEventAdmin(admin.ModelAdmin):
     """Admin panel definition for Service Usage Events"""
 
     search_fields = ["id", "kind", "service_revision__name", "question__id"]
-    list_display = ("id", "kind", "publish_time", "service_revision", "question_id")
+    list_display = ("id", "kind", "message_kind", "publish_time", "service_revision", "question_id")
+    list_filter = ("message_kind",)
     date_hierarchy = "publish_time"
-    readonly_fields = ("id", "kind", "publish_time", "service_revision", "question")
+    readonly_fields = ("id", "kind", "message_kind", "publish_time", "service_revision", "question")
 
     def has_add_permission(self, *args, **kwargs):
         """Prevent anyone from editing the event stream"""
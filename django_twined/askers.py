@@ -0,0 +1,170 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from octue.resources.service_backends import get_backend
+
+logger = logging.getLogger(__name__)
+
+
+def get_service_backend(project_name):
+    """Get a backend for asking questions of services in the given project
+
+    By default this is the octue GCP Pub/Sub backend, but a different backend class (for example a local fake, to avoid
+    the need for GCP credentials in testing) can be given as a dotted path in the `TWINED_SERVICE_BACKEND` setting.
+
+    :param str project_name: the name of the project in which the services reside
+    :return octue.resources.service_backends.ServiceBackend:
+    """
+    backend_path = getattr(settings, "TWINED_SERVICE_BACKEND", None)
+
+    if backend_path is None:
+        backend_class = get_backend()
+    else:
+        backend_class = import_string(backend_path)
+
+    return backend_class(project_name=project_name)
+
+
+class AskerPool:
+    """A thread-safe, process-level pool of the octue services used to ask questions, keyed on project name and asker
+    name
+
+    Creating an asker service sets up new clients, authentication and gRPC channels, so reusing askers across questions
+    avoids paying that cost on every ask. Askers are created lazily on first use, discarded (without being closed) in
+    forked child processes, whose copies of the parent's channels are unusable, and can be closed explicitly with
+    `close()`.
+
+    Octue services aren't guaranteed to be thread-safe, so threads asking questions at the same time (e.g. the workers
+    of `Question.objects.ask_many()`) should each use their own askers (see `ThreadAskers`).
+    """
+
+    def __init__(self):
+        self._askers = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def __len__(self):
+        return len(self._askers)
+
+    def get(self, project_name, asker_name, factory):
+        """Get the asker for the given project and asker name, creating it if it doesn't exist yet
+
+        :param str project_name: the name of the project in which the services to be asked reside
+        :param str asker_name: the name of the asker
+        :param callable factory: a callable taking no arguments that creates a new asker
+        :return octue.cloud.pub_sub.service.Service:
+        """
+        key = (project_name, asker_name)
+        thread_askers = getattr(self._local, "askers", None)
+
+        if thread_askers is not None:
+            if key not in thread_askers:
+                logger.debug("Creating thread asker %r for project %r", asker_name, project_name)
+                thread_askers[key] = factory()
+
+            return thread_askers[key]
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._askers = {}
+                self._pid = os.getpid()
+
+            asker = self._askers.get(key)
+
+            if asker is None:
+                logger.debug("Creating asker %r for project %r", asker_name, project_name)
+                asker = factory()
+                self._askers[key] = asker
+
+        return asker
+
+    def close(self):
+        """Close and remove all askers in the pool
+
+        :return None:
+        """
+        with self._lock:
+            askers, self._askers = self._askers, {}
+
+        for asker in askers.values():
+            _close_asker(asker)
+
+    def reset(self):
+        """Remove all askers from the pool without closing them (used in forked child processes, which must not close
+        their parent's clients)
+
+        :return None:
+        """
+        self._askers = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+
+class ThreadAskers:
+    """Askers private to each of a group of threads, closed together once the threads are finished with. Use
+    `initialize_thread` as the initializer of a thread pool, so that askers got from the asker pool by its threads
+    aren't shared with other threads.
+
+    :param AskerPool pool: the asker pool to get askers from
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._askers = []
+        self._lock = threading.Lock()
+
+    def initialize_thread(self):
+        """Give the current thread its own askers
+
+        :return None:
+        """
+        askers = {}
+        self.pool._local.askers = askers
+
+        with self._lock:
+            self._askers.append(askers)
+
+    def close(self):
+        """Close the askers created by the threads
+
+        :return None:
+        """
+        with self._lock:
+            askers, self._askers = self._askers, []
+
+        for thread_askers in askers:
+            for asker in thread_askers.values():
+                _close_asker(asker)
+
+
+def _close_asker(asker):
+    """Close the clients held by an asker, if it has created any"""
+    if hasattr(asker, "close"):
+        asker.close()
+        return
+
+    # The octue service creates its publisher lazily, so only stop it if it exists
+    publisher = vars(asker).get("publisher")
+
+    if publisher is None:
+        return
+
+    try:
+        publisher.stop()
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("Failed to close publisher for asker %r", asker, exc_info=True)
+
+
+asker_pool = AskerPool()
+
+atexit.register(asker_pool.close)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=asker_pool.reset)
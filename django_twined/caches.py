@@ -0,0 +1,205 @@
+import copy
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TTL_SECONDS = 60
+
+# Cached lookups of missing revisions are stored as this, to distinguish them from cache misses
+_NOT_FOUND = "django_twined.caches.NOT_FOUND"
+
+
+class ServiceRevisionCache:
+    """A cache of service revision lookups, keyed on namespace, name and tag (or None, for the default revision)
+
+    By default the cache is held in the memory of the current process. If `cache_alias` is given, the django cache
+    with that alias (e.g. a shared redis cache) is used instead, so that revisions are cached across processes.
+
+    Entries for a service are invalidated whenever a revision of that service is saved or deleted, and expire after
+    `ttl_seconds` regardless, to bound the staleness caused by changes that don't send signals (like queryset updates)
+    or are made by other processes.
+
+    :param float|None ttl_seconds: the maximum time for which a lookup is cached; if None, entries never expire
+    :param str|None cache_alias: the alias of a django cache to use, rather than an in-process cache
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, cache_alias=None):
+        self.ttl_seconds = ttl_seconds
+        self.cache_alias = cache_alias
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """A dict of the numbers of cache hits and misses, for monitoring"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def get(self, namespace, name, tag, load):
+        """Get a service revision from the cache, loading and caching it if it's not present
+
+        :param str namespace: the namespace of the service
+        :param str name: the name of the service
+        :param str|None tag: the revision tag, or None for the default revision
+        :param callable load: a callable taking no arguments that loads the revision from the database, returning None if it doesn't exist
+        :return django_twined.models.ServiceRevision|None:
+        """
+        value = self._get(namespace, name, tag)
+
+        if value is None:
+            self._count("misses")
+            revision = load()
+            self._set(namespace, name, tag, _NOT_FOUND if revision is None else revision)
+            return revision
+
+        self._count("hits")
+
+        if value == _NOT_FOUND:
+            return None
+
+        # Give each caller its own instance, so changes made to it by one caller don't leak into the cache
+        return copy.copy(value)
+
+    def invalidate(self, namespace, name):
+        """Remove all cached revisions of a service. If called within a transaction, they're removed again once the
+        transaction is committed, so revisions loaded while the transaction was open aren't left in the cache.
+
+        :param str namespace: the namespace of the service
+        :param str name: the name of the service
+        :return None:
+        """
+        self._invalidate(namespace, name)
+        transaction.on_commit(lambda: self._invalidate(namespace, name))
+
+    def clear(self):
+        """Remove all revisions from the in-process cache, and reset the hit and miss counters
+
+        :return None:
+        """
+        with self._lock:
+            self._entries = {}
+            self.hits = 0
+            self.misses = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _get(self, namespace, name, tag):
+        if self.cache_alias is not None:
+            cache = caches[self.cache_alias]
+            return cache.get(self._shared_key(cache, namespace, name, tag))
+
+        with self._lock:
+            expiry, value = self._entries.get((namespace, name), {}).get(tag, (None, None))
+
+        if expiry is not None and expiry < time.monotonic():
+            return None
+
+        return value
+
+    def _set(self, namespace, name, tag, value):
+        if self.cache_alias is not None:
+            cache = caches[self.cache_alias]
+            cache.set(self._shared_key(cache, namespace, name, tag), value, timeout=self.ttl_seconds)
+            return
+
+        expiry = None if self.ttl_seconds is None else time.monotonic() + self.ttl_seconds
+
+        with self._lock:
+            self._entries.setdefault((namespace, name), {})[tag] = (expiry, value)
+
+    def _invalidate(self, namespace, name):
+        if self.cache_alias is not None:
+            # Entries can't be enumerated in a django cache, so bump the generation included in the service's keys
+            cache = caches[self.cache_alias]
+            generation_key = self._generation_key(namespace, name)
+            if not cache.add(generation_key, 1, timeout=None):
+                cache.incr(generation_key)
+            return
+
+        with self._lock:
+            self._entries.pop((namespace, name), None)
+
+    @staticmethod
+    def _generation_key(namespace, name):
+        return f"django_twined:service_revision:{namespace}:{name}:generation"
+
+    def _shared_key(self, cache, namespace, name, tag):
+        generation = cache.get(self._generation_key(namespace, name), 0)
+        return f"django_twined:service_revision:{namespace}:{name}:{generation}:{'' if tag is None else tag}"
+
+
+_service_revision_cache = None
+_service_revision_cache_lock = threading.Lock()
+
+
+def get_service_revision_cache():
+    """Get the process-wide service revision cache
+
+    Caching is opt-in, using the `TWINED_SERVICE_REVISION_CACHE` setting (a dict of keyword arguments to
+    `ServiceRevisionCache`, e.g. `{"ttl_seconds": 60}`).
+
+    :return ServiceRevisionCache|None: the cache, or None if caching is disabled
+    """
+    global _service_revision_cache  # pylint: disable=global-statement
+
+    options = getattr(settings, "TWINED_SERVICE_REVISION_CACHE", None)
+
+    if not options:
+        return None
+
+    with _service_revision_cache_lock:
+        if _service_revision_cache is None:
+            _service_revision_cache = ServiceRevisionCache(**options)
+
+    return _service_revision_cache
+
+
+def reset_service_revision_cache():
+    """Remove the process-wide service revision cache, so that it's recreated from settings on next use
+
+    :return None:
+    """
+    global _service_revision_cache  # pylint: disable=global-statement
+
+    with _service_revision_cache_lock:
+        _service_revision_cache = None
+
+
+def get_cached_service_revision(namespace, name, tag, load):
+    """Get a service revision through the process-wide cache, if caching is enabled, otherwise load it directly
+
+    :param str namespace: the namespace of the service
+    :param str name: the name of the service
+    :param str|None tag: the revision tag, or None for the default revision
+    :param callable load: a callable taking no arguments that loads the revision from the database, returning None if it doesn't exist
+    :return django_twined.models.ServiceRevision|None:
+    """
+    cache = get_service_revision_cache()
+
+    if cache is None:
+        return load()
+
+    return cache.get(namespace, name, tag, load)
+
+
+def invalidate_cached_service_revisions(namespace, name):
+    """Remove all cached revisions of a service from the process-wide cache, if caching is enabled
+
+    :param str namespace: the namespace of the service
+    :param str name: the name of the service
+    :return None:
+    """
+    cache = get_service_revision_cache()
+
+    if cache is not None:
+        cache.invalidate(namespace, name)
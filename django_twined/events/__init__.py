@@ -0,0 +1,29 @@
+from .buffers import ServiceUsageEventBuffer, get_event_buffer, reset_event_buffer
+from .queues import AsyncServiceUsageEventQueue, get_async_event_queue, reset_async_event_queue
+from .sinks import (
+    DatabaseSink,
+    JSONLSegmentSink,
+    KindsFilterSink,
+    ServiceUsageEventSink,
+    get_event_sink,
+    reset_event_sink,
+)
+from .storage import send_service_usage_event_signal, store_service_usage_event_batch, store_service_usage_events
+
+__all__ = (
+    "AsyncServiceUsageEventQueue",
+    "DatabaseSink",
+    "get_async_event_queue",
+    "get_event_buffer",
+    "get_event_sink",
+    "JSONLSegmentSink",
+    "KindsFilterSink",
+    "reset_async_event_queue",
+    "reset_event_buffer",
+    "reset_event_sink",
+    "send_service_usage_event_signal",
+    "ServiceUsageEventBuffer",
+    "ServiceUsageEventSink",
+    "store_service_usage_event_batch",
+    "store_service_usage_events",
+)
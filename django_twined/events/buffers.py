@@ -0,0 +1,163 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from .storage import store_service_usage_event_batch
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_SIZE = 500
+DEFAULT_MAX_AGE_SECONDS = 1.0
+
+
+class ServiceUsageEventBuffer:
+    """An in-process buffer of unsaved service usage events, flushed to the database with a single `bulk_create`
+
+    The buffer is flushed when it holds `max_size` events, when the oldest event in it is `max_age_seconds` old, when
+    `flush()` is called explicitly (for example on receipt of a `result` event) and when the process exits.
+
+    Events are acknowledged to Pub/Sub before they're written, so any events in the buffer are lost if the process is
+    killed without the chance to exit cleanly. Only use buffered ingestion where that's acceptable (e.g. for heartbeats,
+    log records and monitor messages from chatty services).
+
+    :param int max_size: the number of events to accumulate before flushing
+    :param float|None max_age_seconds: the maximum time an event can wait in the buffer; if None, events are only flushed by size or explicitly
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.max_size = max_size
+        self.max_age_seconds = max_age_seconds
+        self._events = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, event, flush=False):
+        """Add an unsaved event to the buffer, flushing the buffer if it's full
+
+        :param django_twined.models.ServiceUsageEvent event: the unsaved event to add
+        :param bool flush: if True, flush the buffer (including this event) immediately
+        :return None:
+        """
+        with self._lock:
+            self._events.append(event)
+            flush = flush or len(self._events) >= self.max_size
+
+            if not flush and self._timer is None and self.max_age_seconds is not None:
+                self._timer = threading.Timer(self.max_age_seconds, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered events to the database and send their signals
+
+        :return list(django_twined.models.ServiceUsageEvent): the events that were flushed
+        """
+        with self._lock:
+            events, self._events = self._events, []
+
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not events:
+            return events
+
+        logger.debug("Flushing %s buffered ServiceUsageEvents", len(events))
+        return store_service_usage_event_batch(events)
+
+    def clear(self):
+        """Discard all buffered events without writing them
+
+        :return None:
+        """
+        with self._lock:
+            self._events = []
+
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to flush buffered ServiceUsageEvents")
+        finally:
+            # The timer thread has its own database connection, which would otherwise be left open
+            connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_event_buffer():
+    """Get the process-wide service usage event buffer
+
+    Buffered ingestion is opt-in, using the `TWINED_EVENT_BUFFER` setting (a dict of keyword arguments to
+    `ServiceUsageEventBuffer`, e.g. `{"max_size": 500, "max_age_seconds": 1.0}`).
+
+    :return ServiceUsageEventBuffer|None: the buffer, or None if buffered ingestion is disabled
+    """
+    global _buffer  # pylint: disable=global-statement
+
+    options = getattr(settings, "TWINED_EVENT_BUFFER", None)
+
+    if not options:
+        return None
+
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ServiceUsageEventBuffer(**options)
+            atexit.register(_buffer.flush)
+
+    return _buffer
+
+
+def reset_event_buffer(flush=True):
+    """Flush (or discard) and remove the process-wide service usage event buffer, so that it's recreated from settings
+    on next use
+
+    :param bool flush: if True, write any buffered events to the database before removing the buffer
+    :return None:
+    """
+    global _buffer  # pylint: disable=global-statement
+
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+
+    if buffer is None:
+        return
+
+    atexit.unregister(buffer.flush)
+
+    if flush:
+        buffer.flush()
+    else:
+        buffer.clear()
+
+
+def _forget_event_buffer_in_child():
+    """Forked children must not write (or double-write) events buffered by their parent"""
+    global _buffer, _buffer_lock  # pylint: disable=global-statement
+
+    if _buffer is not None:
+        atexit.unregister(_buffer.flush)
+
+    _buffer = None
+    _buffer_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_event_buffer_in_child)
@@ -0,0 +1,297 @@
+from datetime import datetime, timezone
+import logging
+import re
+
+from django.db import NotSupportedError, connection, transaction
+
+from django_twined.models import ServiceUsageEvent
+
+from .retention import get_event_retention, get_retention_cutoff
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MONTHS_AHEAD = 3
+
+PARTITION_UPPER_BOUND_PATTERN = re.compile(r"TO \('([^']+)'\)")
+
+
+def _get_table_name():
+    return ServiceUsageEvent._meta.db_table
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _check_postgresql():
+    if connection.vendor != "postgresql":
+        raise NotSupportedError("Partitioning service usage events is only supported on PostgreSQL.")
+
+
+def get_month_start(moment, months_ahead=0):
+    """Get the start of the month (in UTC) a number of months after the month containing the given time.
+
+    :param datetime.datetime moment:
+    :param int months_ahead:
+    :return datetime.datetime:
+    """
+    moment = moment.astimezone(timezone.utc)
+    month_index = moment.year * 12 + moment.month - 1 + months_ahead
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def get_partition_name(month_start):
+    """Get the name of the partition holding service usage events published in the month starting at the given time.
+
+    :param datetime.datetime month_start:
+    :return str:
+    """
+    return f"{_get_table_name()}_p{month_start.year:04d}_{month_start.month:02d}"
+
+
+def is_partitioned():
+    """Check whether the service usage events table is partitioned.
+
+    :return bool:
+    """
+    if connection.vendor != "postgresql":
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", [_get_table_name()]
+        )
+        return cursor.fetchone()[0]
+
+
+def get_partitions():
+    """Get the partitions of the service usage events table, with the (exclusive) upper bound of the publish times each
+    holds.
+
+    :return list(tuple(str, datetime.datetime|None)): the name and upper bound of each partition (the upper bound is None for the default partition)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            ORDER BY child.relname
+            """,
+            [_get_table_name()],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+
+    for name, bound in rows:
+        match = PARTITION_UPPER_BOUND_PATTERN.search(bound)
+        partitions.append((name, datetime.fromisoformat(match.group(1)) if match else None))
+
+    return partitions
+
+
+def convert_to_partitioned_table():
+    """Convert the service usage events table to a table partitioned by month of publish time. The existing table is kept
+    as the partition holding all events published before next month, so its rows aren't rewritten, and a default
+    partition is added for events published after the last monthly partition. The table is locked while it's converted.
+
+    As PostgreSQL requires the partition key to be part of the primary key (and any unique constraints), the primary key
+    becomes `(id, publish_time)`.
+    Ids are still unique, as they're generated from the same sequence.
+
+    :raise django.db.NotSupportedError: if the database isn't PostgreSQL, or other tables have foreign key constraints on the events table
+    :return None:
+    """
+    _check_postgresql()
+    table = _get_table_name()
+    legacy_table = f"{table}_legacy"
+    upper_bound = get_month_start(datetime.now(timezone.utc), months_ahead=1)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT conname FROM pg_constraint WHERE contype = 'f' AND confrelid = %s::regclass", [table])
+        referencing_constraints = [row[0] for row in cursor.fetchall()]
+
+        if referencing_constraints:
+            raise NotSupportedError(
+                f"The service usage events table can't be partitioned while these foreign key constraints reference it: "
+                f"{', '.join(referencing_constraints)}."
+            )
+
+        cursor.execute(
+            """
+            SELECT index_class.relname, pg_get_indexdef(index_class.oid)
+            FROM pg_index JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = %s::regclass
+            AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE pg_constraint.conindid = pg_index.indexrelid)
+            """,
+            [table],
+        )
+        indexes = cursor.fetchall()
+
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'u' AND conrelid = %s::regclass",
+            [table],
+        )
+        unique_constraints = cursor.fetchall()
+
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'f' AND conrelid = %s::regclass",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute("SELECT conname FROM pg_constraint WHERE contype = 'p' AND conrelid = %s::regclass", [table])
+        primary_key = cursor.fetchone()[0]
+
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+        # The existing indexes (and unique constraints) are renamed so the partitioned table's can take their names, then
+        # PostgreSQL attaches them to the partitioned table's when the old table is attached as a partition
+        cursor.execute(f"LOCK TABLE {_quote(table)} IN ACCESS EXCLUSIVE MODE")
+
+        # Tables can't be altered with deferred foreign key checks pending (from events inserted in this transaction)
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"ALTER TABLE {_quote(table)} RENAME TO {_quote(legacy_table)}")
+
+        for index_name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {_quote(index_name)} RENAME TO {_quote(f'{index_name[:55]}_legacy')}")
+
+        for constraint_name, _ in unique_constraints:
+            cursor.execute(
+                f"ALTER TABLE {_quote(legacy_table)} RENAME CONSTRAINT {_quote(constraint_name)} "
+                f"TO {_quote(f'{constraint_name[:55]}_legacy')}"
+            )
+
+        cursor.execute(
+            f"CREATE TABLE {_quote(table)} (LIKE {_quote(legacy_table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+            f"INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE (publish_time)"
+        )
+
+        # The old table's primary key must match the partitioned table's for it to be attached as a partition
+        cursor.execute(f"ALTER TABLE {_quote(legacy_table)} DROP CONSTRAINT {_quote(primary_key)}")
+        cursor.execute(
+            f"ALTER TABLE {_quote(legacy_table)} ADD CONSTRAINT {_quote(f'{legacy_table}_pkey')} "
+            f"PRIMARY KEY (id, publish_time)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(primary_key)} PRIMARY KEY (id, publish_time)"
+        )
+
+        # The partitioned table takes over generating ids (an identity column's sequence belongs to its table, so the id
+        # column becomes a serial column, continuing from the identity's sequence)
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [legacy_table]
+        )
+
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT nextval(%s)", [sequence])
+            next_id = cursor.fetchone()[0]
+            cursor.execute(f"ALTER TABLE {_quote(legacy_table)} ALTER COLUMN id DROP IDENTITY")
+            sequence = f"{table}_id_seq"
+            cursor.execute(f"CREATE SEQUENCE {_quote(sequence)} AS bigint OWNED BY {_quote(table)}.id")
+            cursor.execute("SELECT setval(%s, %s, false)", [sequence, next_id])
+        else:
+            cursor.execute(f"ALTER TABLE {_quote(legacy_table)} ALTER COLUMN id DROP DEFAULT")
+            cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {_quote(table)}.id")
+
+        cursor.execute(f"ALTER TABLE {_quote(table)} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)", [sequence])
+
+        for _, index_definition in indexes:
+            cursor.execute(index_definition)
+
+        for constraint_name, constraint_definition in unique_constraints + foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(constraint_name)} {constraint_definition}"
+            )
+
+        cursor.execute(
+            f"ALTER TABLE {_quote(table)} ATTACH PARTITION {_quote(legacy_table)} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{upper_bound.isoformat()}')"
+        )
+        cursor.execute(f"CREATE TABLE {_quote(f'{table}_default')} PARTITION OF {_quote(table)} DEFAULT")
+
+    logger.info("Partitioned %s by month of publish time", table)
+
+
+def create_partitions(months_ahead=DEFAULT_MONTHS_AHEAD, now=None):
+    """Create the monthly partitions of the service usage events table for this month and the given number of months
+    ahead, if they don't already exist.
+
+    :param int months_ahead: the number of months after this month to create partitions for
+    :param datetime.datetime|None now: the time to create partitions from (defaults to the current time)
+    :return list(str): the names of the partitions created
+    """
+    _check_postgresql()
+    now = now or datetime.now(timezone.utc)
+    table = _get_table_name()
+    partitions = dict(get_partitions())
+    legacy_upper_bound = partitions.get(f"{table}_legacy")
+    created = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for months in range(months_ahead + 1):
+            start = get_month_start(now, months_ahead=months)
+            end = get_month_start(now, months_ahead=months + 1)
+            name = get_partition_name(start)
+
+            # Events published before the conversion month ends are held by the partition the table was converted from
+            if name in partitions or (legacy_upper_bound is not None and start < legacy_upper_bound):
+                continue
+
+            cursor.execute(
+                f"CREATE TABLE {_quote(name)} PARTITION OF {_quote(table)} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+            created.append(name)
+            logger.info("Created partition %s", name)
+
+    return created
+
+
+def drop_expired_partitions(retention=None, now=None, detach_only=False):
+    """Drop the partitions of the service usage events table that only hold events that have been kept for longer than
+    the retention periods of their message kinds (see `TWINED_EVENT_RETENTION`). This is much cheaper than deleting the
+    events, but partitions holding events that are still retained (e.g. results kept indefinitely) aren't dropped.
+
+    :param dict|None retention: the retention periods (defaults to the `TWINED_EVENT_RETENTION` setting)
+    :param datetime.datetime|None now: the time to calculate retention cutoffs from (defaults to the current time)
+    :param bool detach_only: if True, detach the partitions from the events table (e.g. to archive them) without dropping them
+    :return list(str): the names of the partitions dropped (or detached)
+    """
+    _check_postgresql()
+    retention = get_event_retention() if retention is None else retention
+    now = now or datetime.now(timezone.utc)
+    table = _get_table_name()
+
+    finite_cutoffs = [cutoff for cutoff in (get_retention_cutoff(kind, retention, now) for kind in retention) if cutoff]
+
+    if not finite_cutoffs:
+        return []
+
+    dropped = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, upper_bound in get_partitions():
+            if upper_bound is None or upper_bound > max(finite_cutoffs):
+                continue
+
+            cursor.execute(f"SELECT DISTINCT message_kind FROM {_quote(name)}")
+            kinds = [row[0] for row in cursor.fetchall()]
+
+            cutoffs = [get_retention_cutoff(kind, retention, now) for kind in kinds]
+
+            if any(cutoff is None or upper_bound > cutoff for cutoff in cutoffs):
+                continue
+
+            cursor.execute(f"ALTER TABLE {_quote(table)} DETACH PARTITION {_quote(name)}")
+
+            if not detach_only:
+                cursor.execute(f"DROP TABLE {_quote(name)}")
+
+            dropped.append(name)
+            logger.info("%s partition %s", "Detached" if detach_only else "Dropped", name)
+
+    return dropped
@@ -0,0 +1,194 @@
+import asyncio
+import contextlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .buffers import DEFAULT_MAX_AGE_SECONDS, DEFAULT_MAX_SIZE
+from .sinks import get_event_sink
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_PENDING = 10000
+
+# Put on the queue to end the batch being collected, so that `flush()` doesn't wait for the batch to fill or age
+_FLUSH = object()
+
+
+class AsyncServiceUsageEventQueue:
+    """An asyncio queue of unsaved service usage events, consumed by a background task on the same event loop, which
+    writes the events to the event sink (see `TWINED_EVENT_SINK`) in batches, in a thread (using `sync_to_async`)
+
+    A batch is written when it holds `max_size` events, when its oldest event is `max_age_seconds` old, when it holds a
+    `result` event, or when `flush()` is called. Like buffered ingestion, events are acknowledged to Pub/Sub before
+    they're written, so any events in the queue are lost if the process is killed, or if it exits without `close()`
+    being awaited (e.g. on ASGI lifespan shutdown, which django doesn't handle itself).
+
+    The queue must only be used from the event loop it was made in. If the consumer stops (e.g. because its task is
+    cancelled), it's restarted when the next event is put on the queue.
+
+    :param int max_size: the maximum number of events written at once
+    :param float|None max_age_seconds: the maximum time an event can wait for its batch to fill; if None, batches are only written when full, on receipt of a result, or explicitly
+    :param int|None max_pending: the maximum number of events waiting to be written, beyond which `put()` fails; if None, the queue is unbounded
+    """
+
+    def __init__(
+        self, max_size=DEFAULT_MAX_SIZE, max_age_seconds=DEFAULT_MAX_AGE_SECONDS, max_pending=DEFAULT_MAX_PENDING
+    ):
+        self.max_size = max_size
+        self.max_age_seconds = max_age_seconds
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=max_pending or 0)
+        self._received = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def put(self, event):
+        """Add an unsaved event to the queue without waiting for it to be written, starting the consumer if needed
+
+        :param django_twined.models.ServiceUsageEvent event: the unsaved event to add
+        :raise asyncio.QueueFull: if `max_pending` events are already waiting to be written
+        :return None:
+        """
+        self._queue.put_nowait(event)
+        self._received.set()
+        self._start_consumer()
+
+    async def flush(self):
+        """Wait until all events put on the queue have been written
+
+        :return None:
+        """
+        if self._task is None:
+            return
+
+        self._start_consumer()
+        await self._queue.put(_FLUSH)
+        self._received.set()
+        await self._queue.join()
+
+    async def close(self):
+        """Write all queued events, then stop the consumer
+
+        :return None:
+        """
+        await self.flush()
+
+        if self._task is not None:
+            self._task.cancel()
+
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+            self._task = None
+
+    def _start_consumer(self):
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._consume())
+            self._task.add_done_callback(self._log_stopped_consumer)
+
+    def _log_stopped_consumer(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                "The consumer of queued ServiceUsageEvents stopped, and will be restarted when an event is next queued",
+                exc_info=task.exception(),
+            )
+
+    async def _consume(self):
+        while True:
+            # Items taken from the queue are marked done even if the consumer stops part way through a batch, so that
+            # `flush()` can't wait forever for them
+            items = []
+
+            try:
+                await self._get_batch(items)
+                events = [item for item in items if item is not _FLUSH]
+
+                if events:
+                    logger.debug("Writing %s queued ServiceUsageEvents", len(events))
+
+                    try:
+                        await sync_to_async(_write_events)(events)
+                    except Exception:  # pylint: disable=broad-except
+                        logger.exception("Failed to write %s queued ServiceUsageEvents", len(events))
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    async def _get_batch(self, items):
+        items.append(await self._queue.get())
+        deadline = None if self.max_age_seconds is None else self.loop.time() + self.max_age_seconds
+
+        while not self._is_batch_complete(items):
+            try:
+                items.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = None if deadline is None else deadline - self.loop.time()
+
+            if timeout is not None and timeout <= 0:
+                break
+
+            # Waiting on an event (rather than the queue) means no item can be lost when the wait times out
+            self._received.clear()
+
+            try:
+                await asyncio.wait_for(self._received.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+
+    def _is_batch_complete(self, items):
+        last = items[-1]
+        return last is _FLUSH or len(items) >= self.max_size or last.message_kind == "result"
+
+
+def _write_events(events):
+    """Write events to the event sink, replacing the database connections of the consumer's thread if they've failed or
+    expired (see `CONN_MAX_AGE`), as django does for each request, so that a lost connection doesn't fail every batch
+    written after it
+    """
+    close_old_connections()
+
+    try:
+        get_event_sink().write_many(events)
+    finally:
+        close_old_connections()
+
+
+_queue = None
+
+
+def get_async_event_queue():
+    """Get the process-wide async service usage event queue for the running event loop, made with the keyword arguments
+    to `AsyncServiceUsageEventQueue` in the `TWINED_ASYNC_EVENT_QUEUE` setting (e.g. `{"max_size": 500}`)
+
+    :return AsyncServiceUsageEventQueue:
+    """
+    global _queue  # pylint: disable=global-statement
+
+    loop = asyncio.get_running_loop()
+
+    if _queue is None or _queue.loop is not loop:
+        if _queue is not None and len(_queue):
+            logger.warning("Discarding %s ServiceUsageEvents queued on a previous event loop", len(_queue))
+
+        _queue = AsyncServiceUsageEventQueue(**(getattr(settings, "TWINED_ASYNC_EVENT_QUEUE", None) or {}))
+
+    return _queue
+
+
+def reset_async_event_queue():
+    """Remove the process-wide async service usage event queue, so that it's recreated from settings on next use. Events
+    already in the queue are still written, as long as its event loop keeps running.
+
+    :return None:
+    """
+    global _queue  # pylint: disable=global-statement
+    _queue = None
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+import logging
+
+from django.conf import settings
+
+from django_twined.models import ServiceUsageEvent
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_RETENTION_BATCH_SIZE = 5000
+
+# The key of the retention setting applying to events of any kind not given their own retention period
+OTHER_KINDS = "*"
+
+
+def get_event_retention():
+    """Get the retention periods of service usage events from the `TWINED_EVENT_RETENTION` setting. This is a dict
+    mapping message kinds (e.g. "heartbeat") to the number of days events of that kind are kept for, or to None if they
+    are kept indefinitely. The "*" key sets the retention of events of all other kinds; by default, they're kept
+    indefinitely.
+
+    :return dict:
+    """
+    return getattr(settings, "TWINED_EVENT_RETENTION", None) or {}
+
+
+def get_retention_cutoff(kind, retention=None, now=None):
+    """Get the publish time before which events of the given message kind have expired.
+
+    :param str|None kind: the message kind
+    :param dict|None retention: the retention periods (defaults to the `TWINED_EVENT_RETENTION` setting)
+    :param datetime.datetime|None now: the time to calculate the cutoff from (defaults to the current time)
+    :return datetime.datetime|None: the cutoff, or None if events of the kind are kept indefinitely
+    """
+    retention = get_event_retention() if retention is None else retention
+    days = retention[kind] if kind in retention else retention.get(OTHER_KINDS)
+
+    if days is None:
+        return None
+
+    return (now or datetime.now(timezone.utc)) - timedelta(days=days)
+
+
+def delete_expired_events(retention=None, now=None, batch_size=None):
+    """Delete service usage events that have been kept for longer than the retention period of their message kind, in
+    batches so that each delete is short.
+
+    :param dict|None retention: the retention periods (defaults to the `TWINED_EVENT_RETENTION` setting)
+    :param datetime.datetime|None now: the time to calculate retention cutoffs from (defaults to the current time)
+    :param int|None batch_size: the number of events deleted at a time (defaults to 5000)
+    :return dict: the number of events deleted, keyed on the message kinds in the retention periods
+    """
+    retention = get_event_retention() if retention is None else retention
+    now = now or datetime.now(timezone.utc)
+    batch_size = batch_size or DEFAULT_RETENTION_BATCH_SIZE
+    deleted = {}
+
+    for kind in retention:
+        cutoff = get_retention_cutoff(kind, retention, now)
+
+        if cutoff is None:
+            continue
+
+        expired = ServiceUsageEvent.objects.filter(publish_time__lt=cutoff)
+
+        if kind == OTHER_KINDS:
+            expired = expired.exclude(message_kind__in=[other for other in retention if other != OTHER_KINDS])
+        else:
+            expired = expired.filter(message_kind=kind)
+
+        deleted[kind] = 0
+
+        while True:
+            ids = list(expired.values_list("id", flat=True)[:batch_size])
+
+            if not ids:
+                break
+
+            # Filtering on the publish time too lets a partitioned table only scan partitions that can hold the events
+            count, _ = ServiceUsageEvent.objects.filter(id__in=ids, publish_time__lt=cutoff).delete()
+            deleted[kind] += count
+
+        logger.info("Deleted %d %r events published before %s", deleted[kind], kind, cutoff)
+
+    return deleted
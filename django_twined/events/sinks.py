@@ -0,0 +1,227 @@
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from .buffers import get_event_buffer
+from .storage import send_service_usage_event_signal, store_service_usage_event_batch, store_service_usage_events
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+class ServiceUsageEventSink:
+    """Base class for destinations of received service usage events. Subclass this and set the `TWINED_EVENT_SINK`
+    setting to write events somewhere other than the database.
+    """
+
+    def write(self, event):
+        """Write an unsaved service usage event to the sink
+
+        :param django_twined.models.ServiceUsageEvent event:
+        :return None:
+        """
+        raise NotImplementedError("Subclasses of ServiceUsageEventSink must implement write()")
+
+    def write_many(self, events):
+        """Write a batch of unsaved service usage events (e.g. from the async event queue) to the sink. By default, the
+        events are written one at a time; override this if the sink can write them more efficiently together.
+
+        :param list(django_twined.models.ServiceUsageEvent) events:
+        :return None:
+        """
+        for event in events:
+            self.write(event)
+
+    def close(self):
+        """Write any events held by the sink and release its resources
+
+        :return None:
+        """
+
+
+class DatabaseSink(ServiceUsageEventSink):
+    """Store events in the `ServiceUsageEvent` table (the default sink), through the event buffer if buffered ingestion
+    is enabled (see `TWINED_EVENT_BUFFER`)
+    """
+
+    def write(self, event):
+        buffer = get_event_buffer()
+
+        if buffer is None:
+            store_service_usage_events([event])
+        else:
+            # Results complete a question, so write them (and anything buffered before them) straight away
+            buffer.add(event, flush=event.message_kind == "result")
+
+    def write_many(self, events):
+        # The events are already batched, so are stored together rather than through the event buffer
+        store_service_usage_event_batch(events)
+
+
+class JSONLSegmentSink(ServiceUsageEventSink):
+    """Append events as JSON lines to local segment files, starting a new segment once the current one reaches a size.
+    Segments are named with the process id and the time they were started, so that processes never share a segment,
+    and can be archived (e.g. to a bucket, for loading into a data warehouse) once they've been rolled over.
+
+    The events aren't saved to the database, so the signals sent for them carry unsaved events (with no id).
+
+    :param str directory: the directory to write segments to (created if it doesn't exist)
+    :param int max_segment_bytes: the size at which a segment is closed and a new one started
+    :param str prefix: the prefix of the segment filenames
+    """
+
+    def __init__(self, directory, max_segment_bytes=DEFAULT_MAX_SEGMENT_BYTES, prefix="service-usage-events"):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.prefix = prefix
+        self._file = None
+        self._segment_number = 0
+        self._lock = threading.Lock()
+
+    @property
+    def segment_path(self):
+        """The path of the segment currently being written to, or None if no segment is open"""
+        return None if self._file is None else self._file.name
+
+    def write(self, event):
+        record = {
+            "kind": event.kind,
+            "message_kind": event.message_kind,
+            "message_id": event.message_id,
+            "publish_time": event.publish_time,
+            "question_id": event.question_id,
+            "service_revision_id": event.service_revision_id,
+            "data": event.data,
+        }
+        line = json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+
+            self._file.write(line)
+            self._file.flush()
+
+            if self._file.tell() >= self.max_segment_bytes:
+                self._close_segment()
+
+        send_service_usage_event_signal(event)
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._segment_number += 1
+        started = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        filename = f"{self.prefix}-{os.getpid()}-{started}-{self._segment_number:06d}.jsonl"
+        self._file = open(os.path.join(self.directory, filename), "a", encoding="utf-8")
+        logger.debug("Started service usage event segment %s", self._file.name)
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            logger.debug("Closed service usage event segment %s", self._file.name)
+            self._file = None
+
+
+class KindsFilterSink(ServiceUsageEventSink):
+    """Route events of some message kinds (e.g. heartbeats and log records) to one sink, and all other events (e.g.
+    results, which questions depend on) to another
+
+    :param iter(str) kinds: the message kinds of the events to route to `sink`
+    :param dict sink: the sink for events of the given kinds, as a dict like the `TWINED_EVENT_SINK` setting
+    :param dict|None default: the sink for events of other kinds (by default, the database)
+    """
+
+    def __init__(self, kinds, sink, default=None):
+        self.kinds = set(kinds)
+        self.sink = make_event_sink(sink)
+        self.default = make_event_sink(default)
+
+    def write(self, event):
+        if event.message_kind in self.kinds:
+            self.sink.write(event)
+        else:
+            self.default.write(event)
+
+    def write_many(self, events):
+        routed = [event for event in events if event.message_kind in self.kinds]
+        others = [event for event in events if event.message_kind not in self.kinds]
+
+        if routed:
+            self.sink.write_many(routed)
+
+        if others:
+            self.default.write_many(others)
+
+    def close(self):
+        self.sink.close()
+        self.default.close()
+
+
+def make_event_sink(options=None):
+    """Make an event sink from options giving the import path of its class and the keyword arguments to make it with,
+    e.g. `{"class": "django_twined.events.sinks.JSONLSegmentSink", "directory": "events"}`
+
+    :param dict|None options: the sink options (if None, a `DatabaseSink` is made)
+    :return ServiceUsageEventSink:
+    """
+    if not options:
+        return DatabaseSink()
+
+    options = dict(options)
+    return import_string(options.pop("class"))(**options)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_event_sink():
+    """Get the process-wide sink that received service usage events are written to, as set by the `TWINED_EVENT_SINK`
+    setting (by default, the database)
+
+    :return ServiceUsageEventSink:
+    """
+    global _sink  # pylint: disable=global-statement
+
+    with _sink_lock:
+        if _sink is None:
+            _sink = make_event_sink(getattr(settings, "TWINED_EVENT_SINK", None))
+
+    return _sink
+
+
+def reset_event_sink():
+    """Close and remove the process-wide event sink, so that it's recreated from settings on next use
+
+    :return None:
+    """
+    global _sink  # pylint: disable=global-statement
+
+    with _sink_lock:
+        sink, _sink = _sink, None
+
+    if sink is not None:
+        sink.close()
+
+
+def _forget_event_sink_in_child():
+    """Forked children must make their own sink, rather than writing to files opened by their parent"""
+    global _sink, _sink_lock  # pylint: disable=global-statement
+    _sink = None
+    _sink_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_event_sink_in_child)
@@ -0,0 +1,183 @@
+import logging
+
+from django.db import transaction
+from django.db.utils import IntegrityError, OperationalError
+
+from django_twined.models import (
+    COALESCE_HEARTBEATS,
+    ERROR_STATUS,
+    QUESTION_ASKED,
+    SUCCESS_STATUS,
+    Question,
+    QuestionEventSummary,
+    ServiceUsageEvent,
+    get_heartbeat_mode,
+)
+from django_twined.models.inserts import insert_ignoring_conflicts
+from django_twined.models.service_usage_events import UNIQUE_MESSAGE_FIELDS
+from django_twined.signals.senders import (
+    delivery_acknowledgement_received,
+    exception_received,
+    heartbeat_received,
+    log_record_received,
+    monitor_message_received,
+    question_asked,
+    result_received,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# The signal sent for events of each message kind
+SERVICE_USAGE_EVENT_SIGNALS = {
+    "delivery_acknowledgement": delivery_acknowledgement_received,
+    "exception": exception_received,
+    "heartbeat": heartbeat_received,
+    "log_record": log_record_received,
+    "monitor_message": monitor_message_received,
+    "result": result_received,
+    QUESTION_ASKED: question_asked,
+}
+
+# The status a question is given when it's answered with an event of each kind
+ANSWERED_STATUSES = {
+    "exception": ERROR_STATUS,
+    "result": SUCCESS_STATUS,
+}
+
+
+def store_service_usage_events(events):
+    """Insert service usage events into the database, then send the signal corresponding to the kind of each event. The
+    signals are only sent once the rows exist, so receivers can rely on the events having an id.
+
+    Pub/Sub delivers messages at least once, so events with the message id of an event that's already stored are
+    redelivered duplicates, and are skipped (see `insert_new_service_usage_events`). Questions answered by the events,
+    and the event summaries of the questions, are updated in the same transaction (see `update_answered_questions` and
+    `QuestionEventSummary.objects.record_events`).
+
+    If heartbeats are coalesced (see `TWINED_HEARTBEAT_MODE`), heartbeat events aren't inserted, but are only recorded
+    as the latest heartbeats of their questions' event summaries. Their signals are still sent, with the unsaved events.
+
+    :param list(django_twined.models.ServiceUsageEvent) events: unsaved service usage events
+    :return list(django_twined.models.ServiceUsageEvent): the saved service usage events (and any coalesced heartbeats), excluding duplicates
+    """
+    coalesce = get_heartbeat_mode() == COALESCE_HEARTBEATS
+    heartbeats = []
+    others = []
+
+    for event in events:
+        if coalesce and event.message_kind == "heartbeat":
+            heartbeats.append(event)
+        else:
+            others.append(event)
+
+    with transaction.atomic():
+        inserted = insert_new_service_usage_events(others)
+        update_answered_questions(inserted)
+        QuestionEventSummary.objects.record_events(inserted + heartbeats)
+
+    kept = set(id(event) for event in inserted + heartbeats)
+    events = [event for event in events if id(event) in kept]
+
+    for event in events:
+        send_service_usage_event_signal(event)
+
+    return events
+
+
+def store_service_usage_event_batch(events):
+    """Store a batch of service usage events (see `store_service_usage_events`) in a single transaction, falling back to
+    storing them one at a time if the batch can't be inserted, so that one bad event (e.g. for a question that's since
+    been deleted) or a failed transaction (e.g. a deadlock with a concurrent flush, which is rolled back) doesn't lose
+    the rest of the batch
+
+    :param list(django_twined.models.ServiceUsageEvent) events: unsaved service usage events
+    :return list(django_twined.models.ServiceUsageEvent): the saved service usage events, excluding duplicates and events that couldn't be stored
+    """
+    try:
+        return store_service_usage_events(events)
+    except (IntegrityError, OperationalError):
+        logger.warning(
+            "Failed to bulk insert %s ServiceUsageEvents, inserting individually", len(events), exc_info=True
+        )
+
+    stored = []
+
+    for event in events:
+        try:
+            stored.extend(store_service_usage_events([event]))
+        except (IntegrityError, OperationalError) as e:
+            logger.error("Could not store ServiceUsageEvent for question %s: %s", event.question_id, e)
+
+    return stored
+
+
+def insert_new_service_usage_events(events):
+    """Insert service usage events into the database, skipping any with the message id and publish time of an event
+    that's already stored, or of an earlier event in the list. Events without a message id are all inserted in a single
+    query, while events with one are inserted with `ON CONFLICT DO NOTHING` on the unique constraint of their message id
+    and publish time (see `insert_ignoring_conflicts`), so that a duplicate stored before or concurrently is neither
+    stored twice nor returned as inserted.
+
+    :param list(django_twined.models.ServiceUsageEvent) events: unsaved service usage events
+    :return list(django_twined.models.ServiceUsageEvent): the inserted events, in the order given
+    """
+    unidentified = [event for event in events if event.message_id is None]
+    identified = {}
+
+    for event in events:
+        if event.message_id is not None:
+            identified.setdefault((event.message_id, event.publish_time), event)
+
+    if unidentified:
+        ServiceUsageEvent.objects.bulk_create(unidentified)
+
+    # Events are inserted in order of message id, so that concurrent inserts of the same messages don't deadlock
+    new = [identified[key] for key in sorted(identified, key=lambda key: key[0])]
+    inserted = set(id(event) for event in insert_ignoring_conflicts(ServiceUsageEvent, new, UNIQUE_MESSAGE_FIELDS))
+    return [event for event in events if event.message_id is None or id(event) in inserted]
+
+
+def update_answered_questions(events):
+    """Record questions as answered when `result` or `exception` events are received for them, setting their status
+    and the time they were answered.
+
+    Each question is updated with a single conditional update, which only applies to questions that haven't already
+    been answered, so the first result or exception received for a question determines its status. The questions are
+    updated in order of id, so that concurrent transactions answering the same questions don't deadlock.
+
+    :param list(django_twined.models.ServiceUsageEvent) events: service usage events
+    :return None:
+    """
+    answers = {}
+
+    for event in events:
+        if event.message_kind in ANSWERED_STATUSES:
+            answers.setdefault(event.question_id, event)
+
+    for question_id in sorted(answers, key=str):
+        event = answers[question_id]
+
+        Question.objects.filter(id=question_id, answered__isnull=True).update(
+            status=ANSWERED_STATUSES[event.message_kind],
+            answered=event.publish_time,
+        )
+
+
+def send_service_usage_event_signal(service_usage_event):
+    """Send the signal corresponding to the kind of message contained in a service usage event
+
+    :param django_twined.models.ServiceUsageEvent service_usage_event: a saved service usage event
+    :return None:
+    """
+    signal = SERVICE_USAGE_EVENT_SIGNALS.get(service_usage_event.message_kind)
+
+    if signal is None:
+        logger.warning(
+            "Unknown event kind: (%s) for ServiceUsageEvent %s",
+            service_usage_event.message_kind,
+            service_usage_event.id,
+        )
+        return
+
+    signal.send(sender=ServiceUsageEvent, service_usage_event=service_usage_event)
@@ -0,0 +1,96 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+
+from django_twined.events.partitions import (
+    DEFAULT_MONTHS_AHEAD,
+    convert_to_partitioned_table,
+    create_partitions,
+    drop_expired_partitions,
+    is_partitioned,
+)
+from django_twined.events.retention import delete_expired_events
+
+from .sync_data_stores import VERBOSITY_MAP
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Use `python manage.py help manage_service_usage_events` to display help for this command line administration tool"""
+
+    help = (
+        "Applies the retention periods in settings.TWINED_EVENT_RETENTION to stored service usage events. "
+        "If the events table is partitioned by month (PostgreSQL only, see --convert), partitions are created for "
+        "the coming months and partitions only holding expired events are dropped. Run this regularly (e.g. daily)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            required=False,
+            action="store_true",
+            dest="convert",
+            default=False,
+            help="Convert the events table to a table partitioned by month of publish time. The table is locked while "
+            "it's converted.",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            required=False,
+            type=int,
+            dest="months_ahead",
+            default=DEFAULT_MONTHS_AHEAD,
+            help=f"The number of months after this month to create partitions for (default {DEFAULT_MONTHS_AHEAD}).",
+        )
+        parser.add_argument(
+            "--detach-only",
+            required=False,
+            action="store_true",
+            dest="detach_only",
+            default=False,
+            help="Detach expired partitions from the events table (e.g. to archive them) instead of dropping them.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            required=False,
+            type=int,
+            dest="batch_size",
+            default=None,
+            help="The number of expired events deleted at a time.",
+        )
+
+    def handle(
+        self,
+        *args,
+        convert=False,
+        months_ahead=DEFAULT_MONTHS_AHEAD,
+        detach_only=False,
+        batch_size=None,
+        **options,
+    ):
+        # Ensure we respect the --verbosity command option
+        verbosity = int(options["verbosity"])
+        logger.setLevel(VERBOSITY_MAP[verbosity])
+
+        try:
+            if convert:
+                if is_partitioned():
+                    raise CommandError("The service usage events table is already partitioned")
+
+                convert_to_partitioned_table()
+                self.stdout.write("Partitioned the service usage events table")
+
+            if is_partitioned():
+                for name in create_partitions(months_ahead=months_ahead):
+                    self.stdout.write(f"Created partition {name}")
+
+                for name in drop_expired_partitions(detach_only=detach_only):
+                    self.stdout.write(f"{'Detached' if detach_only else 'Dropped'} expired partition {name}")
+
+        except NotSupportedError as e:
+            raise CommandError(str(e)) from e
+
+        for kind, count in delete_expired_events(batch_size=batch_size).items():
+            self.stdout.write(f"Deleted {count} expired {kind!r} events")
@@ -1,8 +1,10 @@
+import json
 import logging
+import os
 
 from django.apps import apps
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,27 @@ VERBOSITY_MAP = {
     3: logging.DEBUG,
 }
 
+DEFAULT_CHECKPOINT_FILE = "sync_data_stores_checkpoint.json"
+
+
+def read_checkpoints(path):
+    """Read the checkpoints of previous (interrupted) syncs, keyed on store key"""
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoints(path, checkpoints):
+    """Write sync checkpoints, replacing the file atomically so that an interrupted write can't corrupt it"""
+    temporary_path = f"{path}.tmp"
+
+    with open(temporary_path, "w") as f:
+        json.dump(checkpoints, f, indent=4)
+
+    os.replace(temporary_path, path)
+
 
 class Command(BaseCommand):
     """Use `python manage.py help sync_data_stores` to display help for this command line administration tool"""
@@ -37,26 +60,123 @@ class Command(BaseCommand):
         parser.add_argument(
             "--db-to-store",
             required=False,
-            dest="source_keys",
+            action="store_true",
+            dest="db_to_store",
+            default=False,
+            help="By default, metadata is synced from store to db. Syncing the other way around is not implemented yet.",
+        )
+        parser.add_argument(
+            "--prefix",
+            required=False,
+            dest="prefix",
+            default=None,
+            help="Only sync files (and their database records) whose names begin with this prefix.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            required=False,
+            type=int,
+            dest="batch_size",
+            default=None,
+            help="The number of files listed from the store and synced to the database at a time.",
+        )
+        parser.add_argument(
+            "--workers",
+            required=False,
+            type=int,
+            dest="workers",
             default=None,
-            help="By default, metadata is synced from store to db. To do the other way arou",
+            help="The number of pages of the store listing to fetch in the background while a page is being synced.",
+        )
+        parser.add_argument(
+            "--checkpoint-file",
+            required=False,
+            dest="checkpoint_file",
+            default=DEFAULT_CHECKPOINT_FILE,
+            help=f"The file in which sync progress is recorded after each batch (default '{DEFAULT_CHECKPOINT_FILE}').",
+        )
+        parser.add_argument(
+            "--resume",
+            required=False,
+            action="store_true",
+            dest="resume",
+            default=False,
+            help="Resume interrupted syncs from the checkpoint file, rather than starting from the beginning of the store.",
         )
 
-    def handle(self, *args, source_keys=None, **options):
+    def handle(
+        self,
+        *args,
+        source_keys=None,
+        db_to_store=False,
+        prefix=None,
+        batch_size=None,
+        workers=None,
+        checkpoint_file=DEFAULT_CHECKPOINT_FILE,
+        resume=False,
+        **options,
+    ):
         # Ensure we respect the --verbosity command option
         verbosity = int(options["verbosity"])
         logger.setLevel(VERBOSITY_MAP[verbosity])
 
+        if db_to_store:
+            raise CommandError("Syncing metadata from the database to the store is not implemented yet")
+
         # Get the data sources to synchronise (by default, all defined)
         source_keys = source_keys or settings.TWINED_DATA_STORES.keys()
         stores = dict((key, settings.TWINED_DATA_STORES[key]) for key in source_keys)
 
+        checkpoints = read_checkpoints(checkpoint_file)
+
         # Loop through the data sources
         for key, store in stores.items():
-            logger.info("Synchronizing store -> database for %s", key)
+            checkpoint = checkpoints.get(key) if resume else None
+
+            if checkpoint is not None and checkpoint["prefix"] != prefix:
+                raise CommandError(
+                    f"The checkpoint for {key} is for prefix {checkpoint['prefix']!r}, not {prefix!r}. Resume with the same prefix, or sync without --resume."
+                )
+
+            if checkpoint is None:
+                logger.info("Synchronizing store -> database for %s", key)
+                page_token, previous_last_name = None, None
+            else:
+                logger.info("Resuming store -> database synchronization for %s after %s", key, checkpoint["last_name"])
+                page_token, previous_last_name = checkpoint["page_token"], checkpoint["last_name"]
 
             # Get model class and the storage instance used for its datafiles
-            Model = apps.get_model(*store["model"].split("."))
+            Model = apps.get_model(store["model"])
+
+            # Sync a page of the listing at a time so the whole store is never held in memory
+            pages = Model.objects.iter_store_pages(
+                prefix=prefix, page_size=batch_size, prefetch=workers, page_token=page_token
+            )
+
+            for page in pages:
+                # Daisychain sync commands so the store comparison only gets run once per page
+                comparison = (
+                    Model.objects.compare_store_page(page, previous_last_name=previous_last_name, prefix=prefix)
+                    .import_missing(batch_size=batch_size)
+                    .delete_missing()
+                    .sync_metadata_from_store(batch_size=batch_size)
+                    .store_comparison
+                )
+                logger.info(
+                    "Synchronized files %s to %s of %s: %s", page.first_name, page.last_name, key, comparison.counts
+                )
+
+                if page.last_name is not None:
+                    previous_last_name = page.last_name
+
+                if page.next_page_token is not None:
+                    checkpoints[key] = {
+                        "prefix": prefix,
+                        "page_token": page.next_page_token,
+                        "last_name": previous_last_name,
+                    }
+                    write_checkpoints(checkpoint_file, checkpoints)
 
-            # Daisychain sync commands so the store comparison only gets run once
-            Model.objects.import_missing().delete_missing().sync_metadata_from_store()
+            # The store is fully synced, so there's nothing to resume
+            if checkpoints.pop(key, None) is not None:
+                write_checkpoints(checkpoint_file, checkpoints)
@@ -0,0 +1,51 @@
+# Disable for migrations:
+# pylint: disable=missing-docstring
+
+from django.db import migrations, models
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Coalesce
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def forward(apps, schema_editor):
+    """Populate the message kind of existing service usage events from either the new `kind` key or the legacy `type`
+    key of their data, in batches of ids to avoid one enormous update on large event tables
+    """
+    ServiceUsageEvent = apps.get_model("django_twined", "ServiceUsageEvent")
+
+    last_id = ServiceUsageEvent.objects.order_by("-id").values_list("id", flat=True).first()
+
+    if last_id is None:
+        return
+
+    for start in range(0, last_id + 1, BACKFILL_BATCH_SIZE):
+        ServiceUsageEvent.objects.filter(id__gte=start, id__lt=start + BACKFILL_BATCH_SIZE).update(
+            message_kind=Coalesce(KeyTextTransform("kind", "data"), KeyTextTransform("type", "data"))
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0014_question_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="serviceusageevent",
+            name="message_kind",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                help_text="The kind of octue message contained in the event data (eg 'result' or 'heartbeat')",
+                max_length=50,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(forward, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="serviceusageevent",
+            index=models.Index(fields=["question", "message_kind", "publish_time"], name="sue_question_kind_time_idx"),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Disable for migrations:
+# pylint: disable=missing-docstring
+
+from django.db import migrations, models
+import packaging.version
+
+BACKFILL_BATCH_SIZE = 1000
+
+# The version sort key is frozen as it was when this migration was written, so that later changes to the key (in
+# `django_twined.models.service_revisions`) don't change what this migration writes
+VERSION_SORT_KEY_MAX_LENGTH = 255
+VERSION_SORT_KEY_RELEASE_PARTS = 6
+VERSION_SORT_KEY_NUMBER_WIDTH = 10
+VERSION_SORT_KEY_PRE_RELEASE_CODES = {"a": "1", "b": "2", "rc": "3"}
+
+
+def get_version_sort_key(tag):
+    """Get a key for a revision tag that sorts (as a string) in the same order as the semantic versions it represents
+
+    The key is a fixed-width string of digits built from the epoch, release, pre-release, post-release and development
+    parts of the version, in the order that `packaging.version.Version` compares them, followed by any local version
+    label. This allows revisions to be ordered by version in the database.
+
+    :param str tag: the revision tag
+    :return str|None: the sort key, or None if the tag isn't a valid version or has parts too large to represent
+    """
+    try:
+        version = packaging.version.Version(tag)
+    except packaging.version.InvalidVersion:
+        return None
+
+    limit = 10**VERSION_SORT_KEY_NUMBER_WIDTH
+
+    # Versions differing only in trailing zeros of their release are equal, so these can be dropped to fit the key
+    release = list(version.release)
+    while len(release) > VERSION_SORT_KEY_RELEASE_PARTS and release[-1] == 0:
+        release.pop()
+
+    if len(release) > VERSION_SORT_KEY_RELEASE_PARTS:
+        return None
+
+    release += [0] * (VERSION_SORT_KEY_RELEASE_PARTS - len(release))
+
+    numbers = [version.epoch, *release, (version.pre or (None, 0))[1], version.post or 0, version.dev or 0]
+
+    if any(number >= limit for number in numbers):
+        return None
+
+    def number(value):
+        return str(value).zfill(VERSION_SORT_KEY_NUMBER_WIDTH)
+
+    # Development releases with no pre-release part sort before pre-releases, which sort before final releases
+    if version.pre is not None:
+        pre_release_code = VERSION_SORT_KEY_PRE_RELEASE_CODES[version.pre[0]]
+    elif version.dev is not None and version.post is None:
+        pre_release_code = "0"
+    else:
+        pre_release_code = "4"
+
+    key = "".join(
+        [
+            number(version.epoch),
+            *(number(part) for part in release),
+            pre_release_code,
+            number((version.pre or (None, 0))[1]),
+            "0" if version.post is None else "1",
+            number(version.post or 0),
+            "1" if version.dev is None else "0",
+            number(version.dev or 0),
+            "0" if version.local is None else "1",
+            version.local or "",
+        ]
+    )
+
+    return key[:VERSION_SORT_KEY_MAX_LENGTH]
+
+
+def forward(apps, schema_editor):
+    """Populate the version sort key of existing service revisions from their revision tags"""
+    ServiceRevision = apps.get_model("django_twined", "ServiceRevision")
+
+    batch = []
+
+    for service_revision in ServiceRevision.objects.only("id", "tag").iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        service_revision.version_sort_key = get_version_sort_key(service_revision.tag)
+        batch.append(service_revision)
+
+        if len(batch) == BACKFILL_BATCH_SIZE:
+            ServiceRevision.objects.bulk_update(batch, ["version_sort_key"])
+            batch = []
+
+    if batch:
+        ServiceRevision.objects.bulk_update(batch, ["version_sort_key"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0015_serviceusageevent_message_kind"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="servicerevision",
+            name="version_sort_key",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="A key derived from the revision tag, which sorts in semantic version order (null if the tag isn't a valid version)",
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(forward, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="servicerevision",
+            index=models.Index(fields=["namespace", "name", "version_sort_key"], name="service_revision_version_idx"),
+        ),
+    ]
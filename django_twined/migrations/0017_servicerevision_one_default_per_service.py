@@ -0,0 +1,41 @@
+# Disable for migrations:
+# pylint: disable=missing-docstring
+
+from django.db import migrations, models
+
+
+def forward(apps, schema_editor):
+    """Concurrent registrations could previously leave a service with more than one default revision; keep only the
+    most recently registered default of each service, so that the constraint can be added
+    """
+    ServiceRevision = apps.get_model("django_twined", "ServiceRevision")
+
+    services_with_many_defaults = (
+        ServiceRevision.objects.filter(is_default=True)
+        .values("namespace", "name")
+        .annotate(latest_id=models.Max("id"), defaults=models.Count("id"))
+        .filter(defaults__gt=1)
+    )
+
+    for service in services_with_many_defaults:
+        ServiceRevision.objects.filter(namespace=service["namespace"], name=service["name"], is_default=True).exclude(
+            id=service["latest_id"]
+        ).update(is_default=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0016_servicerevision_version_sort_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="servicerevision",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_default", True)),
+                fields=("namespace", "name"),
+                name="one_default_per_service",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0017_servicerevision_one_default_per_service"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="question",
+            name="status",
+            field=models.IntegerField(
+                choices=[
+                    (-100, "No status"),
+                    (-3, "Failed (invalid inputs)"),
+                    (-2, "Failed (timeout)"),
+                    (-1, "Failed (error)"),
+                    (0, "In progress"),
+                    (1, "Complete"),
+                ],
+                db_index=True,
+                default=-100,
+            ),
+        ),
+    ]
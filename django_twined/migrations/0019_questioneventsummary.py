@@ -0,0 +1,125 @@
+# Disable for migrations:
+# pylint: disable=missing-docstring
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def forward(apps, schema_editor):
+    """Summarise the events already received for each question, in batches of questions"""
+    QuestionEventSummary = apps.get_model("django_twined", "QuestionEventSummary")
+    ServiceUsageEvent = apps.get_model("django_twined", "ServiceUsageEvent")
+
+    def of_kind(message_kind):
+        return models.Q(message_kind=message_kind)
+
+    summaries = (
+        ServiceUsageEvent.objects.order_by("question_id")
+        .values("question_id")
+        .annotate(
+            delivery_acknowledgement_time=models.Min("publish_time", filter=of_kind("delivery_acknowledgement")),
+            latest_heartbeat_time=models.Max("publish_time", filter=of_kind("heartbeat")),
+            result_event_id=models.Min("id", filter=of_kind("result")),
+            exception_count=models.Count("id", filter=of_kind("exception")),
+            log_record_count=models.Count("id", filter=of_kind("log_record")),
+            monitor_message_count=models.Count("id", filter=of_kind("monitor_message")),
+            last_event_time=models.Max("publish_time"),
+        )
+    )
+
+    batch = []
+
+    for summary in summaries.iterator(chunk_size=BATCH_SIZE):
+        batch.append(QuestionEventSummary(**summary))
+
+        if len(batch) >= BATCH_SIZE:
+            QuestionEventSummary.objects.bulk_create(batch)
+            batch = []
+
+    QuestionEventSummary.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0018_question_status_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuestionEventSummary",
+            fields=[
+                (
+                    "question",
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="event_summary",
+                        serialize=False,
+                        to="django_twined.question",
+                    ),
+                ),
+                (
+                    "delivery_acknowledgement_time",
+                    models.DateTimeField(
+                        blank=True, editable=False, help_text="When the question's delivery was acknowledged", null=True
+                    ),
+                ),
+                (
+                    "latest_heartbeat_time",
+                    models.DateTimeField(
+                        blank=True,
+                        editable=False,
+                        help_text="When the latest heartbeat was received for the question",
+                        null=True,
+                    ),
+                ),
+                (
+                    "exception_count",
+                    models.PositiveIntegerField(
+                        default=0, editable=False, help_text="The number of exceptions received"
+                    ),
+                ),
+                (
+                    "log_record_count",
+                    models.PositiveIntegerField(
+                        default=0, editable=False, help_text="The number of log records received"
+                    ),
+                ),
+                (
+                    "monitor_message_count",
+                    models.PositiveIntegerField(
+                        default=0, editable=False, help_text="The number of monitor messages received"
+                    ),
+                ),
+                (
+                    "last_event_time",
+                    models.DateTimeField(
+                        blank=True,
+                        editable=False,
+                        help_text="When the latest event was received for the question",
+                        null=True,
+                    ),
+                ),
+                (
+                    "result_event",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        editable=False,
+                        help_text="The result event for the question",
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="django_twined.serviceusageevent",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "question event summaries",
+            },
+        ),
+        migrations.RunPython(forward, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0019_questioneventsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="serviceusageevent",
+            name="message_id",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="The id of the Pub/Sub message the event was received in, used to ignore redelivered messages",
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="serviceusageevent",
+            constraint=models.UniqueConstraint(fields=("message_id", "publish_time"), name="sue_unique_message"),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0020_serviceusageevent_message_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="questioneventsummary",
+            name="latest_heartbeat_data",
+            field=models.JSONField(
+                blank=True,
+                editable=False,
+                help_text="The data of the latest heartbeat received for the question",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Disable for migrations:
+# pylint: disable=missing-docstring
+
+from django.db import migrations, models
+
+
+def forward(apps, schema_editor):
+    """Record the data of the first delivery acknowledgement and latest heartbeat of each summarised question, for
+    summaries made before their data was recorded
+    """
+    QuestionEventSummary = apps.get_model("django_twined", "QuestionEventSummary")
+    ServiceUsageEvent = apps.get_model("django_twined", "ServiceUsageEvent")
+
+    def get_data(message_kind, order):
+        events = ServiceUsageEvent.objects.filter(question_id=models.OuterRef("question_id"), message_kind=message_kind)
+        return models.Subquery(events.order_by(order, "id").values("data")[:1])
+
+    QuestionEventSummary.objects.filter(
+        delivery_acknowledgement_time__isnull=False, delivery_acknowledgement_data__isnull=True
+    ).update(delivery_acknowledgement_data=get_data("delivery_acknowledgement", "publish_time"))
+
+    QuestionEventSummary.objects.filter(latest_heartbeat_time__isnull=False, latest_heartbeat_data__isnull=True).update(
+        latest_heartbeat_data=get_data("heartbeat", "-publish_time")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_twined", "0021_questioneventsummary_latest_heartbeat_data"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="questioneventsummary",
+            name="delivery_acknowledgement_data",
+            field=models.JSONField(
+                blank=True,
+                editable=False,
+                help_text="The data of the question's delivery acknowledgement",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(forward, migrations.RunPython.noop),
+    ]
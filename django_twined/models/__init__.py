@@ -1,4 +1,5 @@
 from .datastores import AbstractSynchronisedDatastore
+from .question_event_summaries import COALESCE_HEARTBEATS, STORE_HEARTBEATS, QuestionEventSummary, get_heartbeat_mode
 from .questions import (
     BAD_INPUT_STATUS,
     ERROR_STATUS,
@@ -9,15 +10,30 @@ from .questions import (
     AbstractQuestion,
     Question,
 )
-from .service_revisions import AbstractServiceRevision, ServiceRevision, get_default_service_revision
+from .service_revisions import (
+    AbstractServiceRevision,
+    ServiceRevision,
+    get_default_service_revision,
+    get_latest_service_revision,
+    get_service_revision,
+    get_service_revision_in_range,
+    register_service_revisions,
+)
 from .service_usage_events import QUESTION_ASKED, QUESTION_RESPONSE_UPDATED, QUESTION_STATUS_UPDATED, ServiceUsageEvent
 
 __all__ = (
     "AbstractServiceRevision",
     "AbstractSynchronisedDatastore",
     "AbstractQuestion",
+    "COALESCE_HEARTBEATS",
     "get_default_service_revision",
+    "get_heartbeat_mode",
+    "get_latest_service_revision",
+    "get_service_revision",
+    "get_service_revision_in_range",
+    "register_service_revisions",
     "Question",
+    "QuestionEventSummary",
     "NO_STATUS",
     "BAD_INPUT_STATUS",
     "TIMEOUT_STATUS",
@@ -29,4 +45,5 @@ __all__ = (
     "QUESTION_STATUS_UPDATED",
     "ServiceRevision",
     "ServiceUsageEvent",
+    "STORE_HEARTBEATS",
 )
@@ -3,6 +3,7 @@ import logging
 import uuid
 import warnings
 
+from django.conf import settings
 from django.db import models
 from octue.resources import Datafile
 from octue.utils.encoders import OctueJSONEncoder
@@ -12,6 +13,17 @@ from .querysets import DatastoreQueryset
 logger = logging.getLogger(__name__)
 
 
+# The file field, storage and settings of each datastore model class, resolved on first use
+_resolved_stores = {}
+
+
+def clear_resolved_stores():
+    """Forget the file fields, storages and settings resolved for datastore models, so that they're resolved again
+    (from updated settings) on next use
+    """
+    _resolved_stores.clear()
+
+
 class AbstractSynchronisedDatastore(models.Model):
     """Rows in the database correspond to files in an object store, with metadata synchronized for search/querying
 
@@ -147,12 +159,7 @@ class AbstractSynchronisedDatastore(models.Model):
                 instance.save()
 
         except cls.DoesNotExist:
-            instance = cls(id=datafile.id)
-            instance.update_instance_from_tags(datafile.tags)
-            instance.update_instance_from_labels(datafile.labels)
-
-            # Set the file field .name attribute directly to path (https://stackoverflow.com/a/10906037/3556110)
-            getattr(instance, cls.__FILE_FIELD__).name = datafile.path_in_bucket
+            instance = cls.new_from_datafile(datafile)
 
             if create_if_missing:
                 instance.save()
@@ -160,6 +167,22 @@ class AbstractSynchronisedDatastore(models.Model):
 
         return instance, created
 
+    @classmethod
+    def new_from_datafile(cls, datafile):
+        """Create a new (unsaved) instance corresponding to an octue datafile object, with metadata from the datafile
+
+        :param octue.Datafile datafile: Datafile object representing a cloud file and its metadata
+        :return AbstractSynchronisedDatastore: An unsaved instance of the db model
+        """
+        instance = cls(id=datafile.id)
+        instance.update_instance_from_tags(datafile.tags)
+        instance.update_instance_from_labels(datafile.labels)
+
+        # Set the file field .name attribute directly to path (https://stackoverflow.com/a/10906037/3556110)
+        getattr(instance, cls.__FILE_FIELD__).name = datafile.path_in_bucket
+
+        return instance
+
     def get_tags_from_instance(self):
         """Get tags (a dict of key-value pairs) from this instance
 
@@ -208,17 +231,40 @@ class AbstractSynchronisedDatastore(models.Model):
     def _storage_settings(self):
         return self.get_storage_settings()
 
+    @classmethod
+    def _get_resolved(cls, key, resolve):
+        """Get a value derived from the model definition and settings, resolving it on first use by this model class"""
+        resolved = _resolved_stores.setdefault(cls, {})
+
+        if key not in resolved:
+            resolved[key] = resolve()
+
+        return resolved[key]
+
+    @classmethod
+    def get_file_field(cls):
+        """Return the model field holding the file for this Datastore"""
+
+        def resolve():
+            mapped_fields = dict((field.attname, field) for field in cls._meta.concrete_fields)
+            return mapped_fields[cls.__FILE_FIELD__]
+
+        return cls._get_resolved("file_field", resolve)
+
     @classmethod
     def get_storage(cls):
         """Return the storage object for this Datastore"""
-        mapped_fields = dict((field.attname, field) for field in cls._meta.concrete_fields)
-        return mapped_fields[cls.__FILE_FIELD__].storage
+        return cls._get_resolved("storage", lambda: cls.get_file_field().storage)
 
     @classmethod
     def get_storage_settings(cls):
         """Return a dict of settings of the storage for this Datastore"""
-        mapped_fields = dict((field.attname, field) for field in cls._meta.concrete_fields)
-        return mapped_fields[cls.__FILE_FIELD__].store["storage_settings"]
+        return cls._get_resolved("storage_settings", lambda: cls.get_store_settings()["storage_settings"])
+
+    @classmethod
+    def get_store_settings(cls):
+        """Return the entry in the TWINED_DATA_STORES setting for this Datastore"""
+        return cls._get_resolved("store_settings", lambda: settings.TWINED_DATA_STORES[cls.get_file_field().store_key])
 
     @property
     def _location(self):
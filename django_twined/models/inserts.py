@@ -0,0 +1,75 @@
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+
+def insert_ignoring_conflicts(model, instances, key_fields, using=DEFAULT_DB_ALIAS):
+    """Insert model instances, skipping any that conflict with existing rows on a unique constraint, and find out which
+    were actually inserted. Unlike `bulk_create(ignore_conflicts=True)`, this distinguishes rows inserted by this call
+    from rows inserted concurrently by another transaction, and sets the primary keys of the inserted instances.
+
+    On PostgreSQL and SQLite, rows are inserted in batches with `INSERT ... ON CONFLICT (<key fields>) DO NOTHING
+    RETURNING`, so only conflicts on the constraint of the key fields are ignored. On other databases, which can't
+    report which rows such an insert skipped, instances are inserted one at a time, ignoring any integrity error.
+
+    :param type model: the model class of the instances
+    :param list(django.db.models.Model) instances: unsaved instances, unique in the values of their key fields
+    :param iter(str) key_fields: the names of the fields of a unique constraint (without a condition) of the model
+    :param str using: the alias of the database to insert into
+    :return list(django.db.models.Model): the inserted instances, in the order given
+    """
+    if not instances:
+        return []
+
+    connection = connections[using]
+    key_fields = [model._meta.get_field(name) for name in key_fields]
+
+    if connection.vendor not in ("postgresql", "sqlite"):
+        return [instance for instance in instances if _insert_one(instance, using)]
+
+    meta = model._meta
+    fields = [field for field in meta.concrete_fields if field is not meta.auto_field]
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in fields)
+    conflict_target = ", ".join(quote(field.column) for field in key_fields)
+    returning = ", ".join(quote(field.column) for field in [meta.pk] + key_fields)
+    key_indexes = [fields.index(field) for field in key_fields]
+    batch_size = max(connection.ops.bulk_batch_size(fields, instances), 1)
+    inserted = set()
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(instances), batch_size):
+            batch = instances[start : start + batch_size]
+            params = []
+            instances_by_key = dict()
+
+            for instance in batch:
+                values = [field.get_db_prep_save(field.pre_save(instance, True), connection) for field in fields]
+                params.extend(values)
+
+                # Inserted rows are identified by the values of their key fields, as returned by the database
+                instances_by_key[tuple(values[index] for index in key_indexes)] = instance
+
+            placeholders = ", ".join(f"({', '.join(['%s'] * len(fields))})" for _ in batch)
+            cursor.execute(
+                f"INSERT INTO {quote(meta.db_table)} ({columns}) VALUES {placeholders} "
+                f"ON CONFLICT ({conflict_target}) DO NOTHING RETURNING {returning}",
+                params,
+            )
+
+            for pk, *key in cursor.fetchall():
+                instance = instances_by_key[tuple(key)]
+                instance.pk = pk
+                instance._state.adding = False
+                instance._state.db = using
+                inserted.add(id(instance))
+
+    return [instance for instance in instances if id(instance) in inserted]
+
+
+def _insert_one(instance, using):
+    try:
+        with transaction.atomic(using=using):
+            instance.save(force_insert=True, using=using)
+    except IntegrityError:
+        return False
+
+    return True
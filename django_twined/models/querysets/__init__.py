@@ -1,3 +1,4 @@
-from .datastore_queryset import DatastoreQueryset
+from .datastore_queryset import DatastoreQueryset, FileDeletionReport
+from .question_queryset import QuestionAskReport, QuestionQueryset
 
-__all__ = ("DatastoreQueryset",)
+__all__ = ("DatastoreQueryset", "FileDeletionReport", "QuestionAskReport", "QuestionQueryset")
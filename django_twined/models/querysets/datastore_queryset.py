@@ -1,16 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
 import logging
+import queue
+import threading
 
-from django.db import transaction
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.functions import Collate
 from django.db.models.query import QuerySet
 from django.db.utils import IntegrityError
+from google.api_core.exceptions import NotFound
 from octue.resources import Datafile, Dataset
+from octue.resources.datafile import OCTUE_METADATA_NAMESPACE
+from octue.utils.decoders import OctueJSONDecoder
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_STORE_PAGE_SIZE = 1000
+DEFAULT_STORE_PREFETCH_PAGES = 2
+DEFAULT_IMPORT_BATCH_SIZE = 500
+DEFAULT_SYNC_BATCH_SIZE = 500
+DEFAULT_DELETE_BATCH_SIZE = 500
+DEFAULT_DELETE_MAX_WORKERS = 8
+
+
+def apply_in_batches(objects, operation, batch_size):
+    """Apply a database operation (such as a bulk_create) to a list of objects in batches, each in its own transaction
+
+    If the operation raises an IntegrityError for a batch, the batch is bisected and the operation retried on each half,
+    down to individual objects, so that only the offending objects fail.
+
+    :param list objects: The objects to operate on
+    :param callable operation: A callable taking a list of objects, that performs the operation on them
+    :param int batch_size: The number of objects in each batch
+    :return tuple(list, list): The objects for which the operation succeeded, and (object, error) tuples for those for which it failed
+    """
+    succeeded = list()
+    failed = list()
+
+    for start in range(0, len(objects), batch_size):
+        batch_succeeded, batch_failed = _bisect(objects[start : start + batch_size], operation)
+        succeeded.extend(batch_succeeded)
+        failed.extend(batch_failed)
+
+    return succeeded, failed
+
+
+def _bisect(objects, operation):
+    try:
+        # Each batch has to be in a transaction or the outer transaction gets left dirty after the first failure
+        with transaction.atomic():
+            operation(objects)
+        return objects, []
+
+    except IntegrityError as e:
+        if len(objects) == 1:
+            return [], [(objects[0], e)]
+
+        middle = len(objects) // 2
+        first_succeeded, first_failed = _bisect(objects[:middle], operation)
+        second_succeeded, second_failed = _bisect(objects[middle:], operation)
+        return first_succeeded + second_succeeded, first_failed + second_failed
+
+
+def _delete_blob(bucket, name):
+    """Delete a blob, treating a blob that's already been deleted as a success"""
+    try:
+        bucket.blob(name).delete()
+    except NotFound:
+        logger.debug(f"{name} was already absent from the datastore")
+
+
+def datafile_from_blob(blob, bucket_name):
+    """Create an octue Datafile for a blob returned by a bucket listing, using the metadata already present in the
+    listing response rather than fetching the metadata of each object individually.
+
+    :param google.cloud.storage.blob.Blob blob: A blob from a bucket listing
+    :param str bucket_name: The name of the bucket containing the blob
+    :return octue.resources.Datafile:
+    """
+    metadata = dict()
+    prefix = f"{OCTUE_METADATA_NAMESPACE}__"
+
+    for key, value in (blob.metadata or {}).items():
+        if not key.startswith(prefix):
+            continue
+
+        try:
+            value = json.loads(value, cls=OctueJSONDecoder)
+        except json.decoder.JSONDecodeError:
+            pass
+
+        metadata[key[len(prefix) :]] = value
+
+    return Datafile(
+        f"gs://{bucket_name}/{blob.name}",
+        ignore_stored_metadata=True,
+        id=metadata.get("id", None),
+        timestamp=metadata.get("timestamp", None),
+        tags=metadata.get("tags", None),
+        labels=metadata.get("labels", None),
+    )
+
+
+class FileDeletionReport:
+    """Tiny class simply present to hold the outcomes of deleting files from a store"""
+
+    def __init__(self):
+        self.deleted = list()
+        self.failed = dict()
+        self.rows_deleted = 0
+
+    def __str__(self):
+        out = ""
+        for symbol in ["deleted", "failed", "rows_deleted"]:
+            out += f"{symbol}: {getattr(self, symbol)}\n"
+        return out
+
+
+class StorePage:
+    """Tiny class simply present to hold the datafiles listed in one page of a store"""
+
+    def __init__(self, datafiles, first_name, last_name, page_token, next_page_token):
+        self.datafiles = datafiles
+        self.first_name = first_name
+        self.last_name = last_name
+        self.page_token = page_token
+        self.next_page_token = next_page_token
+
+
+_END_OF_LISTING = object()
+
+
 class StoreComparison:
     """Tiny class simply present to hold sets of IDs for store comparisons"""
 
+    SYMBOLS = (
+        "datafiles_in_store",
+        "ids_in_store",
+        "ids_already_present",
+        "ids_missing_from_store",
+        "ids_missing_from_db",
+        "ids_imported",
+        "ids_failed_to_import",
+        "ids_synced",
+        "ids_failed_to_sync",
+        "ids_changed",
+        "ids_unchanged",
+    )
+
     def __init__(
         self,
         datafiles_in_store,
@@ -22,6 +161,8 @@ class StoreComparison:
         ids_failed_to_import=None,
         ids_synced=None,
         ids_failed_to_sync=None,
+        ids_changed=None,
+        ids_unchanged=None,
     ):
         self.datafiles_in_store = datafiles_in_store
         self.ids_in_store = ids_in_store
@@ -32,20 +173,21 @@ class StoreComparison:
         self.ids_failed_to_import = ids_failed_to_import
         self.ids_synced = ids_synced
         self.ids_failed_to_sync = ids_failed_to_sync
+        self.ids_changed = ids_changed
+        self.ids_unchanged = ids_unchanged
+
+    @property
+    def counts(self):
+        """A dict of the number of ids in each set of this comparison (or None for sets not yet determined)"""
+        return dict(
+            (symbol, None if getattr(self, symbol) is None else len(getattr(self, symbol)))
+            for symbol in self.SYMBOLS
+            if symbol != "datafiles_in_store"
+        )
 
     def __str__(self):
         out = ""
-        for symbol in [
-            "datafiles_in_store",
-            "ids_in_store",
-            "ids_already_present",
-            "ids_missing_from_store",
-            "ids_missing_from_db",
-            "ids_imported",
-            "ids_failed_to_import",
-            "ids_synced",
-            "ids_failed_to_sync",
-        ]:
+        for symbol in self.SYMBOLS:
             out += f"{symbol}: {getattr(self, symbol)}\n"
         return out
 
@@ -55,19 +197,58 @@ class DatastoreQuerySetMixin:
     Either use DatastoreQueryset directly, or use this to mix in additional queryset methods.
     """
 
-    def delete_files(self, include_rows=True):
-        """Delete the files corresponding to the rows in this query from the datalake"""
-        # Get a list of filenames to delete
-        files_to_delete = self.values_list(self.model.__FILE_FIELD__, flat=True)
+    def delete_files(self, include_rows=True, max_workers=None, batch_size=None):
+        """Delete the files corresponding to the rows in this query from the datalake
 
-        # Delete the datafiles from GCS
+        Files are deleted concurrently through a thread pool. Files that are already absent from the store count as
+        deleted. Database rows are then deleted in batches, but only for the files that were successfully deleted, so
+        rows are never removed for files that still exist in the store.
+
+        :param bool include_rows: If True, also delete the database rows of the deleted files
+        :param int|None max_workers: The maximum number of files to delete at once. Defaults to the `delete_max_workers` of the store in the `TWINED_DATA_STORES` setting, or 8.
+        :param int|None batch_size: The number of rows to delete per query. Defaults to the `delete_batch_size` of the store in the `TWINED_DATA_STORES` setting, or 500.
+        :return FileDeletionReport: The outcome of deleting each file
+        """
+        store_settings = self.model.get_store_settings()
+
+        if max_workers is None:
+            max_workers = store_settings.get("delete_max_workers", DEFAULT_DELETE_MAX_WORKERS)
+
+        if batch_size is None:
+            batch_size = store_settings.get("delete_batch_size", DEFAULT_DELETE_BATCH_SIZE)
+
+        # Get the primary keys and names of the files to delete
+        files_to_delete = dict(self.values_list("pk", self.model.__FILE_FIELD__))
+
+        report = FileDeletionReport()
         bucket = self.model.get_storage().bucket
-        for file in files_to_delete:
-            bucket.blob(file).delete()
 
-        # Run deletion of the queryset in a transaction so the database row gets restored if the file cannot be deleted
+        # Delete the datafiles from GCS
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict(
+                (executor.submit(_delete_blob, bucket, name), pk) for pk, name in files_to_delete.items() if name
+            )
+
+            for future in as_completed(futures):
+                pk = futures[future]
+
+                try:
+                    future.result()
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.error(f"Could not delete {files_to_delete[pk]} from the datastore. Error was: {str(e)}")
+                    report.failed[files_to_delete[pk]] = e
+                    continue
+
+                report.deleted.append(files_to_delete[pk])
+
         if include_rows:
-            return self.delete()
+            deleted_pks = [pk for pk, name in files_to_delete.items() if name not in report.failed]
+
+            for start in range(0, len(deleted_pks), batch_size):
+                rows_deleted, _ = self.model.objects.filter(pk__in=deleted_pks[start : start + batch_size]).delete()
+                report.rows_deleted += rows_deleted
+
+        return report
 
     def __init__(self, *args, store_comparison=None, **kwargs):
         self.store_comparison = store_comparison
@@ -88,13 +269,100 @@ class DatastoreQuerySetMixin:
         """
         return Dataset(name=name, files=[*queryset.all()], **kwargs)
 
-    def compare_store(self, cloud_paths=None):
+    def iter_store_pages(self, prefix=None, page_size=None, prefetch=None, page_token=None):
+        """Iterate through the objects in the store a page at a time, yielding the datafiles in each page
+
+        Datafile metadata is taken from the listing itself, so no per-object requests are made. The next pages of the
+        listing are fetched in a background thread while the current page is being processed, with at most `prefetch`
+        pages held in memory at once.
+
+        :param str|None prefix: Only list objects whose names begin with this prefix
+        :param int|None page_size: The maximum number of objects in each page (default 1000)
+        :param int|None prefetch: The number of pages to fetch ahead of the page being processed (default 2)
+        :param str|None page_token: A token from a previous listing (`StorePage.next_page_token`) to resume from
+        :return generator(StorePage):
+        """
+        storage = self.model.get_storage()
+        page_size = page_size or DEFAULT_STORE_PAGE_SIZE
+        prefetch = prefetch or DEFAULT_STORE_PREFETCH_PAGES
+
+        pages = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            # Keep retrying so the producer notices if the consumer stops early, rather than blocking forever
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                blobs = storage.client.list_blobs(
+                    bucket_or_name=storage.bucket_name,
+                    prefix=prefix,
+                    page_size=page_size,
+                    page_token=page_token,
+                )
+                current_token = page_token
+                for page in blobs.pages:
+                    page_blobs = list(page)
+                    if not put((page_blobs, current_token, blobs.next_page_token)):
+                        return
+                    current_token = blobs.next_page_token
+                put(_END_OF_LISTING)
+
+            except Exception as e:  # pylint: disable=broad-except
+                put(e)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                item = pages.get()
+
+                if item is _END_OF_LISTING:
+                    return
+
+                if isinstance(item, Exception):
+                    raise item
+
+                page_blobs, current_token, next_page_token = item
+
+                # Note - datafile.id is a UUID, not the same as blob.id which is a weird form of google path string
+                datafiles = dict()
+                for blob in page_blobs:
+                    datafile = datafile_from_blob(blob, storage.bucket_name)
+                    datafiles[datafile.id] = datafile
+
+                yield StorePage(
+                    datafiles,
+                    first_name=page_blobs[0].name if page_blobs else None,
+                    last_name=page_blobs[-1].name if page_blobs else None,
+                    page_token=current_token,
+                    next_page_token=next_page_token,
+                )
+
+        finally:
+            stop.set()
+
+    def compare_store(self, cloud_paths=None, prefix=None, page_size=None, prefetch=None):
         """Compares the contents of the store for files whose presence is not recorded in the database and imports them.
 
         Ignores the queryset; this method operates identically irrespective of whether called on a filtered queryset or not.
 
+        The store is listed page by page (see `iter_store_pages`), taking datafile metadata from the listing, so there
+        is one request per page of objects rather than one per object.
+
         :param list|None cloud_paths: A list of cloud_paths to import (eg ['gs://folder/file1.txt', 'gs://folder/file2.txt'].
         Import will be limited only to these paths (if they exist and those files are not already present in the store)).
+        :param str|None prefix: Only compare objects whose names begin with this prefix
+        :param int|None page_size: The maximum number of objects listed per request
+        :param int|None prefetch: The number of pages of the listing to fetch ahead
 
         :return tuple(s): sets of ids for the resulting (imported, already_present, failed_to_import, missing_from_store) records,
         enabling further operations (such as syncing already present records from store)
@@ -103,27 +371,16 @@ class DatastoreQuerySetMixin:
         if cloud_paths is not None:
             raise ValueError("cloud_paths not implemented yet")
 
-        # Get the store to use
-        storage = self.model.get_storage()
-
-        # Get a set of ids of all existing objects, and a dict of Datafile objects keyed on their id
-        ids_in_db = set(self.model.objects.values_list("id", flat=True))
+        # Get a set of ids of all existing objects (within the prefix, if given)
+        rows = self.model.objects.all()
+        if prefix:
+            rows = rows.filter(**{f"{self.model.__FILE_FIELD__}__startswith": prefix})
+        ids_in_db = set(str(id) for id in rows.values_list("id", flat=True))
 
         # Get a dict of Datafile objects keyed on their id, one for each object in the store
         datafiles_in_store = dict()
-        for blob in storage.client.list_blobs(bucket_or_name=storage.bucket_name):
-            # Get the gs path of the object
-            gs_path = f"gs://{storage.bucket_name}/{blob.name}"
-            logger.debug(f"Synchronizing metadata -> database for store object {gs_path}")
-
-            # TODO This is not scalable. It will become untenable for hundreds of objects,
-            # because it fetches metadata individually so generates N requests to the store.
-            # Figure out whether we can list_blobs with their metadata in one request.
-            datafile = Datafile(gs_path)
-
-            # Note - datafile.id is a UUID, not the
-            # same as blob.id which is a weird form of google path string
-            datafiles_in_store[datafile.id] = datafile
+        for page in self.iter_store_pages(prefix=prefix, page_size=page_size, prefetch=prefetch):
+            datafiles_in_store.update(page.datafiles)
 
         # Get a set of ids of all objects existing in the store
         ids_in_store = set(datafiles_in_store.keys())
@@ -143,34 +400,83 @@ class DatastoreQuerySetMixin:
 
         return self
 
-    def import_missing(self):
-        """Where files exist in the datastore but not the database, import those records to the DB"""
+    def compare_store_page(self, page, previous_last_name=None, prefix=None):
+        """Compares the contents of one page of the store listing (see `iter_store_pages`) with the database.
+
+        Like `compare_store`, this ignores the queryset. The database rows compared are those whose file names fall
+        after the last name of the previous page, up to and including the last name of this page (or without an upper
+        bound, for the final page of the listing, and none at all for an empty page before the end of the listing), so
+        comparing every page of a listing in turn is equivalent to comparing the whole store, without holding the whole
+        listing in memory.
+
+        :param StorePage page: The page of the store listing to compare
+        :param str|None previous_last_name: The name of the last object in the previous page, or None for the first page
+        :param str|None prefix: The prefix the store listing was restricted to, if any
+        :return DatastoreQuerySetMixin: A queryset whose store comparison covers the objects in the page
+        """
+        file_field = self.model.__FILE_FIELD__
+        rows = self.model.objects.all()
+
+        if prefix:
+            rows = rows.filter(**{f"{file_field}__startswith": prefix})
+
+        # Store listings are in (byte-wise) lexicographic order of name, so compare names the same way in the database
+        if connections[self.db].vendor == "postgresql":
+            rows = rows.alias(_listing_name=Collate(file_field, "C"))
+        else:
+            rows = rows.alias(_listing_name=F(file_field))
+
+        if previous_last_name is not None:
+            rows = rows.filter(_listing_name__gt=previous_last_name)
+
+        if page.next_page_token is not None:
+            # A store can return an empty page part way through a listing, which covers no names, so no rows
+            rows = rows.none() if page.last_name is None else rows.filter(_listing_name__lte=page.last_name)
+
+        ids_in_db = set(str(id) for id in rows.values_list("id", flat=True))
+        ids_in_store = set(page.datafiles.keys())
+        ids_already_present = ids_in_store.intersection(ids_in_db)
+
+        self.store_comparison = StoreComparison(
+            page.datafiles,
+            ids_in_store,
+            ids_already_present,
+            ids_in_db.difference(ids_already_present),
+            ids_in_store.difference(ids_already_present),
+        )
+
+        return self
+
+    def import_missing(self, batch_size=None):
+        """Where files exist in the datastore but not the database, import those records to the DB
+
+        Records are inserted in batches with `bulk_create`. If a batch fails, it's bisected down to the records that
+        cannot be inserted, so only those are recorded as failing to import.
+
+        :param int|None batch_size: The number of records to insert per query. Defaults to the `import_batch_size` of the store in the `TWINED_DATA_STORES` setting, or 500.
+        """
 
         if self.store_comparison is None:
             self = self.compare_store()
 
-        # Prepare new records for creation in the db
-        # TODO This is not scalable, we have N database inserts for N files.
-        #  We could do this quicker in a bulk_create. However, failures to
-        #  insert would create an all-or-nothing problem. Perhaps we can fall
-        #  back to linear create on batches that fail to bulk_create?
-        failed = list()
-        imported = list()
+        if batch_size is None:
+            batch_size = self.model.get_store_settings().get("import_batch_size", DEFAULT_IMPORT_BATCH_SIZE)
+
         datafiles_in_store = self.store_comparison.datafiles_in_store
-        for datafile_id in self.store_comparison.ids_missing_from_db:
-            # Each update has to be in a transaction or the outer transaction gets left dirty after the first failure
-            with transaction.atomic():
-                try:
-                    self.model.from_datafile(datafiles_in_store[datafile_id])
-                    imported.append(datafile_id)
-                except IntegrityError as e:
-                    logger.error(
-                        f"Could not create record from datastore object {datafiles_in_store[datafile_id].path}. Check the metadata on that file. Error was: {str(e)}"
-                    )
-                    failed.append(datafile_id)
+        instances = [
+            self.model.new_from_datafile(datafiles_in_store[datafile_id])
+            for datafile_id in self.store_comparison.ids_missing_from_db
+        ]
+
+        imported, failed = apply_in_batches(instances, self.model.objects.bulk_create, batch_size)
 
-        self.store_comparison.ids_imported = set(imported)
-        self.store_comparison.ids_failed_to_import = set(failed)
+        for instance, error in failed:
+            logger.error(
+                f"Could not create record from datastore object {datafiles_in_store[str(instance.id)].cloud_path}. Check the metadata on that file. Error was: {str(error)}"
+            )
+
+        self.store_comparison.ids_imported = set(str(instance.id) for instance in imported)
+        self.store_comparison.ids_failed_to_import = set(str(instance.id) for instance, _ in failed)
 
         return self
 
@@ -183,42 +489,82 @@ class DatastoreQuerySetMixin:
 
         return self
 
-    def sync_metadata_from_store(self):
+    def sync_metadata_from_store(self, batch_size=None):
         """Take a queryset of files and update their metadata records from the store
 
         This ensures that file records (metadata) are consistent with the source of truth (the datastore).
 
-        :param bool allow_delete: If true (the default), records of files not present in the store will be
-        deleted. This defaults to true in order to follow the pattern that the datastore is the source of truth.
+        The existing records are loaded a batch at a time, updated from the store metadata, and compared with their
+        values in the database. Only records that have changed are written, using `bulk_update` restricted to the fields
+        that changed. If a batch fails to update, it's bisected down to the records that cannot be updated.
+
+        :param int|None batch_size: The number of records to load and update per query. Defaults to the `sync_batch_size` of the store in the `TWINED_DATA_STORES` setting, or 500.
         """
 
         if self.store_comparison is None:
             self = self.compare_store()
 
-        ids_to_sync = set(str(id) for id in self.values_list("id")[0])
+        if batch_size is None:
+            batch_size = self.model.get_store_settings().get("sync_batch_size", DEFAULT_SYNC_BATCH_SIZE)
 
-        # Update records with datafile meta
-        # TODO This is not scalable, we have N database inserts for N files.
-        #  We could do this quicker in a bulk_update. However, failures to
-        #  insert would create an all-or-nothing problem. Perhaps we can fall
-        #  back to linear create on batches that fail to bulk_update?
-        failed = list()
-        synced = list()
         datafiles_in_store = self.store_comparison.datafiles_in_store
-        for id in ids_to_sync:
-            # Each update has to be in a transaction or the outer transaction gets left dirty after the first failure
-            with transaction.atomic():
-                try:
-                    self.model.from_datafile(datafiles_in_store[id], update_db_metadata=True)
-                    synced.append(id)
+        ids_to_sync = sorted(self.store_comparison.ids_already_present)
+
+        fields = [
+            field
+            for field in self.model._meta.concrete_fields
+            if not field.primary_key and field.name != self.model.__FILE_FIELD__
+        ]
+
+        changed = list()
+        unchanged = list()
+        failed = list()
+
+        for start in range(0, len(ids_to_sync), batch_size):
+            instances = list(self.filter(id__in=ids_to_sync[start : start + batch_size]))
+            changed_fields = dict()
+
+            for instance in instances:
+                datafile = datafiles_in_store[str(instance.id)]
+                original = dict((field.attname, getattr(instance, field.attname)) for field in fields)
 
-                except IntegrityError as e:
+                try:
+                    instance.update_instance_from_tags(datafile.tags)
+                    instance.update_instance_from_labels(datafile.labels)
+                    instance_changed_fields = set(
+                        field.attname
+                        for field in fields
+                        if field.to_python(getattr(instance, field.attname)) != original[field.attname]
+                    )
+                except Exception as e:  # pylint: disable=broad-except
                     logger.error(
-                        f"Could not update record from datastore object {datafiles_in_store[id].path}. Check the metadata on that file. Error was: {str(e)}"
+                        f"Could not update record from datastore object {datafile.cloud_path}. Check the metadata on that file. Error was: {str(e)}"
                     )
-                    failed.append(id)
-
-        self.store_comparison.ids_synced = set(synced)
+                    failed.append(str(instance.id))
+                    continue
+
+                if instance_changed_fields:
+                    changed_fields[instance.pk] = instance_changed_fields
+                else:
+                    unchanged.append(str(instance.id))
+
+            def update(objects):
+                update_fields = sorted(set().union(*(changed_fields[obj.pk] for obj in objects)))
+                self.model.objects.bulk_update(objects, update_fields)
+
+            to_update = [instance for instance in instances if instance.pk in changed_fields]
+            batch_changed, batch_failed = apply_in_batches(to_update, update, batch_size)
+            changed.extend(str(instance.id) for instance in batch_changed)
+
+            for instance, error in batch_failed:
+                logger.error(
+                    f"Could not update record from datastore object {datafiles_in_store[str(instance.id)].cloud_path}. Check the metadata on that file. Error was: {str(error)}"
+                )
+                failed.append(str(instance.id))
+
+        self.store_comparison.ids_changed = set(changed)
+        self.store_comparison.ids_unchanged = set(unchanged)
+        self.store_comparison.ids_synced = set(changed + unchanged)
         self.store_comparison.ids_failed_to_sync = set(failed)
 
         return self
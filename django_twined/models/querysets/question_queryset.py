@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Prefetch
+from model_utils.managers import InheritanceQuerySet
+
+from django_twined.askers import ThreadAskers, asker_pool
+from django_twined.models.question_event_summaries import COALESCE_HEARTBEATS, get_heartbeat_mode
+from django_twined.models.service_usage_events import ServiceUsageEvent, get_prefetched_events_attribute
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_ASK_MAX_WORKERS = 8
+
+
+class QuestionAskReport:
+    """Tiny class simply present to hold the outcomes of asking many questions"""
+
+    def __init__(self):
+        self.asked = dict()
+        self.already_asked = set()
+        self.failed = dict()
+
+    @property
+    def outcomes(self):
+        """A dict of the outcome ("asked", "already_asked" or "failed") of asking each question, keyed on question id"""
+        outcomes = dict((question_id, "asked") for question_id in self.asked)
+        outcomes.update((question_id, "already_asked") for question_id in self.already_asked)
+        outcomes.update((question_id, "failed") for question_id in self.failed)
+        return outcomes
+
+    def __str__(self):
+        out = ""
+        for symbol in ["asked", "already_asked", "failed"]:
+            out += f"{symbol}: {getattr(self, symbol)}\n"
+        return out
+
+
+def _ask(question):
+    """Ask a question from a worker thread"""
+    try:
+        return question.ask(save=False)
+    finally:
+        # Close any connection opened by the worker thread, which would otherwise be left open
+        connections.close_all()
+
+
+class QuestionQuerySetMixin:
+    """A queryset mixin adding bulk operations on questions.
+    Either use QuestionQueryset directly, or use this to mix in additional queryset methods.
+    """
+
+    def ask_many(self, max_workers=None):
+        """Ask all the unasked questions in this queryset, concurrently
+
+        The service revision of each question is fetched up front, then each question is asked with its own
+        `ask(save=False)` method (so subclasses overriding `ask` are respected) through a thread pool, each of whose
+        threads has its own askers. The `asked` time of all successfully asked
+        questions is recorded with a single `bulk_update`. Questions that have already been asked are skipped, and
+        failure to ask one question doesn't prevent the others being asked.
+
+        :param int|None max_workers: The maximum number of questions to ask at once. Defaults to the `TWINED_QUESTION_ASK_MAX_WORKERS` setting, or 8.
+        :return QuestionAskReport: The outcome of asking each question
+        """
+        if max_workers is None:
+            max_workers = getattr(settings, "TWINED_QUESTION_ASK_MAX_WORKERS", DEFAULT_ASK_MAX_WORKERS)
+
+        report = QuestionAskReport()
+        unasked = list()
+
+        for question in self.select_subclasses():
+            if question.asked is not None:
+                report.already_asked.add(question.id)
+                continue
+
+            try:
+                # Fetched here rather than by the worker threads, which use their own database connections
+                question.get_service_revision()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception("Could not prepare question %s to be asked", question.id)
+                report.failed[question.id] = e
+                continue
+
+            unasked.append(question)
+
+        asked = list()
+        thread_askers = ThreadAskers(asker_pool)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, initializer=thread_askers.initialize_thread) as executor:
+                futures = dict((executor.submit(_ask, question), question) for question in unasked)
+
+                for future in as_completed(futures):
+                    question = futures[future]
+
+                    try:
+                        subscription, push_url = future.result()[:2]
+                    except Exception as e:  # pylint: disable=broad-except
+                        logger.exception("Could not ask question %s", question.id)
+                        report.failed[question.id] = e
+                        continue
+
+                    question.asked = question.asked or datetime.now(timezone.utc)
+                    asked.append(question)
+                    report.asked[question.id] = (subscription, push_url)
+        finally:
+            thread_askers.close()
+
+        if asked:
+            self.model._base_manager.bulk_update(asked, ["asked"])
+
+        return report
+
+    def with_events(self, kinds=None):
+        """Prefetch the service usage events of the questions in this queryset in one query, so the event accessors of
+        the questions (e.g. `question.result` or `question.latest_heartbeat`) don't each query the database. If
+        heartbeats are coalesced (see `TWINED_HEARTBEAT_MODE`), the questions' event summaries are fetched with them.
+
+        :param iter(str)|None kinds: the message kinds of the events to prefetch (e.g. `["result", "heartbeat"]`), or None to prefetch events of all kinds
+        :return QuestionQueryset:
+        """
+        events = ServiceUsageEvent.objects.order_by("publish_time", "id")
+
+        if kinds is not None:
+            kinds = set(kinds)
+            events = events.filter(message_kind__in=kinds)
+
+        queryset = self.prefetch_related(
+            Prefetch("service_usage_events", queryset=events, to_attr=get_prefetched_events_attribute(kinds))
+        )
+
+        if get_heartbeat_mode() == COALESCE_HEARTBEATS and (kinds is None or "heartbeat" in kinds):
+            queryset = queryset.select_related("event_summary")
+
+        return queryset
+
+
+class QuestionQueryset(QuestionQuerySetMixin, InheritanceQuerySet):
+    pass
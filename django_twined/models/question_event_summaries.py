@@ -0,0 +1,212 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+
+# Every heartbeat is stored as a service usage event
+STORE_HEARTBEATS = "store"
+
+# Only the latest heartbeat of each question is kept, in its event summary
+COALESCE_HEARTBEATS = "coalesce"
+
+HEARTBEAT_MODES = (STORE_HEARTBEATS, COALESCE_HEARTBEATS)
+
+# The count field of the summary incremented for events of each message kind
+SUMMARY_COUNT_FIELDS = {
+    "exception": "exception_count",
+    "log_record": "log_record_count",
+    "monitor_message": "monitor_message_count",
+}
+
+
+def get_heartbeat_mode():
+    """Get how received heartbeats are kept, as set by the `TWINED_HEARTBEAT_MODE` setting: either stored as service
+    usage events (`STORE_HEARTBEATS`, the default), or coalesced into the event summary of their question, keeping only
+    the latest (`COALESCE_HEARTBEATS`)
+
+    :raise ValueError: if the setting isn't a heartbeat mode
+    :return str:
+    """
+    mode = getattr(settings, "TWINED_HEARTBEAT_MODE", None) or STORE_HEARTBEATS
+
+    if mode not in HEARTBEAT_MODES:
+        raise ValueError(f"TWINED_HEARTBEAT_MODE must be one of {HEARTBEAT_MODES}, not {mode!r}.")
+
+    return mode
+
+
+class QuestionEventSummaryManager(models.Manager):
+    """A custom manager to maintain question event summaries as events are ingested"""
+
+    def record_events(self, events):
+        """Update the summaries of the questions that saved service usage events belong to, creating them if necessary
+
+        Each question's summary is updated with a single conditional update (incrementing counts and taking the
+        earliest or latest times), so events can be recorded concurrently and in any order. The summaries are updated in
+        order of question id, so that concurrent transactions recording events of the same questions lock their rows in
+        the same order, rather than deadlocking. Call this in the same transaction as the events are inserted.
+
+        Heartbeats don't need to be saved, as only their publish time and data are recorded (see `COALESCE_HEARTBEATS`).
+
+        :param list(django_twined.models.ServiceUsageEvent) events: saved service usage events (or unsaved heartbeats)
+        :return None:
+        """
+        changes = defaultdict(
+            lambda: {
+                "counts": defaultdict(int),
+                "times": defaultdict(list),
+                "result_event_id": None,
+                "acknowledgement": None,
+                "heartbeat": None,
+            }
+        )
+
+        for event in events:
+            change = changes[event.question_id]
+            change["times"]["last_event_time"].append(event.publish_time)
+
+            if event.message_kind in SUMMARY_COUNT_FIELDS:
+                change["counts"][SUMMARY_COUNT_FIELDS[event.message_kind]] += 1
+
+            elif event.message_kind == "delivery_acknowledgement":
+                change["times"]["delivery_acknowledgement_time"].append(event.publish_time)
+
+                if change["acknowledgement"] is None or event.publish_time < change["acknowledgement"].publish_time:
+                    change["acknowledgement"] = event
+
+            elif event.message_kind == "heartbeat":
+                if change["heartbeat"] is None or event.publish_time >= change["heartbeat"].publish_time:
+                    change["heartbeat"] = event
+
+            elif event.message_kind == "result" and change["result_event_id"] is None:
+                change["result_event_id"] = event.id
+
+        if not changes:
+            return
+
+        question_ids = sorted(changes, key=str)
+        self.bulk_create([self.model(question_id=question_id) for question_id in question_ids], ignore_conflicts=True)
+
+        for question_id in question_ids:
+            change = changes[question_id]
+            updates = dict((field, F(field) + count) for field, count in change["counts"].items())
+
+            for field, times in change["times"].items():
+                # The first acknowledgement is kept, while the other times are the latest received
+                if field == "delivery_acknowledgement_time":
+                    updates[field] = Least(Coalesce(field, Value(min(times))), Value(min(times)))
+                else:
+                    updates[field] = Greatest(Coalesce(field, Value(max(times))), Value(max(times)))
+
+            if change["result_event_id"] is not None:
+                updates["result_event_id"] = Coalesce("result_event_id", Value(change["result_event_id"]))
+
+            acknowledgement = change["acknowledgement"]
+
+            if acknowledgement is not None:
+                # The data is only replaced by an acknowledgement earlier than the recorded one
+                updates["delivery_acknowledgement_data"] = Case(
+                    When(
+                        Q(delivery_acknowledgement_time__isnull=True)
+                        | Q(delivery_acknowledgement_time__gt=acknowledgement.publish_time),
+                        then=Value(acknowledgement.data, output_field=models.JSONField()),
+                    ),
+                    default=F("delivery_acknowledgement_data"),
+                )
+
+            heartbeat = change["heartbeat"]
+
+            if heartbeat is not None:
+                # The data is only replaced by a heartbeat at least as late as the recorded one (compared to the time
+                # before this update, as all values in an update are computed from the row as it was)
+                updates["latest_heartbeat_data"] = Case(
+                    When(
+                        Q(latest_heartbeat_time__isnull=True) | Q(latest_heartbeat_time__lte=heartbeat.publish_time),
+                        then=Value(heartbeat.data, output_field=models.JSONField()),
+                    ),
+                    default=F("latest_heartbeat_data"),
+                )
+                updates["latest_heartbeat_time"] = Greatest(
+                    Coalesce("latest_heartbeat_time", Value(heartbeat.publish_time)), Value(heartbeat.publish_time)
+                )
+
+            self.filter(question_id=question_id).update(**updates)
+
+
+class QuestionEventSummary(models.Model):
+    """A summary of the service usage events received for a question, maintained as events are ingested
+
+    This allows the progress of questions to be displayed (e.g. in lists of questions) by reading one row per question,
+    rather than querying the events of each question.
+
+    Summaries are only updated as events are ingested (see `store_service_usage_events`), so their counts are of the
+    events ingested for each question, not of those stored: they don't include events created directly or written to a
+    sink other than the database, and aren't reduced when events are deleted (e.g. when they expire).
+    """
+
+    question = models.OneToOneField(
+        "django_twined.Question",
+        primary_key=True,
+        related_name="event_summary",
+        on_delete=models.CASCADE,
+        editable=False,
+    )
+
+    delivery_acknowledgement_time = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="When the question's delivery was acknowledged"
+    )
+
+    delivery_acknowledgement_data = models.JSONField(
+        null=True, blank=True, editable=False, help_text="The data of the question's delivery acknowledgement"
+    )
+
+    latest_heartbeat_time = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="When the latest heartbeat was received for the question"
+    )
+
+    latest_heartbeat_data = models.JSONField(
+        null=True, blank=True, editable=False, help_text="The data of the latest heartbeat received for the question"
+    )
+
+    result_event = models.ForeignKey(
+        "django_twined.ServiceUsageEvent",
+        null=True,
+        blank=True,
+        related_name="+",
+        # Events are deleted in bulk (e.g. for retention), so this mustn't constrain or slow their deletion
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        editable=False,
+        help_text="The result event for the question",
+    )
+
+    exception_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="The number of exceptions received"
+    )
+
+    log_record_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="The number of log records received"
+    )
+
+    monitor_message_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="The number of monitor messages received"
+    )
+
+    last_event_time = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="When the latest event was received for the question"
+    )
+
+    objects = QuestionEventSummaryManager()
+
+    class Meta:
+        """QuestionEventSummary meta class data"""
+
+        verbose_name_plural = "question event summaries"
+
+    def __str__(self):
+        return f"Event summary for question {self.question_id}"
+
+    def __repr__(self):
+        return f"Question Event Summary ({self.question_id})"
@@ -7,6 +7,8 @@ from model_utils.managers import InheritanceManager
 
 from django_twined.models.service_usage_events import QuestionEventsMixin
 
+from .querysets import QuestionQueryset
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,6 +31,9 @@ STATUS_MESSAGE_MAP = {
 STATUS_CHOICES = tuple((k, v) for k, v in STATUS_MESSAGE_MAP.items())
 
 
+QuestionManager = InheritanceManager.from_queryset(QuestionQueryset)
+
+
 class AbstractQuestion(models.Model):
     """Abstract Base Class for a Question model to store questions asked to octue services"""
 
@@ -37,14 +42,14 @@ class AbstractQuestion(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True)
     asked = models.DateTimeField(null=True, blank=True, editable=False, help_text="When the question was asked")
     answered = models.DateTimeField(null=True, blank=True, editable=False, help_text="When the question was answered")
-    status = models.IntegerField(default=-100, choices=STATUS_CHOICES)
+    status = models.IntegerField(default=-100, choices=STATUS_CHOICES, db_index=True)
 
     class Meta:
         """Metaclass for AbstractQuestion"""
 
         abstract = True
 
-    objects = InheritanceManager()
+    objects = QuestionManager()
 
     def __str__(self):
         return f"{self.id}"
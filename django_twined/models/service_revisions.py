@@ -1,13 +1,17 @@
 import logging
 
 from django.conf import settings
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
 from django_gcp.events.utils import get_event_url
 from octue.cloud.pub_sub.service import Service
 from octue.cloud.service_id import convert_service_id_to_pub_sub_form
-from octue.resources.service_backends import get_backend
+import packaging.specifiers
 import packaging.version
 
+from django_twined.askers import asker_pool, get_service_backend
+from django_twined.caches import get_cached_service_revision, invalidate_cached_service_revisions
+
+from .inserts import insert_ignoring_conflicts
 from .service_usage_events import QUESTION_RESPONSE_UPDATED
 
 logger = logging.getLogger(__name__)
@@ -15,21 +19,166 @@ logger = logging.getLogger(__name__)
 QUESTION_ASK_TIMEOUT_SECONDS = 60
 
 
+VERSION_SORT_KEY_MAX_LENGTH = 255
+VERSION_SORT_KEY_RELEASE_PARTS = 6
+VERSION_SORT_KEY_NUMBER_WIDTH = 10
+VERSION_SORT_KEY_PRE_RELEASE_CODES = {"a": "1", "b": "2", "rc": "3"}
+
+
+def get_version_sort_key(tag):
+    """Get a key for a revision tag that sorts (as a string) in the same order as the semantic versions it represents
+
+    The key is a fixed-width string of digits built from the epoch, release, pre-release, post-release and development
+    parts of the version, in the order that `packaging.version.Version` compares them, followed by any local version
+    label. This allows revisions to be ordered by version in the database.
+
+    :param str tag: the revision tag
+    :return str|None: the sort key, or None if the tag isn't a valid version or has parts too large to represent
+    """
+    try:
+        version = packaging.version.Version(tag)
+    except packaging.version.InvalidVersion:
+        return None
+
+    limit = 10**VERSION_SORT_KEY_NUMBER_WIDTH
+
+    # Versions differing only in trailing zeros of their release are equal, so these can be dropped to fit the key
+    release = list(version.release)
+    while len(release) > VERSION_SORT_KEY_RELEASE_PARTS and release[-1] == 0:
+        release.pop()
+
+    if len(release) > VERSION_SORT_KEY_RELEASE_PARTS:
+        return None
+
+    release += [0] * (VERSION_SORT_KEY_RELEASE_PARTS - len(release))
+
+    numbers = [version.epoch, *release, (version.pre or (None, 0))[1], version.post or 0, version.dev or 0]
+
+    if any(number >= limit for number in numbers):
+        return None
+
+    def number(value):
+        return str(value).zfill(VERSION_SORT_KEY_NUMBER_WIDTH)
+
+    # Development releases with no pre-release part sort before pre-releases, which sort before final releases
+    if version.pre is not None:
+        pre_release_code = VERSION_SORT_KEY_PRE_RELEASE_CODES[version.pre[0]]
+    elif version.dev is not None and version.post is None:
+        pre_release_code = "0"
+    else:
+        pre_release_code = "4"
+
+    key = "".join(
+        [
+            number(version.epoch),
+            *(number(part) for part in release),
+            pre_release_code,
+            number((version.pre or (None, 0))[1]),
+            "0" if version.post is None else "1",
+            number(version.post or 0),
+            "1" if version.dev is None else "0",
+            number(version.dev or 0),
+            "0" if version.local is None else "1",
+            version.local or "",
+        ]
+    )
+
+    return key[:VERSION_SORT_KEY_MAX_LENGTH]
+
+
+def _get_version_sort_key_bounds(specifier):
+    """Get inclusive (lower, upper) bounds on the version sort keys of versions that could match a specifier, either of
+    which may be None if unbounded. Bounds are deliberately loose; candidates must still be checked against the specifier.
+    """
+    operator, version = specifier.operator, specifier.version
+
+    if operator in (">=", ">"):
+        return get_version_sort_key(version), None
+
+    if operator in ("<=", "<"):
+        # Versions with any local label match `<=` without one, and their keys share a prefix
+        key = get_version_sort_key(version)
+        return None, None if key is None else key[:-1] + "2"
+
+    if operator == "~=" or (operator == "==" and version.endswith(".*")):
+        # Compatible releases (~=1.4.5) and prefix matches (==1.4.*) are bounded by the next release of the prefix
+        release = version[:-2] if operator == "==" else version
+        parsed = packaging.version.Version(release)
+        prefix = list(parsed.release if operator == "==" else parsed.release[:-1])
+        upper = ".".join(str(part) for part in prefix[:-1] + [prefix[-1] + 1])
+        lower = release if operator == "~=" else f"{release}.dev0"
+        epoch = f"{parsed.epoch}!" if parsed.epoch else ""
+        return get_version_sort_key(lower), get_version_sort_key(f"{epoch}{upper}.dev0")
+
+    if operator == "==":
+        key = get_version_sort_key(version)
+
+        if key is None or "+" in version:
+            return key, key
+
+        # Versions with any local label match a specifier without one, and their keys share a prefix
+        return key, key[:-1] + "2"
+
+    return None, None
+
+
+def get_service_revision_in_range(namespace, name, revision_range):
+    """Get the service revision with the latest semantic version revision tag that's within a range of versions
+
+    Candidate revisions are found in descending version order using the version sort key, within bounds derived from
+    the range, and checked against the range until one matches. As with `packaging`, pre-releases only match if there
+    are no matching final releases, unless the range explicitly includes a pre-release.
+
+    :param str namespace: The namespace within which the revision resides
+    :param str name: The name of the service
+    :param str revision_range: A version specifier, eg ">=1.2,<2"
+    :raise packaging.specifiers.InvalidSpecifier: if the range isn't a valid version specifier
+    :return Union[ServiceRevision | None]: The latest service revision within the range, or None if there isn't one
+    """
+    specifier_set = packaging.specifiers.SpecifierSet(revision_range)
+
+    candidates = ServiceRevision.objects.filter(namespace=namespace, name=name, version_sort_key__isnull=False)
+
+    for specifier in specifier_set:
+        lower, upper = _get_version_sort_key_bounds(specifier)
+
+        if lower is not None:
+            candidates = candidates.filter(version_sort_key__gte=lower)
+
+        if upper is not None:
+            candidates = candidates.filter(version_sort_key__lte=upper)
+
+    latest_pre_release = None
+
+    for candidate in candidates.order_by("-version_sort_key").iterator(chunk_size=100):
+        if not specifier_set.contains(candidate.tag, prereleases=True):
+            continue
+
+        if not packaging.version.Version(candidate.tag).is_prerelease or specifier_set.prereleases:
+            return candidate
+
+        if latest_pre_release is None:
+            latest_pre_release = candidate
+
+    return latest_pre_release
+
+
 def service_revision_is_latest_semantic_version(service_revision):
     """Determine if a service revision is the latest semantic version based on its revision tag.
 
     :param django_twined.models.service_revision.ServiceRevision service_revision: the service revision to check
     :return bool: `True` if the service revision is the latest semantic version according to its revision tag
     """
-    sorted_service_revisions = sorted(
-        [
-            *ServiceRevision.objects.filter(namespace=service_revision.namespace, name=service_revision.name),
-            service_revision,
-        ],
-        key=lambda revision: packaging.version.parse(revision.tag),
-    )
+    version_sort_key = get_version_sort_key(service_revision.tag)
+
+    if version_sort_key is None:
+        return False
 
-    return sorted_service_revisions[-1] == service_revision
+    return not ServiceRevision.objects.filter(
+        namespace=service_revision.namespace,
+        name=service_revision.name,
+        version_sort_key__gt=version_sort_key,
+    ).exists()
 
 
 def get_default_namespace():
@@ -89,6 +238,14 @@ class AbstractServiceRevision(models.Model):
         help_text="The service revision tag that helps to identify the unique deployment",
     )
 
+    version_sort_key = models.CharField(
+        max_length=VERSION_SORT_KEY_MAX_LENGTH,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="A key derived from the revision tag, which sorts in semantic version order (null if the tag isn't a valid version)",
+    )
+
     # GCP provider-specific - will become more flexible over time.
     project_name = models.CharField(
         max_length=80,
@@ -107,6 +264,14 @@ class AbstractServiceRevision(models.Model):
                 fields=["namespace", "name", "tag"],
                 name="unique_identifier",
             ),
+            models.UniqueConstraint(
+                fields=["namespace", "name"],
+                condition=models.Q(is_default=True),
+                name="one_default_per_service",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["namespace", "name", "version_sort_key"], name="service_revision_version_idx"),
         ]
 
     def natural_key(self):
@@ -174,11 +339,12 @@ class AbstractServiceRevision(models.Model):
                     "srid": self.id,  # Adding this (internal) ForeignKey enables creation of ServiceUsageEvents in one DB roundtrip, not two.
                     "sruid": self.sruid,
                 },
+                # Pushes are received by django-gcp's endpoint, unless the async endpoint is enabled
+                url_namespace="gcp-events" if getattr(settings, "TWINED_ASYNC_EVENT_QUEUE", None) is None else "events",
                 base_url=settings.TWINED_BASE_URL,
             )
 
-        backend = get_backend()(project_name=self.project_name)
-        asker = Service(backend=backend, name=asker_name)
+        asker = self.get_asker(asker_name)
 
         subscription, _ = asker.ask(
             service_id=self.sruid,
@@ -192,6 +358,21 @@ class AbstractServiceRevision(models.Model):
 
         return subscription, push_url
 
+    def get_asker(self, asker_name="django-twined"):
+        """Get an octue service with which to ask questions of this service revision. Askers are pooled per project
+        and asker name, so their clients and connections are reused across questions.
+
+        :param str asker_name: A name for this 'root service' that's asking the question.
+        :return octue.cloud.pub_sub.service.Service:
+        """
+        project_name = self.project_name
+
+        return asker_pool.get(
+            project_name,
+            asker_name,
+            factory=lambda: Service(backend=get_service_backend(project_name), name=asker_name),
+        )
+
     def __str__(self):
         return self.sruid
 
@@ -199,22 +380,46 @@ class AbstractServiceRevision(models.Model):
         return f"Service Revision ({self.sruid})"
 
     def save(self, *args, **kwargs):
-        """Override save method to ensure that there can be only one default service revision."""
+        """Override save method to ensure that there can be only one default service revision.
+
+        Making this revision the default unsets any other default for the service with a single conditional update in
+        the same transaction. The `one_default_per_service` constraint guarantees that concurrent registrations can't
+        leave two defaults; if one does, the default is unset and the save retried once.
+        """
+        self.version_sort_key = get_version_sort_key(self.tag)
+
+        try:
+            self._save_as_only_default(*args, **kwargs)
+        except IntegrityError as e:
+            if not self.is_default or _get_violated_constraint(e) != "one_default_per_service":
+                raise
+
+            # Another default was committed concurrently; it's now visible, so can be unset
+            self._save_as_only_default(*args, **kwargs)
+
+    def _save_as_only_default(self, *args, **kwargs):
         with transaction.atomic():
             if self.is_default:
-                previous_default = ServiceRevision.objects.filter(
+                other_defaults = type(self)._default_manager.filter(
                     namespace=self.namespace,
                     name=self.name,
                     is_default=True,
-                ).first()
+                )
+
+                if self.pk is not None:
+                    other_defaults = other_defaults.exclude(pk=self.pk)
 
-                if previous_default is not None:
-                    previous_default.is_default = False
-                    previous_default.save()
+                other_defaults.update(is_default=False)
 
             super().save(*args, **kwargs)
 
 
+def _get_violated_constraint(error):
+    """Get the name of the constraint violated in a database integrity error, if the database driver provides it"""
+    diagnostics = getattr(error.__cause__, "diag", None)
+    return getattr(diagnostics, "constraint_name", None)
+
+
 class ServiceRevision(AbstractServiceRevision):
     """Concrete model to register available service revisions in the system"""
 
@@ -230,4 +435,134 @@ def get_default_service_revision(namespace, name):
 
     """
 
-    return ServiceRevision.objects.filter(name=name, namespace=namespace, is_default=True).first()
+    return get_cached_service_revision(
+        namespace,
+        name,
+        None,
+        lambda: ServiceRevision.objects.filter(name=name, namespace=namespace, is_default=True).first(),
+    )
+
+
+def get_service_revision(namespace, name, tag=None):
+    """Get a service revision given a namespace/name/tag combination, or the default revision if no tag is given
+
+    Lookups are cached if the `TWINED_SERVICE_REVISION_CACHE` setting is enabled.
+
+    :param str namespace: The namespace within which the revision resides
+    :param str name: The name of the service
+    :param Union[str | None] tag: The revision tag, or None to get the default revision
+    :return Union[ServiceRevision | None]: The service revision, or None if there isn't one
+    """
+    if tag is None:
+        return get_default_service_revision(namespace, name)
+
+    return get_cached_service_revision(
+        namespace,
+        name,
+        tag,
+        lambda: ServiceRevision.objects.filter(namespace=namespace, name=name, tag=tag).first(),
+    )
+
+
+def get_latest_service_revision(namespace, name):
+    """Get the service revision with the latest semantic version revision tag for a namespace/name combination
+
+    Revisions whose tags aren't valid versions are ignored.
+
+    :param str namespace: The namespace within which the revision resides
+    :param str name: The name for which the latest revision will be returned
+    :return Union[ServiceRevision | None]: The latest service revision, or None if there isn't one
+    """
+    return (
+        ServiceRevision.objects.filter(namespace=namespace, name=name, version_sort_key__isnull=False)
+        .order_by("-version_sort_key")
+        .first()
+    )
+
+
+def register_service_revisions(entries, is_default_callback=None):
+    """Register many service revisions at once
+
+    New revisions are inserted in bulk, skipping revisions that are already registered (including any registered
+    concurrently, which are reported as already registered). Then, for each service, at most one revision is made the
+    default, in one swap: the last entry explicitly given `is_default=True` (whether or not its revision is new),
+    otherwise (if an `is_default_callback` is given) the last new revision without an explicit `is_default` value for
+    which the callback returns True once all the new revisions are registered. The callback is given saved revisions.
+
+    :param list(dict) entries: dicts with `namespace`, `name`, `tag` and (optionally) `is_default` keys
+    :param Union[callable | None] is_default_callback: a callable taking a service revision and returning whether it should be the default
+    :return list(dict): for each entry in order, a dict with the `status` of the entry ("created", or "already_registered" if the revision was registered before, concurrently or by an earlier entry) and whether the revision `is_default`
+    """
+    keys = [(entry["namespace"], entry["name"], entry["tag"]) for entry in entries]
+    query = models.Q(pk__in=[])
+
+    for namespace, name, tag in set(keys):
+        query |= models.Q(namespace=namespace, name=name, tag=tag)
+
+    with transaction.atomic():
+        existing = dict(
+            ((revision.namespace, revision.name, revision.tag), revision)
+            for revision in ServiceRevision.objects.filter(query)
+        )
+
+        new_revisions = dict()
+        for key in keys:
+            if key not in existing and key not in new_revisions:
+                namespace, name, tag = key
+                new_revisions[key] = ServiceRevision(
+                    namespace=namespace, name=name, tag=tag, version_sort_key=get_version_sort_key(tag)
+                )
+
+        inserted = insert_ignoring_conflicts(
+            ServiceRevision, list(new_revisions.values()), ["namespace", "name", "tag"]
+        )
+        inserted_keys = set((revision.namespace, revision.name, revision.tag) for revision in inserted)
+        new_revisions = dict((key, revision) for key, revision in new_revisions.items() if key in inserted_keys)
+
+        # Choose at most one new default per service
+        new_defaults = dict()
+        candidates = dict()
+
+        for key, entry in zip(keys, entries):
+            if entry.get("is_default") is True:
+                new_defaults[key[:2]] = key
+            elif key in new_revisions and entry.get("is_default") is None and is_default_callback is not None:
+                candidates.setdefault(key[:2], []).append(key)
+
+        for service, service_candidates in candidates.items():
+            if service in new_defaults:
+                continue
+
+            for key in reversed(service_candidates):
+                if is_default_callback(new_revisions[key]):
+                    new_defaults[service] = key
+                    break
+
+        for (namespace, name), (_, _, tag) in new_defaults.items():
+            ServiceRevision.objects.filter(namespace=namespace, name=name, is_default=True).exclude(tag=tag).update(
+                is_default=False
+            )
+            ServiceRevision.objects.filter(namespace=namespace, name=name, tag=tag).update(is_default=True)
+
+    # Bulk operations don't send signals, so invalidate cached revisions explicitly
+    for namespace, name in set(key[:2] for key in list(new_revisions) + list(new_defaults.values())):
+        invalidate_cached_service_revisions(namespace, name)
+
+    default_tags = dict((service, key[2]) for service, key in new_defaults.items())
+    results = []
+    reported = set()
+
+    for key in keys:
+        if key[:2] in default_tags:
+            is_default = default_tags[key[:2]] == key[2]
+        else:
+            is_default = key in existing and existing[key].is_default
+
+        if key in new_revisions and key not in reported:
+            results.append({"status": "created", "is_default": is_default})
+        else:
+            results.append({"status": "already_registered", "is_default": is_default})
+
+        reported.add(key)
+
+    return results
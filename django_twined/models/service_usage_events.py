@@ -3,6 +3,8 @@ import logging
 from django.db import models
 from django.db.models import Q
 
+from .question_event_summaries import COALESCE_HEARTBEATS, get_heartbeat_mode
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,6 +20,34 @@ SERVICE_USAGE_EVENT_KINDS = {
 
 SERVICE_USAGE_EVENT_KINDS_CHOICES = tuple((k, v) for k, v in SERVICE_USAGE_EVENT_KINDS.items())
 
+# Events prefetched for questions are stored in an attribute with this prefix, followed by the prefetched message kinds
+PREFETCHED_EVENTS_ATTRIBUTE_PREFIX = "_prefetched_events:"
+
+# The fields identifying the Pub/Sub message of an event, so that a redelivered message is only stored once
+UNIQUE_MESSAGE_FIELDS = ["message_id", "publish_time"]
+
+
+def get_prefetched_events_attribute(kinds=None):
+    """Get the name of the attribute that events of the given message kinds are prefetched into for each question
+
+    :param list(str)|None kinds: the prefetched message kinds, or None if events of all kinds are prefetched
+    :return str:
+    """
+    return PREFETCHED_EVENTS_ATTRIBUTE_PREFIX + ("*" if kinds is None else ",".join(sorted(kinds)))
+
+
+def get_message_kind(data):
+    """Get the kind of the octue message contained in the data of an event. This is backwards compatible with messages
+    created before the breaking change in version `0.7.0`, which used the `type` key instead of the `kind` key.
+
+    :param any data: the decoded data of the pub/sub message
+    :return str|None: the message kind, or None if the data isn't an octue message
+    """
+    if isinstance(data, dict):
+        return data.get("kind", None) or data.get("type", None)
+
+    return None
+
 
 class AbstractEvent(models.Model):
     """Abstract base model for storing events
@@ -53,7 +83,9 @@ class ServiceUsageEvent(AbstractEvent):
     in your main database.
 
     For high volume processing, you may wish not to store events at all, or you may wish to store in a different
-    database such as BigQuery. More helper tools for this coming soon.
+    database such as BigQuery (see the `TWINED_EVENT_SINK` setting). Alternatively, events can be expired according to their message kind (see the
+    `TWINED_EVENT_RETENTION` setting), and the table can be partitioned by month of publish time on PostgreSQL, using
+    the `manage_service_usage_events` management command.
 
     This table relates to concrete Question and Service Revision models. Null relations are
     not allowed, meaning that the table cannot store events not generated with django-twined
@@ -79,91 +111,199 @@ class ServiceUsageEvent(AbstractEvent):
         editable=False,
     )
 
+    message_kind = models.CharField(
+        max_length=50,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text="The kind of octue message contained in the event data (eg 'result' or 'heartbeat')",
+    )
+
+    message_id = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="The id of the Pub/Sub message the event was received in, used to ignore redelivered messages",
+    )
+
+    class Meta:
+        """ServiceUsageEvent meta class data"""
+
+        indexes = [
+            models.Index(fields=["question", "message_kind", "publish_time"], name="sue_question_kind_time_idx"),
+        ]
+        constraints = [
+            # A redelivered message has the same publish time, which (as the partition key) must be part of any unique
+            # constraint if the table is partitioned
+            models.UniqueConstraint(fields=UNIQUE_MESSAGE_FIELDS, name="sue_unique_message"),
+        ]
+
     def __str__(self):
         return str(self.kind)
 
     def __repr__(self):
         return f"Service Usage Event {self.kind}"
 
+    def save(self, *args, **kwargs):
+        """Override the save method to populate the message kind from the event data, if not already set"""
+        if self.message_kind is None:
+            self.message_kind = get_message_kind(self.data)
+
+        super().save(*args, **kwargs)
+
 
 class QuestionEventsMixin:
     """A mixin for the `Question` subclass providing helpers for retrieval of specific message kinds. These methods are
     backwards compatible with database entries created before the breaking change in version `0.7.0` was introduced,
-    allowing the new and old formats of JSON data stored in the events to be accessed.
+    because the `message_kind` column is populated from either the old `type` key or the new `kind` key of the event
+    data.
+
+    If events have been prefetched for the question (see `QuestionQuerySetMixin.with_events`), events of the prefetched
+    kinds are taken from the prefetched events (as lists rather than querysets) instead of querying the database.
     """
 
     @property
     def delivery_acknowledgement(self):
         """Get the delivery acknowledgement for the question.
 
-        :return django_twined.models.querysets.datastore_queryset.DatastoreQueryset:
+        :return django_twined.models.ServiceUsageEvent|None:
         """
-        try:
-            return self.service_usage_events.get(self._get_event_filter("delivery_acknowledgement"))
-        except ServiceUsageEvent.DoesNotExist:
-            return None
-        except ServiceUsageEvent.MultipleObjectsReturned:
-            logger.warning(
-                "MultipleObjectsReturned detected for delivery_acknowledgement ServiceUsageEvent on question %s",
-                self.id,
-            )
-            return self.service_usage_events.filter(self._get_event_filter("delivery_acknowledgement")).first()
+        prefetched = self._get_prefetched_events("delivery_acknowledgement")
+
+        if prefetched is not None:
+            return prefetched[0] if prefetched else None
+
+        return self._get_first_event("delivery_acknowledgement")
 
     @property
     def exceptions(self):
         """Get any exceptions raised by the child service during processing of the question.
 
-        :return django_twined.models.querysets.datastore_queryset.DatastoreQueryset:
+        :return django.db.models.QuerySet|list(django_twined.models.ServiceUsageEvent):
         """
+        prefetched = self._get_prefetched_events("exception")
+
+        if prefetched is not None:
+            return prefetched
+
         return self.service_usage_events.order_by("publish_time").filter(self._get_event_filter("exception")).all()
 
     @property
     def result(self):
         """Get the result produced by the child service in response to the question.
 
-        :return django_twined.models.querysets.datastore_queryset.DatastoreQueryset:
+        :return django_twined.models.ServiceUsageEvent|None:
         """
-        try:
-            return self.service_usage_events.get(self._get_event_filter("result"))
-        except ServiceUsageEvent.DoesNotExist:
-            return None
-        except ServiceUsageEvent.MultipleObjectsReturned:
-            logger.warning("MultipleObjectsReturned detected for result ServiceUsageEvent on question %s", self.id)
-            return self.service_usage_events.filter(self._get_event_filter("result")).first()
+        prefetched = self._get_prefetched_events("result")
+
+        if prefetched is not None:
+            return prefetched[0] if prefetched else None
+
+        return self._get_first_event("result")
 
     @property
     def log_records(self):
         """Get any log records produced by the child service processing the question.
 
-        :return django_twined.models.querysets.datastore_queryset.DatastoreQueryset:
+        :return django.db.models.QuerySet|list(django_twined.models.ServiceUsageEvent):
         """
+        prefetched = self._get_prefetched_events("log_record")
+
+        if prefetched is not None:
+            return prefetched
+
         return self.service_usage_events.order_by("publish_time").filter(self._get_event_filter("log_record")).all()
 
     @property
     def monitor_messages(self):
         """Get any monitor messages produced by the child service processing the question.
 
-        :return django_twined.models.querysets.datastore_queryset.DatastoreQueryset:
+        :return django.db.models.QuerySet|list(django_twined.models.ServiceUsageEvent):
         """
+        prefetched = self._get_prefetched_events("monitor_message")
+
+        if prefetched is not None:
+            return prefetched
+
         return (
             self.service_usage_events.order_by("publish_time").filter(self._get_event_filter("monitor_message")).all()
         )
 
     @property
     def latest_heartbeat(self):
-        """Get the latest heartbeat of the child service processing the question.
+        """Get the latest heartbeat of the child service processing the question. If heartbeats are coalesced (see
+        `TWINED_HEARTBEAT_MODE`), this is an unsaved event made from the question's event summary, unless the summary
+        doesn't hold a heartbeat (e.g. for heartbeats stored before heartbeats were coalesced).
 
-        :return django_twined.models.querysets.datastore_queryset.DatastoreQueryset:
+        :return django_twined.models.ServiceUsageEvent|None:
         """
+        if get_heartbeat_mode() == COALESCE_HEARTBEATS:
+            heartbeat = self._get_coalesced_heartbeat()
+
+            if heartbeat is not None:
+                return heartbeat
+
+        prefetched = self._get_prefetched_events("heartbeat")
+
+        if prefetched is not None:
+            return prefetched[-1] if prefetched else None
+
         return self.service_usage_events.order_by("-publish_time").filter(self._get_event_filter("heartbeat")).first()
 
+    def _get_coalesced_heartbeat(self):
+        """Get the latest heartbeat recorded in the question's event summary, as an unsaved event.
+
+        :return django_twined.models.ServiceUsageEvent|None:
+        """
+        summary = getattr(self, "event_summary", None)
+
+        if summary is None or summary.latest_heartbeat_time is None or summary.latest_heartbeat_data is None:
+            return None
+
+        return ServiceUsageEvent(
+            data=summary.latest_heartbeat_data,
+            kind=QUESTION_RESPONSE_UPDATED,
+            message_kind="heartbeat",
+            publish_time=summary.latest_heartbeat_time,
+            question_id=self.id,
+            service_revision_id=self.service_revision_id,
+        )
+
+    def _get_first_event(self, kind):
+        """Get the first event of the given message kind received for the question. Redelivered messages aren't stored
+        again, but events stored before message ids were recorded may be duplicated, so the earliest is used.
+
+        :param str kind: the message kind
+        :return django_twined.models.ServiceUsageEvent|None:
+        """
+        return self.service_usage_events.filter(self._get_event_filter(kind)).order_by("publish_time", "id").first()
+
+    def _get_prefetched_events(self, kind):
+        """Get the events of the given message kind prefetched for the question, in order of publish time.
+
+        :param str kind: the message kind
+        :return list(django_twined.models.ServiceUsageEvent)|None: the prefetched events, or None if events of the kind haven't been prefetched
+        """
+        for attribute, events in vars(self).items():
+            if not attribute.startswith(PREFETCHED_EVENTS_ATTRIBUTE_PREFIX):
+                continue
+
+            kinds = attribute[len(PREFETCHED_EVENTS_ATTRIBUTE_PREFIX) :]
+
+            if kinds == "*" or kind in kinds.split(","):
+                return [event for event in events if event.message_kind == kind]
+
+        return None
+
     def _get_event_filter(self, data_type_or_kind):
-        """Get a filter for `ServiceUsageEvent` model instances that filters the JSON data of the `data` field for the
-        given event kind using either the old `type` key or the new `kind` key. This maintains backwards compatibility
-        with service usage events created before the breaking change in version `0.7.0` was introduced, allowing the new
-        and old formats of the JSON data stored in the events to be accessed.
+        """Get a filter for `ServiceUsageEvent` model instances of the given message kind. This uses the indexed
+        `message_kind` column, which is populated from either the old `type` key or the new `kind` key of the event data
+        so maintains backwards compatibility with service usage events created before the breaking change in version
+        `0.7.0` was introduced.
 
         :param str data_type_or_kind: the name of the event type/kind to filter for
         :return django.db.models.query_utils.Q:
         """
-        return Q(data__type=data_type_or_kind) | Q(data__kind=data_type_or_kind)
+        return Q(message_kind=data_type_or_kind)
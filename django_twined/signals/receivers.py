@@ -1,19 +1,16 @@
 import logging
 
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django_gcp.events.signals import event_received
-from django_gcp.events.utils import decode_pubsub_message
-
-from django_twined.models import QUESTION_ASKED, QUESTION_RESPONSE_UPDATED, ServiceUsageEvent
-from django_twined.signals.senders import (
-    delivery_acknowledgement_received,
-    exception_received,
-    heartbeat_received,
-    log_record_received,
-    monitor_message_received,
-    question_asked,
-    result_received,
-)
+
+from django_twined.askers import asker_pool
+from django_twined.caches import invalidate_cached_service_revisions, reset_service_revision_cache
+from django_twined.events import get_event_sink, reset_async_event_queue, reset_event_buffer, reset_event_sink
+from django_twined.events.decoding import decode_pubsub_message, make_service_usage_event
+from django_twined.models import QUESTION_ASKED, QUESTION_RESPONSE_UPDATED, ServiceRevision
+from django_twined.models.datastores import clear_resolved_stores
 
 logger = logging.getLogger(__name__)
 
@@ -31,47 +28,45 @@ def receive_event(sender, event_kind, event_reference, event_payload, event_para
     if event_kind in (QUESTION_ASKED, QUESTION_RESPONSE_UPDATED):
         decoded = decode_pubsub_message(event_payload)
 
-        logger.debug(
-            "Storing ServiceUsageEvent from event_kind %s, event_reference %s, from sender %s - PubSub message_id %s, ordering_key %s, publish_time %s, subscription %s",
-            event_kind,
-            event_reference,
-            sender,
-            decoded["message_id"],
-            decoded["ordering_key"],
-            decoded["publish_time"],
-            decoded["subscription"],
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Storing ServiceUsageEvent from event_kind %s, event_reference %s, from sender %s - PubSub message_id %s, ordering_key %s, publish_time %s, subscription %s",
+                event_kind,
+                event_reference,
+                sender,
+                decoded["message_id"],
+                decoded["ordering_key"],
+                decoded["publish_time"],
+                decoded["subscription"],
+            )
 
-        sue = ServiceUsageEvent.objects.create(
-            data=decoded["data"],
-            kind=event_kind,
-            publish_time=decoded["publish_time"],
-            question_id=event_reference,
-            service_revision_id=event_parameters["srid"],
-        )
+        get_event_sink().write(make_service_usage_event(event_kind, event_reference, decoded, event_parameters))
 
-        event_kind = decoded["data"].get("kind", None)
 
-        if event_kind == "delivery_acknowledgement":
-            delivery_acknowledgement_received.send(sender=ServiceUsageEvent, service_usage_event=sue)
+@receiver(setting_changed)
+def reset_on_setting_changed(setting, **kwargs):
+    """Discard process-wide state derived from settings when those settings change (e.g. in tests)"""
+    if setting == "TWINED_EVENT_BUFFER":
+        reset_event_buffer(flush=False)
 
-        elif event_kind == "exception":
-            exception_received.send(sender=ServiceUsageEvent, service_usage_event=sue)
+    elif setting == "TWINED_ASYNC_EVENT_QUEUE":
+        reset_async_event_queue()
 
-        elif event_kind == "heartbeat":
-            heartbeat_received.send(sender=ServiceUsageEvent, service_usage_event=sue)
+    elif setting == "TWINED_EVENT_SINK":
+        reset_event_sink()
 
-        elif event_kind == "log_record":
-            log_record_received.send(sender=ServiceUsageEvent, service_usage_event=sue)
+    elif setting == "TWINED_SERVICE_BACKEND":
+        asker_pool.close()
 
-        elif event_kind == "monitor_message":
-            monitor_message_received.send(sender=ServiceUsageEvent, service_usage_event=sue)
+    elif setting == "TWINED_DATA_STORES":
+        clear_resolved_stores()
 
-        elif event_kind == "result":
-            result_received.send(sender=ServiceUsageEvent, service_usage_event=sue)
+    elif setting == "TWINED_SERVICE_REVISION_CACHE":
+        reset_service_revision_cache()
 
-        elif event_kind == QUESTION_ASKED:
-            question_asked.send(sender=ServiceUsageEvent, service_usage_event=sue)
 
-        else:
-            logger.warning("Unknown event kind: (%s) for ServiceUsageEvent %s", event_kind, sue.id)
+@receiver(post_save, sender=ServiceRevision)
+@receiver(post_delete, sender=ServiceRevision)
+def invalidate_service_revision_cache(sender, instance, **kwargs):
+    """Remove cached revisions of a service when any of its revisions change"""
+    invalidate_cached_service_revisions(instance.namespace, instance.name)
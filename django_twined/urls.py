@@ -1,8 +1,10 @@
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
-from django_twined.views import service_revision
+from django_twined.views import service_revision, service_revisions_bulk, service_usage_events
 
 urlpatterns = [
+    path(r"services/bulk", csrf_exempt(service_revisions_bulk), name="services-bulk"),
     path(r"services/<namespace>/<name>", csrf_exempt(service_revision), name="services"),
+    path(r"events/<event_kind>/<event_reference>", service_usage_events, name="events"),
 ]
@@ -1,9 +1,29 @@
+import asyncio
+import hashlib
 import json
+import logging
 
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django_gcp.exceptions import InvalidPubSubMessageError
+from packaging.specifiers import InvalidSpecifier
+
+from django_twined.events.decoding import decode_pubsub_message, make_service_usage_event
+from django_twined.events.queues import get_async_event_queue
+from django_twined.models import QUESTION_ASKED, QUESTION_RESPONSE_UPDATED
+from django_twined.models.service_revisions import (
+    ServiceRevision,
+    get_service_revision,
+    get_service_revision_in_range,
+    register_service_revisions,
+    service_revision_is_latest_semantic_version,
+)
+
+logger = logging.getLogger(__name__)
 
-from django_twined.models.service_revisions import ServiceRevision, service_revision_is_latest_semantic_version
 
 SERVICE_REVISION_IS_DEFAULT_CALLBACK = getattr(
     settings,
@@ -12,9 +32,21 @@ SERVICE_REVISION_IS_DEFAULT_CALLBACK = getattr(
 )
 
 
+def _conditional_json_response(request, data):
+    """Respond with JSON data and an ETag for it, or with 304 Not Modified if the client already has the same data"""
+    etag = quote_etag(hashlib.md5(json.dumps(data, sort_keys=True).encode(), usedforsecurity=False).hexdigest())
+    response = get_conditional_response(request, etag=etag) or JsonResponse(data, status=200)
+    response["ETag"] = etag
+    return response
+
+
 def service_revision(request, namespace, name):
     """Get or create a service revision. If the revision tag isn't provided when getting a service revision, the default
     service revision is returned. This is the service revision with the latest semantic version revision tag by default.
+    Alternatively, a revision range (a version specifier like `>=1.2,<2`) can be given when getting a service revision,
+    to get the revision with the latest semantic version within that range.
+
+    Responses to GET requests carry an ETag, so clients can cache them and revalidate with `If-None-Match`.
 
     :param django.core.handlers.wsgi.WSGIRequest request:
     :param str namespace: the namespace of the service
@@ -22,26 +54,34 @@ def service_revision(request, namespace, name):
     :return django.http.response.JsonResponse:
     """
     if request.method == "GET":
-        # TODO: We can add support for version ranges here later.
         revision_tag = request.GET.get("revision_tag")
+        revision_range = request.GET.get("revision_range")
+
+        if revision_tag and revision_range:
+            return JsonResponse(
+                {"error": "Only one of a revision tag or a revision range can be given."},
+                status=400,
+            )
 
-        try:
-            if revision_tag:
-                revision = ServiceRevision.objects.get(namespace=namespace, name=name, tag=revision_tag)
-            else:
-                revision = ServiceRevision.objects.get(namespace=namespace, name=name, is_default=True)
+        if revision_range:
+            try:
+                revision = get_service_revision_in_range(namespace, name, revision_range)
+            except InvalidSpecifier:
+                return JsonResponse({"error": f"Invalid revision range: {revision_range!r}."}, status=400)
+        else:
+            revision = get_service_revision(namespace, name, revision_tag or None)
 
-        except ServiceRevision.DoesNotExist:
+        if revision is None:
             return JsonResponse({"error": "Service revision not found."}, status=404)
 
-        return JsonResponse(
+        return _conditional_json_response(
+            request,
             {
                 "namespace": namespace,
                 "name": name,
                 "revision_tag": revision.tag,
                 "is_default": revision.is_default,
             },
-            status=200,
         )
 
     if request.method == "POST":
@@ -64,3 +104,104 @@ def service_revision(request, namespace, name):
         return JsonResponse({}, status=201)
 
     return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+def service_revisions_bulk(request):
+    """Register many service revisions at once. The request body must be a list of objects with `namespace`, `name`
+    and `revision_tag` keys, and optionally an `is_default` key. At most one new revision per service is made the
+    default: the last one given `is_default: true`, or otherwise as decided by the default callback (by default, the
+    new revision with the latest semantic version, if it's the latest for the service).
+
+    :param django.core.handlers.wsgi.WSGIRequest request:
+    :return django.http.response.JsonResponse: the status of each entry in the request, in order
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+    try:
+        body = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "The request body must be valid JSON."}, status=400)
+
+    if not isinstance(body, list):
+        return JsonResponse({"error": "The request body must be a list of service revisions."}, status=400)
+
+    results = [None] * len(body)
+    entries = []
+    indices = []
+
+    for index, entry in enumerate(body):
+        missing = [
+            key for key in ("namespace", "name", "revision_tag") if not isinstance(entry, dict) or not entry.get(key)
+        ]
+
+        if missing:
+            results[index] = {"status": "invalid", "error": f"Missing {', '.join(missing)}."}
+            continue
+
+        entries.append(
+            {
+                "namespace": entry["namespace"],
+                "name": entry["name"],
+                "tag": entry["revision_tag"],
+                "is_default": entry.get("is_default"),
+            }
+        )
+        indices.append(index)
+
+    for index, result in zip(indices, register_service_revisions(entries, SERVICE_REVISION_IS_DEFAULT_CALLBACK)):
+        results[index] = result
+
+    for entry, result in zip(body, results):
+        if isinstance(entry, dict):
+            result.update(
+                (key, entry[key]) for key in ("namespace", "name", "revision_tag") if entry.get(key) is not None
+            )
+
+    return JsonResponse({"results": results}, status=200)
+
+
+async def service_usage_events(request, event_kind, event_reference):
+    """Receive a service usage event pushed from Pub/Sub, without waiting for it to be stored. The event is put on the
+    async event queue (see `get_async_event_queue`), which writes events to the event sink in batches, and the push is
+    acknowledged immediately. This is an alternative to django-gcp's (synchronous) events endpoint for projects served
+    with ASGI, enabled by the `TWINED_ASYNC_EVENT_QUEUE` setting.
+
+    If the setting isn't enabled, pushes are rejected with 404 Not Found. If the request isn't served with ASGI, or the
+    queue is full, the push is rejected with 503 Service Unavailable, so that Pub/Sub redelivers it later. (Under WSGI,
+    each request is run on its own event loop, which ends before the queue is written, so events could be lost.)
+
+    :param django.core.handlers.asgi.ASGIRequest request:
+    :param str event_kind: the kind of the event (e.g. `QUESTION_RESPONSE_UPDATED`)
+    :param str event_reference: the id of the question the event is for
+    :return django.http.response.JsonResponse:
+    """
+    if getattr(settings, "TWINED_ASYNC_EVENT_QUEUE", None) is None:
+        return JsonResponse({"error": "Async receipt of events isn't enabled."}, status=404)
+
+    if not isinstance(request, ASGIRequest):
+        logger.error("Rejected a push to the async events endpoint, which must be served with ASGI")
+        return JsonResponse({"error": "Async receipt of events requires ASGI."}, status=503)
+
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+    if event_kind not in (QUESTION_ASKED, QUESTION_RESPONSE_UPDATED):
+        return JsonResponse({"error": f"Unknown event kind: {event_kind!r}."}, status=400)
+
+    try:
+        message = decode_pubsub_message(request.body)
+        event = make_service_usage_event(event_kind, event_reference, message, request.GET.dict())
+    except (InvalidPubSubMessageError, KeyError, TypeError, ValueError) as e:
+        return JsonResponse({"error": f"Invalid Pub/Sub message: {e}"}, status=400)
+
+    try:
+        get_async_event_queue().put(event)
+    except asyncio.QueueFull:
+        return JsonResponse({"error": "Too many events are waiting to be stored."}, status=503)
+
+    return JsonResponse({}, status=201)
+
+
+# Marked directly, as `csrf_exempt` only wraps async views as async views from django 5.0
+service_usage_events.csrf_exempt = True
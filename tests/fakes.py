@@ -0,0 +1,81 @@
+import json
+
+from google.api_core.exceptions import NotFound
+
+
+class FakeBlob:
+    """A stand-in for a google cloud storage blob, as returned by a bucket listing"""
+
+    def __init__(self, name, metadata=None, bucket=None):
+        self.name = name
+        self.metadata = metadata
+        self.bucket = bucket
+
+    def delete(self):
+        self.bucket.delete_blob(self.name)
+
+
+class FakeBlobListing:
+    """A stand-in for the paged iterator returned by `Client.list_blobs`"""
+
+    def __init__(self, pages, start):
+        self._pages = pages
+        self._start = start
+        self.next_page_token = None
+
+    @property
+    def pages(self):
+        for index in range(self._start, len(self._pages)):
+            self.next_page_token = str(index + 1) if index + 1 < len(self._pages) else None
+            yield iter(self._pages[index])
+
+
+class FakeBucket:
+    """A stand-in for a google cloud storage bucket, holding blobs in memory"""
+
+    def __init__(self, blobs=None):
+        self.blobs = dict((blob.name, blob) for blob in blobs or [])
+        for blob in self.blobs.values():
+            blob.bucket = self
+
+    def blob(self, name):
+        return self.blobs.get(name) or FakeBlob(name, bucket=self)
+
+    def delete_blob(self, name):
+        if self.blobs.pop(name, None) is None:
+            raise NotFound(f"No such object: {name}")
+
+
+class FakeClient:
+    """A stand-in for a google cloud storage client, listing the blobs of a fake bucket in name order"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.list_blobs_calls = 0
+
+    def list_blobs(self, bucket_or_name, prefix=None, page_size=1000, page_token=None):
+        self.list_blobs_calls += 1
+        names = sorted(name for name in self.bucket.blobs if name.startswith(prefix or ""))
+        blobs = [self.bucket.blobs[name] for name in names]
+        pages = [blobs[i : i + page_size] for i in range(0, len(blobs), page_size)]
+        return FakeBlobListing(pages, start=int(page_token or 0))
+
+
+class FakeStorage:
+    """A stand-in for a django-gcp storage, with an in-memory bucket"""
+
+    bucket_name = "test-django-twined-concrete-store"
+
+    def __init__(self, blobs=None):
+        self.bucket = FakeBucket(blobs)
+        self.client = FakeClient(self.bucket)
+
+
+def make_octue_metadata(id, tags=None, labels=None):
+    """Make blob metadata in the form octue stores it on cloud objects"""
+    return {
+        "octue__id": json.dumps(str(id)),
+        "octue__tags": json.dumps(tags or {}),
+        "octue__labels": json.dumps({"_type": "set", "items": list(labels or [])}),
+        "octue__sdk_version": json.dumps("0.63.0"),
+    }
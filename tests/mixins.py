@@ -1,6 +1,11 @@
+from datetime import datetime
 from io import StringIO
 
 from django.core.management import call_command
+from django_gcp.events.utils import get_event_url, make_pubsub_message
+
+from django_twined.models import QUESTION_RESPONSE_UPDATED, ServiceRevision
+from tests.server.example.models import QuestionWithValuesDatabaseStorage
 
 
 class CallCommandMixin:
@@ -21,3 +26,31 @@ class CallCommandMixin:
             **kwargs,
         )
         return out, err
+
+
+class PushEventsMixin:
+    """Mixin providing a question to push events for, and self._push to push them to the events endpoint"""
+
+    def setUp(self):
+        self.sr = ServiceRevision.objects.create(
+            project_name="gargantuan-gibbons", namespace="large-gibbons", name="gibbon-analyser", tag="1.0.0"
+        )
+        self.q = QuestionWithValuesDatabaseStorage.objects.create(service_revision=self.sr)
+
+    def _push(self, data, publish_time=None, message_id=None):
+        """Push a pub/sub message with the given data to the events endpoint for the question"""
+        push_url = get_event_url(
+            event_kind=QUESTION_RESPONSE_UPDATED,
+            event_reference=self.q.id,
+            event_parameters={"srid": self.sr.id, "sruid": self.sr.sruid},
+            base_url="",
+        )
+
+        msg = make_pubsub_message(
+            data,
+            "projects/my-project/subscriptions/my-subscription-name",
+            publish_time=publish_time or datetime.now(),
+            message_id=message_id,
+        )
+        response = self.client.post(push_url, data=msg, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
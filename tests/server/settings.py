@@ -109,7 +109,7 @@ TWINED_DEFAULT_TAG = "test-default-tag"
 
 TWINED_DATA_STORES = {
     "django-twined-concrete-store": {
-        "model": "tests.server.example.ConcreteSynchronisedDatastore",
+        "model": "example.ConcreteSynchronisedDatastore",
         "storage": "django_gcp.storage.GoogleCloudStorage",
         "storage_settings": {
             "bucket_name": "test-django-twined-concrete-store",
@@ -0,0 +1,131 @@
+# Disables for testing:
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from django_twined.askers import AskerPool, asker_pool
+from django_twined.models import Question, ServiceRevision
+from tests.server.example.models import QuestionWithValuesDatabaseStorage
+
+
+class FakeServiceBackend:
+    """A local service backend, allowing askers to be created without GCP credentials"""
+
+    def __init__(self, project_name):
+        self.project_name = project_name
+
+
+class MockService:
+    """A mock octue Service that records how it was created and can be closed"""
+
+    instances = []
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        self.closed = False
+        self.threads = set()
+        MockService.instances.append(self)
+
+    def ask(self, *args, **kwargs):
+        self.threads.add(threading.get_ident())
+        return ("subscription", "b")
+
+    def close(self):
+        self.closed = True
+
+
+@override_settings(TWINED_SERVICE_BACKEND="tests.test_askers.FakeServiceBackend")
+@patch("django_twined.models.service_revisions.Service", new=MockService)
+class ServiceRevisionAskerPoolTestCase(TestCase):
+    def setUp(self):
+        MockService.instances = []
+
+    def tearDown(self):
+        asker_pool.close()
+
+    def test_repeated_asks_reuse_asker(self):
+        """Ensure that only one asker is created for repeated asks of revisions in the same project."""
+        sr1 = ServiceRevision.objects.create(project_name="gargantuan-gibbons", name="gibbon-analyser", tag="1.0.0")
+        sr2 = ServiceRevision.objects.create(project_name="gargantuan-gibbons", name="gibbon-finder", tag="1.0.0")
+
+        for sr in (sr1, sr1, sr2):
+            sr.ask(question_id="a-question-id", push_url="https://my-server.com/push")
+
+        self.assertEqual(len(MockService.instances), 1)
+        self.assertIsInstance(MockService.instances[0].backend, FakeServiceBackend)
+        self.assertEqual(MockService.instances[0].backend.project_name, "gargantuan-gibbons")
+
+    def test_askers_are_keyed_on_project_and_asker_name(self):
+        """Ensure that different projects and asker names get different askers."""
+        sr1 = ServiceRevision.objects.create(project_name="gargantuan-gibbons", name="gibbon-analyser", tag="1.0.0")
+        sr2 = ServiceRevision.objects.create(project_name="tiny-tamarins", name="tamarin-analyser", tag="1.0.0")
+
+        self.assertIs(sr1.get_asker(), sr1.get_asker())
+        self.assertIsNot(sr1.get_asker(), sr2.get_asker())
+        self.assertIsNot(sr1.get_asker(), sr1.get_asker(asker_name="another-asker"))
+        self.assertEqual(len(asker_pool), 3)
+
+    def test_ask_many_uses_askers_per_thread(self):
+        """Ensure that threads asking many questions at once each use their own askers, which are closed afterwards."""
+        sr = ServiceRevision.objects.create(project_name="gargantuan-gibbons", name="gibbon-analyser", tag="1.0.0")
+
+        for _ in range(4):
+            QuestionWithValuesDatabaseStorage.objects.create(service_revision=sr)
+
+        report = Question.objects.all().ask_many(max_workers=2)
+
+        self.assertEqual(len(report.asked), 4)
+        self.assertTrue(1 <= len(MockService.instances) <= 2)
+
+        for asker in MockService.instances:
+            self.assertEqual(len(asker.threads), 1)
+            self.assertTrue(asker.closed)
+
+        self.assertEqual(len(asker_pool), 0)
+
+    def test_close(self):
+        """Ensure that closing the pool closes and removes its askers."""
+        sr = ServiceRevision.objects.create(project_name="gargantuan-gibbons", name="gibbon-analyser", tag="1.0.0")
+        asker = sr.get_asker()
+        asker_pool.close()
+
+        self.assertTrue(asker.closed)
+        self.assertEqual(len(asker_pool), 0)
+        self.assertIsNot(sr.get_asker(), asker)
+
+
+class AskerPoolTestCase(TestCase):
+    def test_concurrent_gets_create_one_asker(self):
+        """Ensure that concurrent requests for the same asker only create it once."""
+        pool = AskerPool()
+        created = []
+
+        def factory():
+            time.sleep(0.01)
+            created.append(object())
+            return created[-1]
+
+        threads = [threading.Thread(target=pool.get, args=("project", "asker", factory)) for _ in range(10)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(created), 1)
+
+    def test_askers_discarded_after_fork(self):
+        """Ensure that askers created in a parent process aren't reused in a forked child process."""
+        pool = AskerPool()
+        parent_asker = pool.get("project", "asker", object)
+
+        # Simulate being in a forked child process
+        pool._pid = -1
+
+        self.assertIsNot(pool.get("project", "asker", object), parent_asker)
@@ -0,0 +1,40 @@
+# Disables for testing:
+# pylint: disable=missing-docstring
+
+from datetime import datetime, timedelta
+import os
+import time
+from unittest import skipIf
+
+from django.test import TestCase
+
+from django_twined.models import ServiceUsageEvent
+from tests.mixins import PushEventsMixin
+
+SKIP_BENCHMARKS = not os.environ.get("RUN_BENCHMARKS", False)
+
+# The maximum mean time (in milliseconds) to receive an event, from push request to database row, before failing
+MAX_MILLISECONDS_PER_EVENT = float(os.environ.get("BENCHMARK_MAX_MILLISECONDS_PER_EVENT", 10))
+
+
+@skipIf(SKIP_BENCHMARKS, "Skipping benchmark - set RUN_BENCHMARKS to run it")
+class ReceiveEventBenchmarkTestCase(PushEventsMixin, TestCase):
+    def test_push_to_row(self):
+        """Time receiving log records through the events endpoint, from push request to stored row."""
+        count = 500
+        start_time = datetime(2024, 1, 1, 0, 0, 0, 1)
+        data = {"kind": "log_record", "log_record": {"msg": "A message " * 10, "levelname": "INFO", "args": [1, 2]}}
+
+        # Warm up
+        self._push(data, publish_time=start_time)
+
+        start = time.perf_counter()
+
+        for index in range(count):
+            self._push(data, publish_time=start_time + timedelta(seconds=index + 1))
+
+        milliseconds_per_event = (time.perf_counter() - start) * 1000 / count
+        print(f"Received {count} events at {milliseconds_per_event:.3f}ms per event")
+
+        self.assertEqual(ServiceUsageEvent.objects.count(), count + 1)
+        self.assertLess(milliseconds_per_event, MAX_MILLISECONDS_PER_EVENT)
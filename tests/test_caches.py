@@ -0,0 +1,108 @@
+# Disables for testing:
+# pylint: disable=missing-docstring
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from django_twined.caches import get_service_revision_cache
+from django_twined.models import ServiceRevision, get_default_service_revision, get_service_revision
+
+NAMESPACE = "my-org"
+NAME = "my-service"
+
+
+@override_settings(TWINED_SERVICE_REVISION_CACHE={"ttl_seconds": 60})
+class ServiceRevisionCacheTestCase(TestCase):
+    def setUp(self):
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="1.0.0", is_default=True)
+
+    def test_default_revision_is_cached(self):
+        """Ensure that repeated lookups of the default revision only query the database once."""
+        with self.assertNumQueries(1):
+            first = get_default_service_revision(NAMESPACE, NAME)
+            second = get_default_service_revision(NAMESPACE, NAME)
+
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertEqual(get_service_revision_cache().stats, {"hits": 1, "misses": 1})
+
+    def test_missing_revisions_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_service_revision(NAMESPACE, NAME, "2.0.0"))
+            self.assertIsNone(get_service_revision(NAMESPACE, NAME, "2.0.0"))
+
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="2.0.0")
+        self.assertEqual(get_service_revision(NAMESPACE, NAME, "2.0.0").tag, "2.0.0")
+
+    def test_new_default_invalidates_cache(self):
+        """Ensure that swapping the default revision of a service invalidates its cached revisions."""
+        get_default_service_revision(NAMESPACE, NAME)
+        get_service_revision(NAMESPACE, NAME, "1.0.0")
+
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="2.0.0", is_default=True)
+
+        self.assertEqual(get_default_service_revision(NAMESPACE, NAME).tag, "2.0.0")
+        self.assertFalse(get_service_revision(NAMESPACE, NAME, "1.0.0").is_default)
+
+    def test_save_invalidates_cache_once(self):
+        with patch.object(get_service_revision_cache(), "invalidate") as invalidate:
+            ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="2.0.0", is_default=True)
+
+        invalidate.assert_called_once_with(NAMESPACE, NAME)
+
+    def test_deletion_invalidates_cache(self):
+        get_default_service_revision(NAMESPACE, NAME)
+        ServiceRevision.objects.filter(namespace=NAMESPACE, name=NAME).delete()
+        self.assertIsNone(get_default_service_revision(NAMESPACE, NAME))
+
+    def test_entries_expire(self):
+        get_default_service_revision(NAMESPACE, NAME)
+
+        with patch("django_twined.caches.time.monotonic", return_value=10**9):
+            with self.assertNumQueries(1):
+                get_default_service_revision(NAMESPACE, NAME)
+
+    def test_other_services_are_unaffected_by_invalidation(self):
+        ServiceRevision.objects.create(namespace=NAMESPACE, name="another-service", tag="1.0.0", is_default=True)
+        get_default_service_revision(NAMESPACE, "another-service")
+
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="2.0.0", is_default=True)
+
+        with self.assertNumQueries(0):
+            get_default_service_revision(NAMESPACE, "another-service")
+
+    def test_view_uses_cache(self):
+        url = reverse("services", kwargs={"namespace": NAMESPACE, "name": NAME})
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.json()["revision_tag"], "1.0.0")
+
+    @override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "revisions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "revisions"},
+        },
+        TWINED_SERVICE_REVISION_CACHE={"ttl_seconds": 60, "cache_alias": "revisions"},
+    )
+    def test_django_cache_backend(self):
+        """Ensure that revisions can be cached in a django cache, and are invalidated there too."""
+        with self.assertNumQueries(1):
+            get_default_service_revision(NAMESPACE, NAME)
+            self.assertEqual(get_default_service_revision(NAMESPACE, NAME).tag, "1.0.0")
+
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="2.0.0", is_default=True)
+        self.assertEqual(get_default_service_revision(NAMESPACE, NAME).tag, "2.0.0")
+
+
+class ServiceRevisionCacheDisabledTestCase(TestCase):
+    def test_lookups_are_not_cached_by_default(self):
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="1.0.0", is_default=True)
+        self.assertIsNone(get_service_revision_cache())
+
+        with self.assertNumQueries(2):
+            get_default_service_revision(NAMESPACE, NAME)
+            get_default_service_revision(NAMESPACE, NAME)
@@ -0,0 +1,81 @@
+# Disables for testing:
+# pylint: disable=missing-docstring
+
+import base64
+from datetime import datetime
+import json
+import math
+
+from django.test import SimpleTestCase, TestCase
+from django_gcp.events import utils as django_gcp_utils
+from django_gcp.events.utils import make_pubsub_message
+from django_gcp.exceptions import InvalidPubSubMessageError
+
+from django_twined.events import send_service_usage_event_signal
+from django_twined.events.decoding import decode_pubsub_message, loads
+from django_twined.events.storage import SERVICE_USAGE_EVENT_SIGNALS
+from django_twined.models import ServiceUsageEvent
+
+SUBSCRIPTION = "projects/my-project/subscriptions/my-subscription-name"
+
+
+class DecodePubSubMessageTestCase(SimpleTestCase):
+    def _make_message(self, raw_data, **kwargs):
+        message = make_pubsub_message({}, SUBSCRIPTION, as_dict=True, **kwargs)
+        message["message"]["data"] = base64.b64encode(raw_data).decode()
+        return message
+
+    def test_same_as_django_gcp(self):
+        """Ensure that messages are decoded exactly as `django_gcp` decodes them."""
+        messages = [
+            make_pubsub_message({"kind": "heartbeat"}, SUBSCRIPTION, publish_time=datetime(2024, 1, 1, 0, 0, 0, 5)),
+            make_pubsub_message(
+                [1, 2.5, None], SUBSCRIPTION, as_dict=True, message_id="1", ordering_key="a", attributes={"b": "c"}
+            ),
+            self._make_message(b"just a string"),
+            self._make_message(b'{"big": 123456789012345678901234567890}'),
+            self._make_message('{"kind": "log_record", "msg": "é"}'.encode()),
+        ]
+
+        for message in messages:
+            with self.subTest(message=message):
+                self.assertEqual(decode_pubsub_message(message), django_gcp_utils.decode_pubsub_message(message))
+
+    def test_nan_decoded_as_standard_library_does(self):
+        self.assertTrue(math.isnan(decode_pubsub_message(self._make_message(b"NaN"))["data"]))
+        self.assertTrue(math.isnan(loads(b"NaN")))
+
+    def test_invalid_message(self):
+        with self.assertRaises(InvalidPubSubMessageError):
+            decode_pubsub_message({"message": {}, "subscription": SUBSCRIPTION})
+
+        with self.assertRaises(json.JSONDecodeError):
+            loads(b"{")
+
+
+class SendServiceUsageEventSignalTestCase(TestCase):
+    def test_signal_sent_for_each_kind(self):
+        for message_kind, signal in SERVICE_USAGE_EVENT_SIGNALS.items():
+            with self.subTest(message_kind=message_kind):
+                received = []
+
+                def handler(sender, service_usage_event, **kwargs):
+                    received.append(service_usage_event)
+
+                signal.connect(handler)
+
+                try:
+                    event = ServiceUsageEvent(message_kind=message_kind)
+                    send_service_usage_event_signal(event)
+                finally:
+                    signal.disconnect(handler)
+
+                self.assertEqual(received, [event])
+
+    def test_unknown_kind_logged(self):
+        with self.assertLogs("django_twined.events.storage", level="WARNING") as logs:
+            send_service_usage_event_signal(ServiceUsageEvent(id=3, message_kind="unknown"))
+
+        self.assertEqual(
+            logs.output, ["WARNING:django_twined.events.storage:Unknown event kind: (unknown) for ServiceUsageEvent 3"]
+        )
@@ -0,0 +1,253 @@
+# Disables for testing:
+# pylint: disable=missing-docstring
+
+import asyncio
+from datetime import datetime
+import json
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django_gcp.events.utils import make_pubsub_message
+
+from django_twined.askers import asker_pool
+from django_twined.events import (
+    AsyncServiceUsageEventQueue,
+    KindsFilterSink,
+    get_async_event_queue,
+    get_event_sink,
+    store_service_usage_event_batch,
+)
+from django_twined.models import QUESTION_RESPONSE_UPDATED, SUCCESS_STATUS, ServiceUsageEvent
+from django_twined.signals import heartbeat_received
+from tests.mixins import PushEventsMixin
+from tests.server.example.models import QuestionWithValuesDatabaseStorage
+
+
+@override_settings(TWINED_ASYNC_EVENT_QUEUE={"max_size": 3, "max_age_seconds": None})
+class AsyncEventQueueTestCase(PushEventsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Like django's test client, don't close the connection (and so the test's transaction) around each write
+        close_old_connections = patch("django_twined.events.queues.close_old_connections")
+        self.close_old_connections = close_old_connections.start()
+        self.addCleanup(close_old_connections.stop)
+
+    def _get_url(self, event_kind=QUESTION_RESPONSE_UPDATED):
+        return reverse("events", args=[event_kind, self.q.id]) + f"?srid={self.sr.id}"
+
+    async def _push_async(self, data, message_id=None, event_kind=QUESTION_RESPONSE_UPDATED, publish_time=None):
+        msg = make_pubsub_message(
+            data,
+            "projects/my-project/subscriptions/my-subscription-name",
+            publish_time=publish_time or datetime.now(),
+            message_id=message_id,
+        )
+        return await self.async_client.post(self._get_url(event_kind), data=msg, content_type="application/json")
+
+    async def test_push_acknowledged_before_event_stored(self):
+        """Ensure that pushes are acknowledged as soon as their events are queued, and stored on flush."""
+        response = await self._push_async({"kind": "heartbeat"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await ServiceUsageEvent.objects.acount(), 0)
+
+        await get_async_event_queue().flush()
+
+        event = await ServiceUsageEvent.objects.aget()
+        self.assertEqual(event.message_kind, "heartbeat")
+        self.assertEqual(event.question_id, self.q.id)
+        self.assertEqual(event.service_revision_id, self.sr.id)
+
+    async def test_events_stored_in_batches(self):
+        """Ensure that queued events are written in batches of at most the maximum size."""
+        with patch(
+            "django_twined.events.sinks.store_service_usage_event_batch", wraps=store_service_usage_event_batch
+        ) as store:
+            for i in range(5):
+                await self._push_async({"kind": "heartbeat"}, message_id=str(i))
+
+            await get_async_event_queue().flush()
+
+        self.assertEqual([len(call.args[0]) for call in store.call_args_list], [3, 2])
+        self.assertEqual(await ServiceUsageEvent.objects.acount(), 5)
+
+    async def test_result_written_without_flush(self):
+        """Ensure that a result (and the events queued before it) is written without waiting for the batch to fill."""
+        await self._push_async({"kind": "heartbeat"})
+        await self._push_async({"kind": "result", "output_values": [1]})
+
+        for _ in range(100):
+            if await ServiceUsageEvent.objects.acount() == 2:
+                break
+
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(await ServiceUsageEvent.objects.acount(), 2)
+        await self.q.arefresh_from_db()
+        self.assertEqual(self.q.status, SUCCESS_STATUS)
+
+    async def test_signals_sent_with_stored_events(self):
+        """Ensure that the per-kind signals are sent for queued events, with events that exist in the database."""
+        received = []
+
+        def handler(sender, service_usage_event, **kwargs):
+            received.append(service_usage_event.id)
+
+        heartbeat_received.connect(handler)
+        self.addCleanup(heartbeat_received.disconnect, handler)
+
+        await self._push_async({"kind": "heartbeat"})
+        await get_async_event_queue().flush()
+
+        self.assertEqual(received, [(await ServiceUsageEvent.objects.aget()).id])
+
+    async def test_old_connections_closed_around_writes(self):
+        """Ensure that failed or expired database connections are replaced before and after each batch is written, so
+        that the long-lived consumer doesn't keep using a lost connection.
+        """
+        calls = []
+        self.close_old_connections.side_effect = lambda: calls.append("close_old_connections")
+
+        with patch("django_twined.events.sinks.store_service_usage_event_batch") as store:
+            store.side_effect = lambda events: calls.append("store")
+            await self._push_async({"kind": "heartbeat"})
+            await get_async_event_queue().flush()
+
+        self.assertEqual(calls, ["close_old_connections", "store", "close_old_connections"])
+
+    async def test_events_written_to_configured_sink(self):
+        """Ensure that queued events are written through the event sink, rather than always to the database."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        with override_settings(
+            TWINED_EVENT_SINK={
+                "class": "django_twined.events.sinks.KindsFilterSink",
+                "kinds": ["heartbeat"],
+                "sink": {"class": "django_twined.events.sinks.JSONLSegmentSink", "directory": directory.name},
+            }
+        ):
+            self.assertIsInstance(get_event_sink(), KindsFilterSink)
+            await self._push_async({"kind": "heartbeat"})
+            await self._push_async({"kind": "log_record", "log_record": {"msg": "one"}})
+            await get_async_event_queue().flush()
+
+        (filename,) = os.listdir(directory.name)
+
+        with open(os.path.join(directory.name, filename)) as f:
+            self.assertEqual([json.loads(line)["message_kind"] for line in f], ["heartbeat"])
+
+        self.assertEqual((await ServiceUsageEvent.objects.aget()).message_kind, "log_record")
+
+    async def test_stopped_consumer_restarted(self):
+        """Ensure that events are still written after the consumer task is cancelled or fails."""
+        queue = get_async_event_queue()
+        await self._push_async({"kind": "heartbeat"}, message_id="1")
+        await queue.flush()
+        queue._task.cancel()
+        await asyncio.sleep(0)
+
+        await self._push_async({"kind": "heartbeat"}, message_id="2")
+        await queue.flush()
+        self.assertEqual(await ServiceUsageEvent.objects.acount(), 2)
+
+        # The consumer is waiting for an event in the existing `_get_batch()`, so is stopped for the patch to apply
+        queue._task.cancel()
+        await asyncio.sleep(0)
+
+        with patch.object(queue, "_get_batch", side_effect=RuntimeError("Oh no")):
+            with self.assertLogs("django_twined.events.queues", level="ERROR"):
+                await self._push_async({"kind": "heartbeat"}, message_id="3")
+
+                for _ in range(3):
+                    await asyncio.sleep(0)
+
+        self.assertTrue(queue._task.done())
+        await self._push_async({"kind": "heartbeat"}, message_id="4")
+        await queue.flush()
+        self.assertEqual(await ServiceUsageEvent.objects.acount(), 4)
+
+    async def test_redelivered_push_stored_once(self):
+        publish_time = datetime(2024, 1, 1, 0, 0, 0, 100000)
+        await self._push_async({"kind": "heartbeat"}, message_id="1", publish_time=publish_time)
+        await self._push_async({"kind": "heartbeat"}, message_id="1", publish_time=publish_time)
+        await get_async_event_queue().flush()
+
+        self.assertEqual(await ServiceUsageEvent.objects.acount(), 1)
+
+    async def test_invalid_pushes_rejected(self):
+        response = await self.async_client.post(
+            self._get_url(), data={"not": "pubsub"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = await self._push_async({"kind": "heartbeat"}, event_kind="something-else")
+        self.assertEqual(response.status_code, 400)
+
+        response = await self.async_client.get(self._get_url())
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(TWINED_ASYNC_EVENT_QUEUE=None)
+    async def test_push_rejected_when_not_enabled(self):
+        response = await self._push_async({"kind": "heartbeat"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_push_rejected_without_asgi(self):
+        """Ensure that pushes aren't acknowledged under WSGI, where each request has its own event loop, and so queued
+        events could be discarded before they're written.
+        """
+        msg = make_pubsub_message(
+            {"kind": "heartbeat"},
+            "projects/my-project/subscriptions/my-subscription-name",
+            publish_time=datetime.now(),
+        )
+
+        with patch("django_twined.views.get_async_event_queue") as get_queue:
+            with self.assertLogs("django_twined.views", level="ERROR"):
+                response = self.client.post(self._get_url(), data=msg, content_type="application/json")
+
+        self.assertEqual(response.status_code, 503)
+        get_queue.assert_not_called()
+
+    async def test_push_rejected_when_queue_full(self):
+        """Ensure that pushes are rejected, for Pub/Sub to redeliver later, while too many events are waiting."""
+        queue = Mock(put=Mock(side_effect=asyncio.QueueFull))
+
+        with patch("django_twined.views.get_async_event_queue", return_value=queue):
+            response = await self._push_async({"kind": "heartbeat"})
+
+        self.assertEqual(response.status_code, 503)
+
+    async def test_put_fails_beyond_max_pending(self):
+        queue = AsyncServiceUsageEventQueue(max_pending=1)
+        queue.put(ServiceUsageEvent(message_kind="heartbeat"))
+
+        with self.assertRaises(asyncio.QueueFull):
+            queue.put(ServiceUsageEvent(message_kind="heartbeat"))
+
+        queue._queue.get_nowait()
+        queue._queue.task_done()
+        await queue.close()
+
+    def test_questions_asked_with_async_push_url(self):
+        class MockService:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def ask(self, *args, **kwargs):
+                return ("subscription", "b")
+
+        self.addCleanup(asker_pool.close)
+
+        with patch("django_twined.models.service_revisions.Service", new=MockService):
+            question = QuestionWithValuesDatabaseStorage.objects.create(service_revision=self.sr)
+            _, push_url, _ = question.ask()
+
+        self.assertTrue(
+            push_url.startswith(
+                f"https://my-server.com/integrations/octue/events/{QUESTION_RESPONSE_UPDATED}/{question.id}"
+            )
+        )
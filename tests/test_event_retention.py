@@ -0,0 +1,157 @@
+# Disables for testing:
+# pylint: disable=missing-docstring
+
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from django_twined.events import store_service_usage_events
+from django_twined.events.partitions import (
+    convert_to_partitioned_table,
+    create_partitions,
+    drop_expired_partitions,
+    get_month_start,
+    get_partition_name,
+    get_partitions,
+    is_partitioned,
+)
+from django_twined.events.retention import delete_expired_events, get_retention_cutoff
+from django_twined.models import Question, ServiceRevision, ServiceUsageEvent
+from tests.mixins import CallCommandMixin
+
+NOW = datetime(2024, 6, 15, tzinfo=timezone.utc)
+
+
+class EventsMixin:
+    def setUp(self):
+        self.sr = ServiceRevision.objects.create(name="gibbon-analyser", tag="1.0.0")
+        self.q = Question.objects.create(service_revision=self.sr)
+
+    def _create_event(self, message_kind, publish_time):
+        return ServiceUsageEvent.objects.create(
+            data={"kind": message_kind},
+            kind="q-response-updated",
+            publish_time=publish_time,
+            question=self.q,
+            service_revision=self.sr,
+        )
+
+
+class EventRetentionTestCase(EventsMixin, TestCase):
+    def test_retention_cutoff(self):
+        retention = {"heartbeat": 7, "result": None, "*": 30}
+        self.assertEqual(get_retention_cutoff("heartbeat", retention, NOW), NOW - timedelta(days=7))
+        self.assertEqual(get_retention_cutoff("log_record", retention, NOW), NOW - timedelta(days=30))
+        self.assertIsNone(get_retention_cutoff("result", retention, NOW))
+        self.assertIsNone(get_retention_cutoff("heartbeat", {}, NOW))
+
+    def test_expired_events_deleted_by_kind(self):
+        old_heartbeat = NOW - timedelta(days=8)
+        self._create_event("heartbeat", old_heartbeat)
+        recent_heartbeat = self._create_event("heartbeat", NOW - timedelta(days=6))
+        old_log_record = self._create_event("log_record", NOW - timedelta(days=31))
+        recent_log_record = self._create_event("log_record", NOW - timedelta(days=8))
+        old_result = self._create_event("result", NOW - timedelta(days=365))
+
+        deleted = delete_expired_events(retention={"heartbeat": 7, "result": None, "*": 30}, now=NOW, batch_size=1)
+
+        self.assertEqual(deleted, {"heartbeat": 1, "*": 1})
+        self.assertEqual(
+            set(ServiceUsageEvent.objects.all()),
+            {recent_heartbeat, recent_log_record, old_result},
+        )
+        self.assertFalse(ServiceUsageEvent.objects.filter(id=old_log_record.id).exists())
+
+    def test_events_kept_without_retention(self):
+        self._create_event("heartbeat", NOW - timedelta(days=1000))
+        self.assertEqual(delete_expired_events(now=NOW), {})
+        self.assertEqual(ServiceUsageEvent.objects.count(), 1)
+
+
+class EventPartitionsTestCase(EventsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = datetime.now(timezone.utc)
+        self.existing_event = self._create_event("result", self.now - timedelta(days=400))
+        convert_to_partitioned_table()
+
+    def _count_in_partition(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(name)}")
+            return cursor.fetchone()[0]
+
+    def test_convert_keeps_events_and_ids(self):
+        table = ServiceUsageEvent._meta.db_table
+        self.assertTrue(is_partitioned())
+        self.assertEqual(
+            get_partitions(),
+            [(f"{table}_default", None), (f"{table}_legacy", get_month_start(self.now, months_ahead=1))],
+        )
+
+        self.assertEqual(ServiceUsageEvent.objects.get(), self.existing_event)
+        new_event = self._create_event("heartbeat", self.now)
+        self.assertGreater(new_event.id, self.existing_event.id)
+        self.assertEqual(self._count_in_partition(f"{table}_legacy"), 2)
+
+    def test_duplicate_messages_ignored_when_partitioned(self):
+        for _ in range(2):
+            store_service_usage_events(
+                [
+                    ServiceUsageEvent(
+                        data={"kind": "heartbeat"},
+                        kind="q-response-updated",
+                        message_kind="heartbeat",
+                        message_id="1",
+                        publish_time=self.now,
+                        question=self.q,
+                        service_revision=self.sr,
+                    )
+                ]
+            )
+
+        self.assertEqual(ServiceUsageEvent.objects.filter(message_id="1").count(), 1)
+
+    def test_future_partitions_created(self):
+        created = create_partitions(months_ahead=2, now=self.now)
+        self.assertEqual(
+            created,
+            [get_partition_name(get_month_start(self.now, months_ahead=months)) for months in (1, 2)],
+        )
+        self.assertEqual(create_partitions(months_ahead=2, now=self.now), [])
+
+        self._create_event("heartbeat", get_month_start(self.now, months_ahead=2) + timedelta(days=1))
+        self.assertEqual(self._count_in_partition(created[1]), 1)
+
+    def test_only_partitions_of_expired_events_dropped(self):
+        later = get_month_start(self.now, months_ahead=13)
+        heartbeat_partition, result_partition = create_partitions(months_ahead=2, now=self.now)[:2]
+        self._create_event("heartbeat", get_month_start(self.now, months_ahead=1))
+        self._create_event("heartbeat", get_month_start(self.now, months_ahead=2))
+        self._create_event("result", get_month_start(self.now, months_ahead=2))
+
+        dropped = drop_expired_partitions(retention={"heartbeat": 30, "result": None}, now=later)
+
+        self.assertEqual(dropped, [heartbeat_partition])
+        partition_names = [name for name, _ in get_partitions()]
+        self.assertNotIn(heartbeat_partition, partition_names)
+        self.assertIn(result_partition, partition_names)
+        self.assertEqual(ServiceUsageEvent.objects.filter(message_kind="result").count(), 2)
+
+
+class ManageServiceUsageEventsCommandTestCase(CallCommandMixin, EventsMixin, TestCase):
+    @override_settings(TWINED_EVENT_RETENTION={"heartbeat": 7})
+    def test_expired_events_deleted(self):
+        self._create_event("heartbeat", datetime.now(timezone.utc) - timedelta(days=8))
+        self._create_event("result", datetime.now(timezone.utc) - timedelta(days=8))
+
+        out, _ = self.callCommand("manage_service_usage_events")
+
+        self.assertIn("Deleted 1 expired 'heartbeat' events", out.getvalue())
+        self.assertEqual(ServiceUsageEvent.objects.get().message_kind, "result")
+
+    def test_convert(self):
+        out, _ = self.callCommand("manage_service_usage_events", "--convert", "--months-ahead", "1")
+        self.assertIn("Partitioned the service usage events table", out.getvalue())
+        self.assertIn("Created partition", out.getvalue())
+        self.assertTrue(is_partitioned())
@@ -0,0 +1,94 @@
+# Disables for testing:
+# pylint: disable=missing-docstring
+
+import json
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from django_twined.events import DatabaseSink, JSONLSegmentSink, KindsFilterSink, get_event_sink
+from django_twined.models import ServiceUsageEvent
+from django_twined.signals import heartbeat_received
+from tests.mixins import PushEventsMixin
+
+
+class EventSinksTestCase(PushEventsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _read_segments(self):
+        records = []
+
+        for filename in sorted(os.listdir(self.directory.name)):
+            with open(os.path.join(self.directory.name, filename)) as f:
+                records.extend(json.loads(line) for line in f)
+
+        return records
+
+    def test_database_sink_by_default(self):
+        self.assertIsInstance(get_event_sink(), DatabaseSink)
+        self._push({"kind": "heartbeat"})
+        self.assertEqual(ServiceUsageEvent.objects.get().message_kind, "heartbeat")
+
+    def test_jsonl_segments_roll_over_by_size(self):
+        with override_settings(
+            TWINED_EVENT_SINK={
+                "class": "django_twined.events.sinks.JSONLSegmentSink",
+                "directory": self.directory.name,
+                "max_segment_bytes": 1,
+            }
+        ):
+            self.assertIsInstance(get_event_sink(), JSONLSegmentSink)
+            self._push({"kind": "log_record", "log_record": {"msg": "one"}})
+            self._push({"kind": "log_record", "log_record": {"msg": "two"}})
+
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+        self.assertFalse(ServiceUsageEvent.objects.exists())
+
+        records = self._read_segments()
+        self.assertEqual([record["data"]["log_record"]["msg"] for record in records], ["one", "two"])
+        self.assertEqual(records[0]["message_kind"], "log_record")
+        self.assertEqual(records[0]["question_id"], str(self.q.id))
+        self.assertEqual(records[0]["service_revision_id"], str(self.sr.id))
+
+    def test_jsonl_segment_reused_until_full(self):
+        sink = JSONLSegmentSink(self.directory.name)
+        self.addCleanup(sink.close)
+
+        for _ in range(3):
+            sink.write(ServiceUsageEvent(kind="q-response-updated", data={}, publish_time="2024-01-01T00:00:00Z"))
+
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        self.assertEqual(len(self._read_segments()), 3)
+
+    def test_kinds_filter_routes_events_away_from_database(self):
+        received = []
+
+        def handler(sender, service_usage_event, **kwargs):
+            received.append(service_usage_event)
+
+        heartbeat_received.connect(handler)
+        self.addCleanup(heartbeat_received.disconnect, handler)
+
+        with override_settings(
+            TWINED_EVENT_SINK={
+                "class": "django_twined.events.sinks.KindsFilterSink",
+                "kinds": ["heartbeat", "log_record"],
+                "sink": {"class": "django_twined.events.sinks.JSONLSegmentSink", "directory": self.directory.name},
+            }
+        ):
+            self.assertIsInstance(get_event_sink(), KindsFilterSink)
+            self._push({"kind": "heartbeat"})
+            self._push({"kind": "log_record", "log_record": {"msg": "one"}})
+            self._push({"kind": "result", "output_values": {}})
+
+        self.assertEqual([record["message_kind"] for record in self._read_segments()], ["heartbeat", "log_record"])
+        self.assertEqual(ServiceUsageEvent.objects.get().message_kind, "result")
+        self.assertIsNotNone(self.q.result)
+
+        # Signals are still sent for events written to other sinks
+        self.assertEqual(len(received), 1)
+        self.assertIsNone(received[0].id)
@@ -54,3 +54,176 @@ class RemoveRegisteredServiceMigrationTestCase(MigratorTestCase):
         self.assertEqual(sr.namespace, "test-default-namespace")
         self.assertEqual(sr.project_name, "test-default-project-name")
         self.assertEqual(sr.tag, "test-default-tag")
+
+
+class BackfillMessageKindMigrationTestCase(MigratorTestCase):
+    """Test the migration that adds the message kind column to service usage events and backfills it."""
+
+    migrate_from = ("django_twined", "0014_question_status")
+    migrate_to = ("django_twined", "0015_serviceusageevent_message_kind")
+
+    def prepare(self):
+        """Prepare events in both the legacy (`type`) and current (`kind`) formats at migration 0014"""
+        ServiceRevision = self.old_state.apps.get_model("django_twined", "ServiceRevision")
+        Question = self.old_state.apps.get_model("django_twined", "Question")
+        ServiceUsageEvent = self.old_state.apps.get_model("django_twined", "ServiceUsageEvent")
+
+        sr = ServiceRevision.objects.create(name="test-name")
+        question = Question.objects.create(service_revision=sr)
+
+        for data in ({"type": "result"}, {"kind": "heartbeat"}, "not-an-octue-message"):
+            ServiceUsageEvent.objects.create(
+                data=data,
+                kind="q-response-updated",
+                publish_time="2024-01-01T00:00:00Z",
+                question=question,
+                service_revision=sr,
+            )
+
+    def test_message_kind_backfilled(self):
+        ServiceUsageEvent = self.new_state.apps.get_model("django_twined", "ServiceUsageEvent")
+        self.assertEqual(
+            set(ServiceUsageEvent.objects.values_list("message_kind", flat=True)),
+            {None, "heartbeat", "result"},
+        )
+
+
+class BackfillVersionSortKeyMigrationTestCase(MigratorTestCase):
+    """Test the migration that adds the version sort key to service revisions and backfills it."""
+
+    migrate_from = ("django_twined", "0015_serviceusageevent_message_kind")
+    migrate_to = ("django_twined", "0016_servicerevision_version_sort_key")
+
+    def prepare(self):
+        """Prepare service revisions at migration 0015"""
+        ServiceRevision = self.old_state.apps.get_model("django_twined", "ServiceRevision")
+
+        for tag in ("0.1.0", "11.0.0", "2.0.0", "latest"):
+            ServiceRevision.objects.create(name="test-name", tag=tag)
+
+    def test_version_sort_key_backfilled(self):
+        ServiceRevision = self.new_state.apps.get_model("django_twined", "ServiceRevision")
+        self.assertEqual(
+            list(ServiceRevision.objects.order_by("-version_sort_key").values_list("tag", flat=True)),
+            ["latest", "11.0.0", "2.0.0", "0.1.0"],
+        )
+
+
+class OneDefaultPerServiceMigrationTestCase(MigratorTestCase):
+    """Test the migration that removes duplicate default service revisions and constrains there to be one per service."""
+
+    migrate_from = ("django_twined", "0016_servicerevision_version_sort_key")
+    migrate_to = ("django_twined", "0017_servicerevision_one_default_per_service")
+
+    def prepare(self):
+        """Prepare a service with several defaults at migration 0016 (bypassing save, as a race could)"""
+        ServiceRevision = self.old_state.apps.get_model("django_twined", "ServiceRevision")
+
+        ServiceRevision.objects.bulk_create(
+            [
+                ServiceRevision(name="test-name", tag="1.0.0", is_default=True),
+                ServiceRevision(name="test-name", tag="2.0.0", is_default=True),
+                ServiceRevision(name="test-name", tag="3.0.0", is_default=False),
+                ServiceRevision(name="another-name", tag="1.0.0", is_default=True),
+            ]
+        )
+
+    def test_one_default_per_service(self):
+        ServiceRevision = self.new_state.apps.get_model("django_twined", "ServiceRevision")
+        self.assertEqual(
+            set(ServiceRevision.objects.filter(is_default=True).values_list("name", "tag")),
+            {("test-name", "2.0.0"), ("another-name", "1.0.0")},
+        )
+
+
+class BackfillQuestionEventSummaryMigrationTestCase(MigratorTestCase):
+    """Test the migration that adds question event summaries and backfills them from existing events."""
+
+    migrate_from = ("django_twined", "0018_question_status_index")
+    migrate_to = ("django_twined", "0019_questioneventsummary")
+
+    def prepare(self):
+        """Prepare a question with events of several kinds, and one without events, at migration 0018"""
+        ServiceRevision = self.old_state.apps.get_model("django_twined", "ServiceRevision")
+        Question = self.old_state.apps.get_model("django_twined", "Question")
+        ServiceUsageEvent = self.old_state.apps.get_model("django_twined", "ServiceUsageEvent")
+
+        sr = ServiceRevision.objects.create(name="test-name")
+        question = Question.objects.create(service_revision=sr)
+        Question.objects.create(service_revision=sr)
+
+        for message_kind, publish_time in (
+            ("delivery_acknowledgement", "2024-01-01T00:00:00Z"),
+            ("heartbeat", "2024-01-01T00:01:00Z"),
+            ("heartbeat", "2024-01-01T00:02:00Z"),
+            ("log_record", "2024-01-01T00:02:30Z"),
+            ("exception", "2024-01-01T00:02:40Z"),
+            ("result", "2024-01-01T00:03:00Z"),
+        ):
+            ServiceUsageEvent.objects.create(
+                data={"kind": message_kind},
+                kind="q-response-updated",
+                message_kind=message_kind,
+                publish_time=publish_time,
+                question=question,
+                service_revision=sr,
+            )
+
+        self.question_id = question.id
+        self.result_event_id = ServiceUsageEvent.objects.get(message_kind="result").id
+
+    def test_question_event_summaries_backfilled(self):
+        QuestionEventSummary = self.new_state.apps.get_model("django_twined", "QuestionEventSummary")
+        summary = QuestionEventSummary.objects.get()
+
+        self.assertEqual(summary.question_id, self.question_id)
+        self.assertEqual(summary.delivery_acknowledgement_time.isoformat(), "2024-01-01T00:00:00+00:00")
+        self.assertEqual(summary.latest_heartbeat_time.isoformat(), "2024-01-01T00:02:00+00:00")
+        self.assertEqual(summary.last_event_time.isoformat(), "2024-01-01T00:03:00+00:00")
+        self.assertEqual(summary.result_event_id, self.result_event_id)
+        self.assertEqual((summary.exception_count, summary.log_record_count, summary.monitor_message_count), (1, 1, 0))
+
+
+class BackfillEventSummaryDataMigrationTestCase(MigratorTestCase):
+    """Test the migration that records the data of the delivery acknowledgements and heartbeats of summarised questions"""
+
+    migrate_from = ("django_twined", "0021_questioneventsummary_latest_heartbeat_data")
+    migrate_to = ("django_twined", "0022_questioneventsummary_delivery_acknowledgement_data")
+
+    def prepare(self):
+        """Prepare a summarised question with acknowledgements and heartbeats at migration 0021"""
+        ServiceRevision = self.old_state.apps.get_model("django_twined", "ServiceRevision")
+        Question = self.old_state.apps.get_model("django_twined", "Question")
+        QuestionEventSummary = self.old_state.apps.get_model("django_twined", "QuestionEventSummary")
+        ServiceUsageEvent = self.old_state.apps.get_model("django_twined", "ServiceUsageEvent")
+
+        sr = ServiceRevision.objects.create(name="test-name")
+        question = Question.objects.create(service_revision=sr)
+
+        for message_kind, publish_time in (
+            ("delivery_acknowledgement", "2024-01-01T00:00:00Z"),
+            ("delivery_acknowledgement", "2024-01-01T00:00:30Z"),
+            ("heartbeat", "2024-01-01T00:01:00Z"),
+            ("heartbeat", "2024-01-01T00:02:00Z"),
+        ):
+            ServiceUsageEvent.objects.create(
+                data={"kind": message_kind, "datetime": publish_time},
+                kind="q-response-updated",
+                message_kind=message_kind,
+                publish_time=publish_time,
+                question=question,
+                service_revision=sr,
+            )
+
+        QuestionEventSummary.objects.create(
+            question=question,
+            delivery_acknowledgement_time="2024-01-01T00:00:00Z",
+            latest_heartbeat_time="2024-01-01T00:02:00Z",
+        )
+
+    def test_event_summary_data_backfilled(self):
+        QuestionEventSummary = self.new_state.apps.get_model("django_twined", "QuestionEventSummary")
+        summary = QuestionEventSummary.objects.get()
+
+        self.assertEqual(summary.delivery_acknowledgement_data["datetime"], "2024-01-01T00:00:00Z")
+        self.assertEqual(summary.latest_heartbeat_data["datetime"], "2024-01-01T00:02:00Z")
@@ -1,10 +1,22 @@
 # Disables for testing:
 # pylint: disable=missing-docstring
 
+import copy
+import json
+import os
+import tempfile
 from unittest import skipIf
+from unittest.mock import patch
+import uuid
 
+from django.conf import settings
 from django.test import TestCase as BaseTestCase
 
+from django_twined.models.querysets.datastore_queryset import StorePage
+from tests.fakes import FakeBlob, FakeStorage, make_octue_metadata
+from tests.mixins import CallCommandMixin
+from tests.server.example.models import ConcreteSynchronisedDatastore
+
 
 class DatastoreTestCase(BaseTestCase):
     @skipIf(True, "Generic Datastore tests not abstracted from data lakes MyDatalakeModel tests yet")
@@ -32,6 +44,302 @@ class DatastoreTestCase(BaseTestCase):
         pass
 
 
+class DatastoreStoreResolutionTestCase(BaseTestCase):
+    def test_store_settings_are_resolved_once(self):
+        """Ensure that store settings are resolved once per model class, and again when the settings change."""
+        store_settings = ConcreteSynchronisedDatastore.get_store_settings()
+        self.assertIs(ConcreteSynchronisedDatastore.get_store_settings(), store_settings)
+        self.assertIs(
+            ConcreteSynchronisedDatastore.get_storage(), ConcreteSynchronisedDatastore.get_file_field().storage
+        )
+
+        stores = copy.deepcopy(settings.TWINED_DATA_STORES)
+        stores["django-twined-concrete-store"]["storage_settings"]["bucket_name"] = "another-bucket"
+
+        with self.settings(TWINED_DATA_STORES=stores):
+            self.assertEqual(ConcreteSynchronisedDatastore.get_storage_settings()["bucket_name"], "another-bucket")
+
+        self.assertEqual(
+            ConcreteSynchronisedDatastore.get_storage_settings()["bucket_name"], "test-django-twined-concrete-store"
+        )
+
+
+class DatastoreStoreComparisonTestCase(BaseTestCase):
+    def setUp(self):
+        self.ids = [uuid.uuid4() for _ in range(5)]
+        self.storage = FakeStorage(
+            [
+                FakeBlob(f"folder/file-{i}.txt", metadata=make_octue_metadata(id, tags={"a_string_tag": f"tag-{i}"}))
+                for i, id in enumerate(self.ids)
+            ]
+        )
+        patcher = patch.object(ConcreteSynchronisedDatastore, "get_storage", return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compare_store_uses_listing_metadata(self):
+        """Ensure that store comparison takes datafile ids and tags from the listing, without fetching each object."""
+        ConcreteSynchronisedDatastore.objects.bulk_create(
+            [ConcreteSynchronisedDatastore(id=self.ids[0], a_decimal_tag=1, file="folder/file-0.txt")]
+        )
+
+        with patch("octue.resources.datafile.Datafile._get_cloud_metadata") as get_cloud_metadata:
+            comparison = ConcreteSynchronisedDatastore.objects.compare_store(page_size=2).store_comparison
+
+        get_cloud_metadata.assert_not_called()
+        self.assertEqual(comparison.ids_in_store, set(str(id) for id in self.ids))
+        self.assertEqual(comparison.ids_already_present, {str(self.ids[0])})
+        self.assertEqual(comparison.ids_missing_from_db, set(str(id) for id in self.ids[1:]))
+        self.assertEqual(comparison.datafiles_in_store[str(self.ids[3])].tags["a_string_tag"], "tag-3")
+        self.assertEqual(comparison.datafiles_in_store[str(self.ids[3])].path_in_bucket, "folder/file-3.txt")
+
+    def test_iter_store_pages(self):
+        """Ensure that the store is listed a page at a time and can be resumed from a page token."""
+        pages = list(ConcreteSynchronisedDatastore.objects.iter_store_pages(page_size=2, prefetch=1))
+        self.assertEqual([len(page.datafiles) for page in pages], [2, 2, 1])
+        self.assertEqual([page.next_page_token for page in pages], ["1", "2", None])
+        self.assertEqual((pages[1].first_name, pages[1].last_name), ("folder/file-2.txt", "folder/file-3.txt"))
+
+        resumed = list(ConcreteSynchronisedDatastore.objects.iter_store_pages(page_size=2, page_token="2"))
+        self.assertEqual(len(resumed), 1)
+        self.assertEqual(set(resumed[0].datafiles), {str(self.ids[4])})
+
+    def test_iter_store_pages_raises_listing_errors(self):
+        """Ensure that an error listing the store is raised to the caller."""
+        with patch.object(self.storage.client, "list_blobs", side_effect=ValueError("Listing failed")):
+            with self.assertRaises(ValueError):
+                list(ConcreteSynchronisedDatastore.objects.iter_store_pages())
+
+
+class DatastoreImportTestCase(BaseTestCase):
+    def setUp(self):
+        self.ids = [uuid.uuid4() for _ in range(5)]
+        blobs = [
+            FakeBlob(f"file-{i}.txt", metadata=make_octue_metadata(id, tags={"a_string_tag": "a", "a_decimal_tag": i}))
+            for i, id in enumerate(self.ids)
+        ]
+
+        # The decimal tag is required, so this file can't be imported
+        blobs[3].metadata = make_octue_metadata(self.ids[3], tags={"a_string_tag": "no-decimal"})
+
+        patcher = patch.object(ConcreteSynchronisedDatastore, "get_storage", return_value=FakeStorage(blobs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_import_missing_isolates_failures(self):
+        """Ensure that batched import only fails to import the files that can't be inserted."""
+        comparison = ConcreteSynchronisedDatastore.objects.import_missing(batch_size=4).store_comparison
+
+        self.assertEqual(comparison.ids_imported, set(str(id) for i, id in enumerate(self.ids) if i != 3))
+        self.assertEqual(comparison.ids_failed_to_import, {str(self.ids[3])})
+        self.assertEqual(ConcreteSynchronisedDatastore.objects.count(), 4)
+        self.assertEqual(ConcreteSynchronisedDatastore.objects.get(id=self.ids[4]).file.name, "file-4.txt")
+
+    def test_import_batch_size_from_store_settings(self):
+        """Ensure that the import batch size can be set per store."""
+        stores = copy.deepcopy(settings.TWINED_DATA_STORES)
+        stores["django-twined-concrete-store"]["import_batch_size"] = 2
+
+        with self.settings(TWINED_DATA_STORES=stores):
+            with patch.object(ConcreteSynchronisedDatastore.objects, "bulk_create", wraps=lambda objs: objs) as bulk:
+                ConcreteSynchronisedDatastore.objects.import_missing()
+
+        self.assertEqual([len(call.args[0]) for call in bulk.call_args_list], [2, 2, 1])
+
+
+class DatastoreSyncTestCase(BaseTestCase):
+    def setUp(self):
+        self.ids = [uuid.uuid4() for _ in range(4)]
+        store_tags = [
+            {"a_string_tag": "same", "a_decimal_tag": 0},
+            {"a_string_tag": "changed", "a_decimal_tag": 1},
+            {"a_string_tag": "same", "a_decimal_tag": 2.5},
+            # The decimal tag is required, so this file's metadata can't be synced
+            {"a_string_tag": "same"},
+        ]
+        blobs = [
+            FakeBlob(f"file-{i}.txt", metadata=make_octue_metadata(id, tags=tags))
+            for i, (id, tags) in enumerate(zip(self.ids, store_tags))
+        ]
+        ConcreteSynchronisedDatastore.objects.bulk_create(
+            [
+                ConcreteSynchronisedDatastore(id=id, a_string_tag="same", a_decimal_tag=i, file=f"file-{i}.txt")
+                for i, id in enumerate(self.ids)
+            ]
+        )
+
+        patcher = patch.object(ConcreteSynchronisedDatastore, "get_storage", return_value=FakeStorage(blobs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sync_metadata_only_updates_changed_rows(self):
+        """Ensure that metadata sync writes only the rows and fields that differ from the store."""
+        with patch.object(
+            ConcreteSynchronisedDatastore.objects,
+            "bulk_update",
+            wraps=ConcreteSynchronisedDatastore.objects.bulk_update,
+        ) as bulk_update:
+            comparison = ConcreteSynchronisedDatastore.objects.sync_metadata_from_store(batch_size=1).store_comparison
+
+        self.assertEqual(comparison.ids_unchanged, {str(self.ids[0])})
+        self.assertEqual(comparison.ids_changed, {str(self.ids[1]), str(self.ids[2])})
+        self.assertEqual(comparison.ids_failed_to_sync, {str(self.ids[3])})
+        self.assertEqual(comparison.counts["ids_changed"], 2)
+        self.assertEqual(ConcreteSynchronisedDatastore.objects.get(id=self.ids[1]).a_string_tag, "changed")
+        self.assertEqual(ConcreteSynchronisedDatastore.objects.get(id=self.ids[2]).a_decimal_tag, 2.5)
+        self.assertEqual(ConcreteSynchronisedDatastore.objects.get(id=self.ids[3]).a_decimal_tag, 3)
+
+        updated_fields = [call.args[1] for call in bulk_update.call_args_list]
+        self.assertIn(["a_string_tag"], updated_fields)
+        self.assertIn(["a_decimal_tag"], updated_fields)
+
+    def test_sync_metadata_respects_queryset(self):
+        """Ensure that only rows in the queryset are synced."""
+        queryset = ConcreteSynchronisedDatastore.objects.filter(id=self.ids[1])
+        comparison = queryset.sync_metadata_from_store().store_comparison
+
+        self.assertEqual(comparison.ids_changed, {str(self.ids[1])})
+        self.assertEqual(comparison.ids_unchanged, set())
+        self.assertEqual(comparison.ids_failed_to_sync, set())
+
+
+class DatastoreDeleteFilesTestCase(BaseTestCase):
+    def setUp(self):
+        self.storage = FakeStorage([FakeBlob(f"file-{i}.txt") for i in range(4)])
+        self.instances = [
+            ConcreteSynchronisedDatastore(id=uuid.uuid4(), a_decimal_tag=i, file=f"file-{i}.txt") for i in range(5)
+        ]
+        ConcreteSynchronisedDatastore.objects.bulk_create(self.instances)
+
+        patcher = patch.object(ConcreteSynchronisedDatastore, "get_storage", return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_delete_files(self):
+        """Ensure that files and their rows are deleted, including rows of files already absent from the store."""
+        report = ConcreteSynchronisedDatastore.objects.delete_files(max_workers=2, batch_size=2)
+
+        self.assertEqual(sorted(report.deleted), [f"file-{i}.txt" for i in range(5)])
+        self.assertEqual(report.failed, {})
+        self.assertEqual(report.rows_deleted, 5)
+        self.assertEqual(self.storage.bucket.blobs, {})
+        self.assertFalse(ConcreteSynchronisedDatastore.objects.exists())
+
+    def test_rows_are_kept_for_files_that_fail_to_delete(self):
+        """Ensure that rows are only deleted for files that were successfully deleted from the store."""
+        delete_blob = self.storage.bucket.delete_blob
+
+        def fail_for_file_1(name):
+            if name == "file-1.txt":
+                raise ValueError("Deletion failed")
+            delete_blob(name)
+
+        with patch.object(self.storage.bucket, "delete_blob", fail_for_file_1):
+            report = ConcreteSynchronisedDatastore.objects.filter(a_decimal_tag__lt=3).delete_files()
+
+        self.assertEqual(set(report.failed), {"file-1.txt"})
+        self.assertEqual(report.rows_deleted, 2)
+        self.assertEqual(set(self.storage.bucket.blobs), {"file-1.txt", "file-3.txt"})
+        self.assertEqual(
+            set(ConcreteSynchronisedDatastore.objects.values_list("file", flat=True)),
+            {"file-1.txt", "file-3.txt", "file-4.txt"},
+        )
+
+
+class SyncDataStoresCommandTestCase(CallCommandMixin, BaseTestCase):
+    def setUp(self):
+        self.ids = [uuid.uuid4() for _ in range(5)]
+        blobs = [
+            FakeBlob(f"file-{i}.txt", metadata=make_octue_metadata(id, tags={"a_string_tag": "a", "a_decimal_tag": i}))
+            for i, id in enumerate(self.ids)
+        ]
+        patcher = patch.object(ConcreteSynchronisedDatastore, "get_storage", return_value=FakeStorage(blobs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint_file = os.path.join(directory.name, "checkpoint.json")
+
+    def test_sync_streams_pages(self):
+        """Ensure that syncing page by page imports, deletes and updates records across the whole store."""
+        stale = [
+            ConcreteSynchronisedDatastore(id=uuid.uuid4(), a_decimal_tag=0, file="file-1a.txt"),
+            ConcreteSynchronisedDatastore(id=uuid.uuid4(), a_decimal_tag=0, file="file-9.txt"),
+            ConcreteSynchronisedDatastore(id=self.ids[2], a_string_tag="old", a_decimal_tag=2, file="file-2.txt"),
+        ]
+        ConcreteSynchronisedDatastore.objects.bulk_create(stale)
+
+        self.callCommand("sync_data_stores", "--batch-size=2", f"--checkpoint-file={self.checkpoint_file}")
+
+        self.assertEqual(set(ConcreteSynchronisedDatastore.objects.values_list("id", flat=True)), set(self.ids))
+        self.assertEqual(ConcreteSynchronisedDatastore.objects.get(id=self.ids[2]).a_string_tag, "a")
+        self.assertEqual(json.load(open(self.checkpoint_file)), {})
+
+    def test_sync_resumes_from_checkpoint(self):
+        """Ensure that an interrupted sync can be resumed after the last page to have been synced."""
+        compare_store_page = ConcreteSynchronisedDatastore.objects.compare_store_page
+        calls = []
+
+        def fail_on_second_page(page, **kwargs):
+            calls.append(page)
+            if len(calls) == 2:
+                raise ValueError("Interrupted")
+            return compare_store_page(page, **kwargs)
+
+        with patch.object(ConcreteSynchronisedDatastore.objects, "compare_store_page", fail_on_second_page):
+            with self.assertRaises(ValueError):
+                self.callCommand("sync_data_stores", "--batch-size=2", f"--checkpoint-file={self.checkpoint_file}")
+
+        checkpoint = json.load(open(self.checkpoint_file))["django-twined-concrete-store"]
+        self.assertEqual(checkpoint, {"prefix": None, "page_token": "1", "last_name": "file-1.txt"})
+
+        # Records from the first page aren't compared again on resumption, so this one won't be re-imported
+        ConcreteSynchronisedDatastore.objects.filter(id=self.ids[0]).delete()
+
+        self.callCommand("sync_data_stores", "--batch-size=2", f"--checkpoint-file={self.checkpoint_file}", "--resume")
+
+        self.assertEqual(set(ConcreteSynchronisedDatastore.objects.values_list("id", flat=True)), set(self.ids[1:]))
+
+    def test_sync_keeps_records_after_empty_intermediate_page(self):
+        """Ensure that an empty page part way through the listing doesn't cause the records after it to be deleted."""
+        self.callCommand("sync_data_stores", f"--checkpoint-file={self.checkpoint_file}")
+
+        iter_store_pages = ConcreteSynchronisedDatastore.objects.iter_store_pages
+        compare_store_page = ConcreteSynchronisedDatastore.objects.compare_store_page
+        missing_from_store = []
+
+        def iter_store_pages_with_empty_page(**kwargs):
+            for page in iter_store_pages(**kwargs):
+                yield page
+
+                if page.next_page_token == "1":
+                    yield StorePage({}, None, None, page.next_page_token, page.next_page_token)
+
+        def record_compare_store_page(page, **kwargs):
+            queryset = compare_store_page(page, **kwargs)
+            missing_from_store.append(queryset.store_comparison.ids_missing_from_store)
+            return queryset
+
+        with patch.object(ConcreteSynchronisedDatastore.objects, "iter_store_pages", iter_store_pages_with_empty_page):
+            with patch.object(ConcreteSynchronisedDatastore.objects, "compare_store_page", record_compare_store_page):
+                self.callCommand("sync_data_stores", "--batch-size=2", f"--checkpoint-file={self.checkpoint_file}")
+
+        self.assertEqual(missing_from_store, [set(), set(), set(), set()])
+        self.assertEqual(set(ConcreteSynchronisedDatastore.objects.values_list("id", flat=True)), set(self.ids))
+
+    def test_sync_with_prefix_leaves_other_records(self):
+        """Ensure that syncing a prefix only affects records within that prefix."""
+        outside = ConcreteSynchronisedDatastore(id=uuid.uuid4(), a_decimal_tag=0, file="other/file.txt")
+        ConcreteSynchronisedDatastore.objects.bulk_create([outside])
+
+        self.callCommand("sync_data_stores", "--prefix=file-3", f"--checkpoint-file={self.checkpoint_file}")
+
+        self.assertEqual(
+            set(ConcreteSynchronisedDatastore.objects.values_list("id", flat=True)), {self.ids[3], outside.id}
+        )
+
+
 # import tempfile
 
 # import uuid
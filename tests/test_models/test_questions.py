@@ -87,6 +87,67 @@ class QuestionTestCase(TestCase):
         self.assertEqual(duplicate.apple_name, "greenround")
         self.assertEqual(duplicate.banana_name, "chiquita")
 
+    @patch("django_twined.models.ServiceRevision.ask", return_value=("subscription", "push_url"))
+    def test_ask_many(self, mock):
+        """Ensure that many questions can be asked at once, skipping those already asked"""
+        sr = ServiceRevision.objects.create(name="test-service")
+        other_sr = ServiceRevision.objects.create(name="other-test-service")
+        unasked = [
+            QuestionWithValuesDatabaseStorage.objects.create(service_revision=sr),
+            QuestionWithValuesDatabaseStorage.objects.create(service_revision=sr),
+            QuestionWithValuesDatabaseStorage.objects.create(service_revision=other_sr),
+        ]
+        already_asked = QuestionWithValuesDatabaseStorage.objects.create(
+            service_revision=sr, asked=datetime.datetime.now(tz=datetime.timezone.utc)
+        )
+
+        report = Question.objects.all().ask_many(max_workers=2)
+
+        self.assertEqual(mock.call_count, 3)
+        self.assertEqual(set(report.asked), {q.id for q in unasked})
+        self.assertEqual(report.already_asked, {already_asked.id})
+        self.assertEqual(report.failed, {})
+        self.assertEqual(Question.objects.filter(asked__isnull=True).count(), 0)
+
+    def test_ask_many_uses_overridden_ask(self):
+        """Ensure that questions are asked with their own `ask` method, so overrides of it aren't bypassed"""
+        sr = ServiceRevision.objects.create(name="test-service")
+        q = QuestionWithValuesDatabaseStorage.objects.create(service_revision=sr)
+        asked = []
+
+        def ask(question, save=True):
+            asked.append((question.id, save))
+            return "subscription", "custom_push_url", sr
+
+        with patch.object(QuestionWithValuesDatabaseStorage, "ask", ask):
+            report = Question.objects.all().ask_many()
+
+        self.assertEqual(asked, [(q.id, False)])
+        self.assertEqual(report.asked, {q.id: ("subscription", "custom_push_url")})
+        q.refresh_from_db()
+        self.assertIsNotNone(q.asked)
+
+    def test_ask_many_reports_failures(self):
+        """Ensure that failure to ask one question is reported without preventing others being asked"""
+        sr = ServiceRevision.objects.create(name="test-service")
+        failing = QuestionWithValuesDatabaseStorage.objects.create(service_revision=sr)
+        succeeding = QuestionWithValuesDatabaseStorage.objects.create(service_revision=sr)
+
+        def ask(question_id, **kwargs):
+            if question_id == failing.id:
+                raise ValueError("Service unavailable")
+            return "subscription", "push_url"
+
+        with patch("django_twined.models.ServiceRevision.ask", side_effect=ask):
+            report = QuestionWithValuesDatabaseStorage.objects.all().ask_many()
+
+        self.assertEqual(report.outcomes, {failing.id: "failed", succeeding.id: "asked"})
+        self.assertIsInstance(report.failed[failing.id], ValueError)
+        failing.refresh_from_db()
+        succeeding.refresh_from_db()
+        self.assertIsNone(failing.asked)
+        self.assertIsNotNone(succeeding.asked)
+
     @skipIf(
         SKIP_INTEGRATION_TESTS,
         "Skipping integration test - Accessing the admin requires staticfiles storage from django-gcp to have valid store and credentials",
@@ -1,9 +1,22 @@
 # Disables for testing:
 # pylint: disable=missing-docstring
 
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+import packaging.specifiers
+import packaging.version
 
-from django_twined.models.service_revisions import ServiceRevision, service_revision_is_latest_semantic_version
+from django_twined.models.service_revisions import (
+    ServiceRevision,
+    get_latest_service_revision,
+    get_service_revision_in_range,
+    get_version_sort_key,
+    service_revision_is_latest_semantic_version,
+)
 
 
 class TestServiceRevisionIsLatestSemanticVersion(TestCase):
@@ -52,6 +65,126 @@ class TestServiceRevisionIsLatestSemanticVersion(TestCase):
         new_revision = ServiceRevision(namespace=self.NAMESPACE, name=self.NAME, tag="2.1.0.beta-3")
         self.assertTrue(service_revision_is_latest_semantic_version(new_revision))
 
+    def test_invalid_version_not_considered_latest(self):
+        """Test that a service revision whose tag isn't a semantic version isn't considered the latest version, and
+        that revisions with such tags are ignored when determining the latest version.
+        """
+        ServiceRevision.objects.create(namespace=self.NAMESPACE, name=self.NAME, tag="my-branch")
+
+        self.assertFalse(
+            service_revision_is_latest_semantic_version(
+                ServiceRevision(namespace=self.NAMESPACE, name=self.NAME, tag="latest")
+            )
+        )
+        self.assertTrue(
+            service_revision_is_latest_semantic_version(
+                ServiceRevision(namespace=self.NAMESPACE, name=self.NAME, tag="0.0.1")
+            )
+        )
+
+
+class VersionSortKeyTestCase(TestCase):
+    NAMESPACE = "my-org"
+    NAME = "my-service"
+
+    def test_version_sort_key_matches_version_order(self):
+        """Test that sort keys order tags in the same way as packaging's version comparison."""
+        tags = [
+            "1!0.1",
+            "0.0.1",
+            "1.0.dev1",
+            "1.0a1.dev2",
+            "1.0a1",
+            "1.0b2",
+            "1.0rc1",
+            "1.0",
+            "1.0.0.1",
+            "1.0+local.1",
+            "1.0.post1.dev1",
+            "1.0.post1",
+            "1.2.3.4.5.6",
+            "2.1.0.beta-1",
+            "2.1.0",
+            "11.1.0",
+            "2024.1.1",
+        ]
+
+        self.assertEqual(sorted(tags, key=get_version_sort_key), sorted(tags, key=packaging.version.Version))
+
+    def test_equal_versions_have_equal_sort_keys(self):
+        self.assertEqual(get_version_sort_key("1.0"), get_version_sort_key("1.0.0.0.0.0.0"))
+
+    def test_unrepresentable_tags_have_no_sort_key(self):
+        for tag in ("latest", "my-branch", "1.2.3.4.5.6.7", "12345678901.0"):
+            with self.subTest(tag=tag):
+                self.assertIsNone(get_version_sort_key(tag))
+
+    def test_get_latest_service_revision(self):
+        """Test that the latest service revision is found by version (not alphabetical) order, ignoring non-version
+        tags.
+        """
+        for tag in ("0.1.0", "11.0.0", "2.0.0", "latest"):
+            ServiceRevision.objects.create(namespace=self.NAMESPACE, name=self.NAME, tag=tag)
+
+        ServiceRevision.objects.create(namespace=self.NAMESPACE, name="another-service", tag="12.0.0")
+
+        self.assertEqual(get_latest_service_revision(self.NAMESPACE, self.NAME).tag, "11.0.0")
+        self.assertIsNone(get_latest_service_revision(self.NAMESPACE, "no-such-service"))
+
+
+class ServiceRevisionInRangeTestCase(TestCase):
+    NAMESPACE = "my-org"
+    NAME = "my-service"
+    TAGS = [
+        "0.9.0",
+        "1.0.0",
+        "1.2.0",
+        "1.2.5",
+        "1.2.5+build.1",
+        "1.3.0rc1",
+        "1.4.5",
+        "1.4.9.post1",
+        "1.5.0",
+        "2.0.0.dev1",
+        "2.0.0",
+        "3.0.0a1",
+        "latest",
+    ]
+
+    def setUp(self):
+        for tag in self.TAGS:
+            ServiceRevision.objects.create(namespace=self.NAMESPACE, name=self.NAME, tag=tag)
+
+    def test_latest_revision_in_range_matches_packaging(self):
+        """Test that the revision found for a range is the latest version that packaging finds in the range."""
+        versions = [tag for tag in self.TAGS if tag != "latest"]
+
+        for revision_range in (
+            "",
+            ">=1.2,<2",
+            ">1.2.5",
+            "<=1.2.5",
+            "==1.2.*",
+            "~=1.4.5",
+            "~=1.2",
+            "==1.2.5",
+            "==1.2.5+build.1",
+            "!=2.0.0",
+            ">=1.3.0rc1,<1.4",
+            ">2.0",
+            "==4.*",
+            "===1.0.0",
+        ):
+            with self.subTest(revision_range=revision_range):
+                matches = list(packaging.specifiers.SpecifierSet(revision_range).filter(versions))
+                expected = max(matches, key=packaging.version.Version) if matches else None
+                revision = get_service_revision_in_range(self.NAMESPACE, self.NAME, revision_range)
+                self.assertEqual(None if revision is None else revision.tag, expected)
+
+    def test_invalid_range_raises_error(self):
+        with self.assertRaises(packaging.specifiers.InvalidSpecifier):
+            get_service_revision_in_range(self.NAMESPACE, self.NAME, "1.2 or later")
+
 
 class ServiceRevisionTestCase(TestCase):
     def test_topic(self):
@@ -85,3 +218,42 @@ class ServiceRevisionTestCase(TestCase):
         ServiceRevision.objects.create(namespace=namespace, name=name, tag="0.2.0", is_default=True)
         self.assertTrue(ServiceRevision.objects.get(namespace=namespace, name=name, tag="0.2.0").is_default)
         self.assertFalse(ServiceRevision.objects.get(namespace=namespace, name=name, tag="0.1.0").is_default)
+
+    def test_default_swap_is_one_update(self):
+        """Test that making a revision the default unsets the previous default without loading or re-saving it."""
+        ServiceRevision.objects.create(name="gibbon-analyser", tag="0.1.0", is_default=True)
+        new_default = ServiceRevision(name="gibbon-analyser", tag="0.2.0", is_default=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            new_default.save()
+
+        statements = [query["sql"].split()[0] for query in queries.captured_queries]
+        self.assertEqual([statement for statement in statements if statement != "SAVEPOINT"][:2], ["UPDATE", "INSERT"])
+        self.assertEqual(ServiceRevision.objects.filter(name="gibbon-analyser", is_default=True).get(), new_default)
+
+    def test_resaving_default_keeps_it_default(self):
+        default = ServiceRevision.objects.create(name="gibbon-analyser", tag="0.1.0", is_default=True)
+        default.save()
+        self.assertTrue(ServiceRevision.objects.get(pk=default.pk).is_default)
+
+    def test_save_retried_if_default_registered_concurrently(self):
+        """Test that saving a default is retried once if a concurrently registered default violates the constraint."""
+        cause = Exception()
+        cause.diag = SimpleNamespace(constraint_name="one_default_per_service")
+        error = IntegrityError("duplicate key value violates unique constraint")
+        error.__cause__ = cause
+
+        with patch.object(ServiceRevision, "_save_as_only_default", side_effect=[error, None], autospec=True) as mock:
+            ServiceRevision(name="gibbon-analyser", tag="0.1.0", is_default=True).save()
+
+        self.assertEqual(mock.call_count, 2)
+
+    def test_database_prevents_two_defaults(self):
+        """Test that the database rejects a second default for a service, even when bypassing save()."""
+        ServiceRevision.objects.create(name="gibbon-analyser", tag="0.1.0", is_default=True)
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ServiceRevision.objects.bulk_create(
+                    [ServiceRevision(name="gibbon-analyser", tag="0.2.0", is_default=True)]
+                )
@@ -1,13 +1,34 @@
 # Disables for testing:
 # pylint: disable=missing-docstring
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.contrib import admin
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django_gcp.events.utils import make_pubsub_message
 
-from django_twined.models import QUESTION_RESPONSE_UPDATED, ServiceRevision, ServiceUsageEvent
+from django_twined.admin import QuestionAdmin
+from django_twined.askers import asker_pool
+from django_twined.events import get_event_buffer, reset_event_buffer, store_service_usage_event_batch
+from django_twined.models import (
+    ERROR_STATUS,
+    NO_STATUS,
+    QUESTION_RESPONSE_UPDATED,
+    SUCCESS_STATUS,
+    Question,
+    QuestionEventSummary,
+    ServiceRevision,
+    ServiceUsageEvent,
+    get_heartbeat_mode,
+)
+from django_twined.models.inserts import insert_ignoring_conflicts
+from django_twined.signals import heartbeat_received, log_record_received
+from tests.factories import SuperUserFactory
+from tests.mixins import PushEventsMixin
 from tests.server.example.models import QuestionWithValuesDatabaseStorage
 
 # TODO test the following
@@ -30,6 +51,9 @@ class MockService:
 
 
 class ServiceUsageEventTestCase(TestCase):
+    def tearDown(self):
+        asker_pool.close()
+
     def _setup_to_receive_events(self):
         """Use a patched octue Service to avoid need for credentials"""
 
@@ -69,3 +93,505 @@ class ServiceUsageEventTestCase(TestCase):
         self.assertEqual(response.status_code, 201)
 
         self.assertEqual(ServiceUsageEvent.objects.count(), 1)
+
+
+@override_settings(TWINED_EVENT_BUFFER={"max_size": 3, "max_age_seconds": None})
+class BufferedServiceUsageEventTestCase(PushEventsMixin, TestCase):
+    def tearDown(self):
+        reset_event_buffer(flush=False)
+
+    def test_events_are_written_when_buffer_is_full(self):
+        """Ensure that buffered events are only written to the database once the buffer is full."""
+        self._push({"kind": "log_record", "log_record": {"msg": "one"}})
+        self._push({"kind": "heartbeat", "datetime": "2022-11-22T12:00:00"})
+        self.assertEqual(ServiceUsageEvent.objects.count(), 0)
+
+        self._push({"kind": "monitor_message", "data": {}})
+        self.assertEqual(ServiceUsageEvent.objects.count(), 3)
+
+    def test_result_flushes_buffer(self):
+        """Ensure that a result event causes the buffer (including the result) to be written immediately."""
+        self._push({"kind": "log_record", "log_record": {"msg": "one"}})
+        self._push({"kind": "result", "output_values": {}})
+        self.assertEqual(ServiceUsageEvent.objects.count(), 2)
+        self.assertIsNotNone(self.q.result)
+
+    def test_signals_sent_after_rows_exist(self):
+        """Ensure that the per-kind signals are sent for buffered events, with events that exist in the database."""
+        received = []
+
+        def handler(sender, service_usage_event, **kwargs):
+            received.append(ServiceUsageEvent.objects.filter(id=service_usage_event.id).exists())
+
+        log_record_received.connect(handler)
+
+        try:
+            self._push({"kind": "log_record", "log_record": {"msg": "one"}})
+            self.assertEqual(received, [])
+            get_event_buffer().flush()
+        finally:
+            log_record_received.disconnect(handler)
+
+        self.assertEqual(received, [True])
+
+    def test_buffered_result_answers_question(self):
+        self._push({"kind": "log_record", "log_record": {"msg": "one"}})
+        self._push({"kind": "result", "output_values": {}})
+        self.q.refresh_from_db()
+        self.assertEqual(self.q.status, SUCCESS_STATUS)
+
+
+class QuestionLifecycleTestCase(PushEventsMixin, TestCase):
+    def test_result_answers_question(self):
+        """Ensure that receiving a result marks the question as answered successfully, at the result's publish time."""
+        self._push({"kind": "heartbeat", "datetime": "2022-11-22T12:00:00"})
+        self.q.refresh_from_db()
+        self.assertEqual(self.q.status, NO_STATUS)
+        self.assertIsNone(self.q.answered)
+
+        # The event is inserted, and the question and its event summary updated, in one transaction (a savepoint, within
+        # the test case)
+        with self.assertNumQueries(6):
+            self._push({"kind": "result", "output_values": {}}, publish_time=datetime(2024, 1, 1, 0, 0, 0, 500000))
+
+        self.q.refresh_from_db()
+        self.assertEqual(self.q.status, SUCCESS_STATUS)
+        self.assertEqual(self.q.answered, datetime(2024, 1, 1, 0, 0, 0, 500000, tzinfo=timezone.utc))
+
+    def test_exception_answers_question_with_error(self):
+        self._push({"kind": "exception", "exception_type": "ValueError", "exception_message": "Oh no"})
+        self.q.refresh_from_db()
+        self.assertEqual(self.q.status, ERROR_STATUS)
+        self.assertIsNotNone(self.q.answered)
+
+    def test_first_answer_determines_status(self):
+        """Ensure that events received after a question is answered don't change its status."""
+        self._push({"kind": "exception", "exception_type": "ValueError", "exception_message": "Oh no"})
+        self._push({"kind": "result", "output_values": {}})
+        self.q.refresh_from_db()
+        self.assertEqual(self.q.status, ERROR_STATUS)
+        self.assertEqual(Question.objects.filter(status=ERROR_STATUS).get(), self.q.question_ptr)
+
+
+class RedeliveredEventTestCase(PushEventsMixin, TestCase):
+    def test_redelivered_message_ignored(self):
+        """Ensure that a message delivered more than once is only stored, signalled and summarised once."""
+        received = []
+
+        def handler(sender, service_usage_event, **kwargs):
+            received.append(service_usage_event.id)
+
+        log_record_received.connect(handler)
+        self.addCleanup(log_record_received.disconnect, handler)
+        publish_time = datetime(2024, 1, 1, 0, 0, 0, 100000)
+
+        for _ in range(2):
+            self._push({"kind": "log_record", "log_record": {"msg": "one"}}, publish_time, message_id="1")
+
+        event = ServiceUsageEvent.objects.get()
+        self.assertEqual(event.message_id, "1")
+        self.assertEqual(received, [event.id])
+        self.assertEqual(QuestionEventSummary.objects.get().log_record_count, 1)
+
+    def test_concurrently_stored_message_ignored(self):
+        """Ensure that a message stored by another worker after the check for stored messages, but before the insert, isn't
+        signalled or summarised again.
+        """
+        received = []
+
+        def handler(sender, service_usage_event, **kwargs):
+            received.append(service_usage_event.id)
+
+        def insert_after_concurrent_worker(model, instances, key_fields, **kwargs):
+            for instance in instances:
+                ServiceUsageEvent.objects.create(
+                    message_id=instance.message_id,
+                    publish_time=instance.publish_time,
+                    message_kind=instance.message_kind,
+                    data=instance.data,
+                    question_id=instance.question_id,
+                    service_revision_id=instance.service_revision_id,
+                )
+
+            return insert_ignoring_conflicts(model, instances, key_fields, **kwargs)
+
+        log_record_received.connect(handler)
+        self.addCleanup(log_record_received.disconnect, handler)
+
+        with patch("django_twined.events.storage.insert_ignoring_conflicts", new=insert_after_concurrent_worker):
+            self._push({"kind": "log_record", "log_record": {"msg": "one"}}, message_id="1")
+
+        self.assertEqual(ServiceUsageEvent.objects.filter(message_id="1").count(), 1)
+        self.assertEqual(received, [])
+        self.assertFalse(QuestionEventSummary.objects.filter(log_record_count__gt=0).exists())
+
+    def test_messages_identified_by_id_and_publish_time(self):
+        """Ensure that events are only ignored as redelivered if both their message id and publish time are stored."""
+        publish_time = datetime(2024, 1, 1, 0, 0, 0, 100000)
+        self._push({"kind": "heartbeat"}, publish_time, message_id="1")
+        self._push({"kind": "heartbeat"}, publish_time + timedelta(seconds=1), message_id="1")
+        self.assertEqual(ServiceUsageEvent.objects.filter(message_id="1").count(), 2)
+
+    @override_settings(TWINED_EVENT_BUFFER={"max_size": 3, "max_age_seconds": None})
+    def test_buffered_duplicates_ignored(self):
+        publish_time = datetime(2024, 1, 1, 0, 0, 0, 100000)
+        self._push({"kind": "heartbeat"}, publish_time, message_id="1")
+        self._push({"kind": "heartbeat"}, publish_time, message_id="1")
+        self._push({"kind": "heartbeat"}, publish_time + timedelta(seconds=1), message_id="2")
+        self.assertEqual(ServiceUsageEvent.objects.count(), 2)
+
+        try:
+            self._push({"kind": "heartbeat"}, publish_time + timedelta(seconds=1), message_id="2")
+            self._push({"kind": "result", "output_values": {}}, publish_time + timedelta(seconds=2), message_id="3")
+        finally:
+            reset_event_buffer(flush=False)
+
+        self.assertEqual(
+            list(ServiceUsageEvent.objects.order_by("message_id").values_list("message_id", flat=True)), ["1", "2", "3"]
+        )
+
+
+class QuestionEventSummaryTestCase(PushEventsMixin, TestCase):
+    def test_summary_updated_on_ingestion(self):
+        """Ensure that the event summary of a question is created and updated as each kind of event is received."""
+        self.assertFalse(QuestionEventSummary.objects.exists())
+
+        self._push({"kind": "delivery_acknowledgement"}, publish_time=datetime(2024, 1, 1, 0, 0, 0, 100000))
+        self._push({"kind": "heartbeat"}, publish_time=datetime(2024, 1, 1, 0, 0, 1, 100000))
+        self._push({"kind": "log_record", "log_record": {"msg": "one"}}, publish_time=datetime(2024, 1, 1, 0, 0, 2, 1))
+        self._push({"kind": "log_record", "log_record": {"msg": "two"}}, publish_time=datetime(2024, 1, 1, 0, 0, 3, 1))
+        self._push({"kind": "monitor_message", "data": {}}, publish_time=datetime(2024, 1, 1, 0, 0, 4, 100000))
+        self._push({"kind": "result", "output_values": {}}, publish_time=datetime(2024, 1, 1, 0, 0, 5, 100000))
+
+        summary = QuestionEventSummary.objects.get()
+        self.assertEqual(summary.question_id, self.q.id)
+        self.assertEqual(
+            summary.delivery_acknowledgement_time, datetime(2024, 1, 1, 0, 0, 0, 100000, tzinfo=timezone.utc)
+        )
+        self.assertEqual(summary.latest_heartbeat_time, datetime(2024, 1, 1, 0, 0, 1, 100000, tzinfo=timezone.utc))
+        self.assertEqual(summary.last_event_time, datetime(2024, 1, 1, 0, 0, 5, 100000, tzinfo=timezone.utc))
+        self.assertEqual(summary.result_event, self.q.result)
+        self.assertEqual((summary.exception_count, summary.log_record_count, summary.monitor_message_count), (0, 2, 1))
+
+    def test_summary_keeps_latest_heartbeat_when_received_out_of_order(self):
+        self._push({"kind": "heartbeat"}, publish_time=datetime(2024, 1, 1, 0, 0, 2, 100000))
+        self._push({"kind": "heartbeat"}, publish_time=datetime(2024, 1, 1, 0, 0, 1, 100000))
+
+        summary = QuestionEventSummary.objects.get()
+        self.assertEqual(summary.latest_heartbeat_time, datetime(2024, 1, 1, 0, 0, 2, 100000, tzinfo=timezone.utc))
+        self.assertEqual(summary.last_event_time, datetime(2024, 1, 1, 0, 0, 2, 100000, tzinfo=timezone.utc))
+
+    def test_summary_keeps_first_delivery_acknowledgement_when_received_out_of_order(self):
+        self._push({"kind": "delivery_acknowledgement", "n": 2}, publish_time=datetime(2024, 1, 1, 0, 0, 2, 100000))
+        self._push({"kind": "delivery_acknowledgement", "n": 1}, publish_time=datetime(2024, 1, 1, 0, 0, 1, 100000))
+        self._push({"kind": "delivery_acknowledgement", "n": 3}, publish_time=datetime(2024, 1, 1, 0, 0, 3, 100000))
+
+        summary = QuestionEventSummary.objects.get()
+        self.assertEqual(
+            summary.delivery_acknowledgement_time, datetime(2024, 1, 1, 0, 0, 1, 100000, tzinfo=timezone.utc)
+        )
+        self.assertEqual(summary.delivery_acknowledgement_data["n"], 1)
+
+    @override_settings(TWINED_EVENT_BUFFER={"max_size": 3, "max_age_seconds": None})
+    def test_summary_updated_from_buffered_events(self):
+        try:
+            self._push({"kind": "exception", "exception_type": "ValueError", "exception_message": "Oh no"})
+            self._push({"kind": "exception", "exception_type": "ValueError", "exception_message": "Oh no"})
+            self.assertFalse(QuestionEventSummary.objects.exists())
+            get_event_buffer().flush()
+        finally:
+            reset_event_buffer(flush=False)
+
+        self.assertEqual(QuestionEventSummary.objects.get().exception_count, 2)
+
+    def test_questions_updated_in_order_of_id(self):
+        """Ensure that the questions and summaries of a batch are updated in a deterministic order, whatever the order of
+        its events, so that concurrent batches lock their rows in the same order rather than deadlocking.
+        """
+        other = QuestionWithValuesDatabaseStorage.objects.create(service_revision=self.sr)
+        questions = sorted([self.q, other], key=lambda question: str(question.id), reverse=True)
+        events = [
+            ServiceUsageEvent(
+                kind=QUESTION_RESPONSE_UPDATED,
+                data={"kind": "result", "output_values": {}},
+                message_kind="result",
+                publish_time=datetime(2024, 1, 1, 0, 0, 0, 100000, tzinfo=timezone.utc),
+                question_id=question.id,
+                service_revision_id=self.sr.id,
+            )
+            for question in questions
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            store_service_usage_event_batch(events)
+
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        question_ids = [str(question.id) for question in reversed(questions)]
+        self.assertEqual(len(updates), 4)
+
+        for sql, question_id in zip(updates, question_ids * 2):
+            self.assertIn(question_id.replace("-", ""), sql.replace("-", ""))
+
+    def test_batch_stored_individually_after_failed_transaction(self):
+        """Ensure that a batch whose transaction fails (e.g. on a deadlock) is stored one event at a time."""
+        record_events = QuestionEventSummary.objects.record_events
+        failures = [OperationalError("deadlock detected")]
+
+        def record_events_after_deadlock(events):
+            if failures:
+                raise failures.pop()
+
+            record_events(events)
+
+        events = [
+            ServiceUsageEvent(
+                kind=QUESTION_RESPONSE_UPDATED,
+                data={"kind": "log_record", "log_record": {"msg": str(i)}},
+                message_kind="log_record",
+                publish_time=datetime(2024, 1, 1, 0, 0, i, 100000, tzinfo=timezone.utc),
+                question_id=self.q.id,
+                service_revision_id=self.sr.id,
+            )
+            for i in range(2)
+        ]
+
+        with patch.object(QuestionEventSummary.objects, "record_events", new=record_events_after_deadlock):
+            with self.assertLogs("django_twined.events.storage", level="WARNING"):
+                stored = store_service_usage_event_batch(events)
+
+        self.assertEqual(stored, events)
+        self.assertEqual(ServiceUsageEvent.objects.count(), 2)
+        self.assertEqual(QuestionEventSummary.objects.get().log_record_count, 2)
+
+    def test_admin_reads_summary(self):
+        """Ensure that the question admin displays the progress of questions from their summaries alone, with the times
+        reported by the child service (including in the old field names of events from `octue` <= 0.50.1).
+        """
+        self._push(
+            {"kind": "delivery_acknowledgement", "delivery_time": "2024-01-01T00:00:00"},
+            publish_time=datetime(2024, 1, 1, 0, 0, 0, 500000),
+        )
+        self._push(
+            {"kind": "heartbeat", "datetime": "2024-01-01T00:00:01"}, publish_time=datetime(2024, 1, 1, 0, 0, 1, 100000)
+        )
+        unsummarised_question = QuestionWithValuesDatabaseStorage.objects.create(service_revision=self.sr)
+        question_admin = QuestionAdmin(QuestionWithValuesDatabaseStorage, None)
+
+        questions = {question.id: question for question in question_admin.get_queryset(None)}
+
+        with self.assertNumQueries(0):
+            self.assertEqual(question_admin.latest_heartbeat(questions[self.q.id]), "2024-01-01T00:00:01")
+            self.assertEqual(question_admin.delivery_acknowledgement(questions[self.q.id]), "2024-01-01T00:00:00")
+            self.assertIsNone(question_admin.result(questions[self.q.id]))
+            self.assertEqual(question_admin.exceptions(questions[self.q.id]), [])
+            self.assertEqual(question_admin.log_records(questions[self.q.id]), "")
+            self.assertIsNone(question_admin.latest_heartbeat(questions[unsummarised_question.id]))
+
+    def test_admin_falls_back_to_events_without_summary(self):
+        """Ensure that the question admin displays events of questions without summaries (e.g. created directly)."""
+        for data in (
+            {"kind": "delivery_acknowledgement", "datetime": "2024-01-01T00:00:00"},
+            {"kind": "heartbeat", "time": "2024-01-01T00:00:01"},
+            {"kind": "exception", "exception_type": "ValueError", "exception_message": "Oh no"},
+            {"kind": "log_record", "log_record": {"msg": "one"}},
+            {"kind": "result", "output_values": [1]},
+        ):
+            ServiceUsageEvent.objects.create(
+                data=data,
+                kind=QUESTION_RESPONSE_UPDATED,
+                publish_time=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                question=self.q,
+                service_revision=self.sr,
+            )
+
+        question_admin = QuestionAdmin(QuestionWithValuesDatabaseStorage, admin.site)
+        question = question_admin.get_queryset(None).get(id=self.q.id)
+
+        self.assertFalse(QuestionEventSummary.objects.exists())
+
+        # The delivery acknowledgement and heartbeats of questions without summaries are prefetched
+        with self.assertNumQueries(0):
+            self.assertEqual(question_admin.delivery_acknowledgement(question), "2024-01-01T00:00:00")
+            self.assertEqual(question_admin.latest_heartbeat(question), "2024-01-01T00:00:01")
+
+        self.assertEqual(len(question_admin.exceptions(question)), 1)
+        self.assertIn("of 1 log records", question_admin.log_records(question))
+        self.assertEqual(question_admin.result(question), {"kind": "result", "output_values": [1]})
+
+
+@override_settings(TWINED_HEARTBEAT_MODE="coalesce")
+class CoalescedHeartbeatTestCase(PushEventsMixin, TestCase):
+    def test_heartbeats_coalesced_into_summary(self):
+        """Ensure that heartbeats aren't stored as events, but only the latest is kept in the question's summary."""
+        received = []
+
+        def handler(sender, service_usage_event, **kwargs):
+            received.append(service_usage_event.data["n"])
+
+        heartbeat_received.connect(handler)
+        self.addCleanup(heartbeat_received.disconnect, handler)
+
+        self._push({"kind": "heartbeat", "n": 1}, publish_time=datetime(2024, 1, 1, 0, 0, 1, 100000))
+        self._push({"kind": "heartbeat", "n": 3}, publish_time=datetime(2024, 1, 1, 0, 0, 3, 100000))
+        self._push({"kind": "heartbeat", "n": 2}, publish_time=datetime(2024, 1, 1, 0, 0, 2, 100000))
+
+        self.assertFalse(ServiceUsageEvent.objects.exists())
+        self.assertEqual(received, [1, 3, 2])
+
+        summary = QuestionEventSummary.objects.get()
+        self.assertEqual(summary.latest_heartbeat_time, datetime(2024, 1, 1, 0, 0, 3, 100000, tzinfo=timezone.utc))
+        self.assertEqual(summary.latest_heartbeat_data, {"kind": "heartbeat", "n": 3})
+
+        heartbeat = Question.objects.get(id=self.q.id).latest_heartbeat
+        self.assertEqual(heartbeat.data, {"kind": "heartbeat", "n": 3})
+        self.assertEqual(heartbeat.publish_time, datetime(2024, 1, 1, 0, 0, 3, 100000, tzinfo=timezone.utc))
+        self.assertEqual(heartbeat.message_kind, "heartbeat")
+        self.assertEqual(heartbeat.question_id, self.q.id)
+
+    def test_other_events_stored(self):
+        self._push({"kind": "heartbeat"})
+        self._push({"kind": "log_record", "log_record": {"msg": "one"}})
+
+        self.assertEqual(list(ServiceUsageEvent.objects.values_list("message_kind", flat=True)), ["log_record"])
+        self.assertEqual(QuestionEventSummary.objects.get().log_record_count, 1)
+
+    def test_stored_heartbeats_used_without_coalesced_heartbeat(self):
+        """Ensure that heartbeats stored before heartbeats were coalesced are still used."""
+        stored = ServiceUsageEvent.objects.create(
+            data={"kind": "heartbeat"},
+            kind=QUESTION_RESPONSE_UPDATED,
+            publish_time=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            question=self.q,
+            service_revision=self.sr,
+        )
+
+        self.assertEqual(Question.objects.get(id=self.q.id).latest_heartbeat, stored)
+
+    def test_with_events_fetches_summaries(self):
+        self._push({"kind": "heartbeat", "n": 1})
+        questions = list(Question.objects.filter(id=self.q.id).with_events(kinds=["heartbeat"]))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(questions[0].latest_heartbeat.data, {"kind": "heartbeat", "n": 1})
+
+    def test_invalid_heartbeat_mode(self):
+        with override_settings(TWINED_HEARTBEAT_MODE="discard"):
+            with self.assertRaises(ValueError):
+                get_heartbeat_mode()
+
+
+class QuestionAdminLogRecordsTestCase(PushEventsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        for index in range(3):
+            self._push(
+                {"kind": "log_record", "log_record": {"msg": f"Message {index}", "levelname": "INFO"}},
+                publish_time=datetime(2024, 1, 1, 0, 0, index, 100000),
+            )
+
+        self.log_records_url = reverse(
+            f"admin:{self.q._meta.app_label}_{self.q._meta.model_name}_log_records", args=[self.q.id]
+        )
+
+    def test_log_records_streamed(self):
+        user = SuperUserFactory()
+        self.client.login(username=user.username, password="password")
+        response = self.client.get(self.log_records_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual([line.split()[-1] for line in lines], ["0", "1", "2"])
+
+    def test_log_records_require_login(self):
+        response = self.client.get(self.log_records_url)
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(TWINED_ADMIN_LOG_RECORDS_PREVIEW_SIZE=2)
+    def test_log_records_preview_shows_latest_records(self):
+        question = QuestionAdmin(QuestionWithValuesDatabaseStorage, admin.site).get_queryset(None).get(id=self.q.id)
+        preview = QuestionAdmin(QuestionWithValuesDatabaseStorage, admin.site).log_records(question)
+
+        self.assertIn(f'href="{self.log_records_url}"', preview)
+        self.assertIn("Showing the last 2 of 3 log records", preview)
+        self.assertNotIn("Message 0", preview)
+        self.assertLess(preview.index("Message 1"), preview.index("Message 2"))
+
+
+class QuestionEventsMixinTestCase(TestCase):
+    def setUp(self):
+        self.sr = ServiceRevision.objects.create(name="gibbon-analyser", tag="1.0.0")
+        self.q = QuestionWithValuesDatabaseStorage.objects.create(service_revision=self.sr)
+
+    def _create_event(self, data, publish_time):
+        return ServiceUsageEvent.objects.create(
+            data=data,
+            kind=QUESTION_RESPONSE_UPDATED,
+            publish_time=publish_time,
+            question=self.q,
+            service_revision=self.sr,
+        )
+
+    def test_message_kind_populated_on_save(self):
+        """Ensure the message kind is populated from either the `kind` or the legacy `type` key on save."""
+        self.assertEqual(self._create_event({"kind": "result"}, "2024-01-01T00:00:00Z").message_kind, "result")
+        self.assertEqual(self._create_event({"type": "heartbeat"}, "2024-01-01T00:00:00Z").message_kind, "heartbeat")
+        self.assertIsNone(self._create_event("just-a-string", "2024-01-01T00:00:00Z").message_kind)
+
+    def test_accessors_filter_on_message_kind(self):
+        """Ensure that the accessors return events of the right kind in both the new and legacy formats."""
+        result = self._create_event({"kind": "result", "output_values": {}}, "2024-01-01T00:00:03Z")
+        self._create_event({"type": "heartbeat", "time": "1"}, "2024-01-01T00:00:01Z")
+        latest_heartbeat = self._create_event({"kind": "heartbeat", "datetime": "2"}, "2024-01-01T00:00:02Z")
+        log_record = self._create_event({"type": "log_record", "log_record": {}}, "2024-01-01T00:00:00Z")
+
+        self.assertEqual(self.q.result, result)
+        self.assertEqual(self.q.latest_heartbeat, latest_heartbeat)
+        self.assertEqual(list(self.q.log_records), [log_record])
+        self.assertEqual(list(self.q.exceptions), [])
+        self.assertIsNone(self.q.delivery_acknowledgement)
+
+    def test_first_of_duplicated_events_used(self):
+        """Ensure that the earliest is used of events duplicated before message ids were stored, in one query."""
+        result = self._create_event({"kind": "result", "output_values": {}}, "2024-01-01T00:00:03Z")
+        self._create_event({"kind": "result", "output_values": {}}, "2024-01-01T00:00:04Z")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.q.result, result)
+
+    def test_accessors_use_prefetched_events(self):
+        """Ensure that events prefetched for many questions are used by the accessors instead of querying."""
+        another_question = QuestionWithValuesDatabaseStorage.objects.create(service_revision=self.sr)
+        result = self._create_event({"kind": "result", "output_values": {}}, "2024-01-01T00:00:03Z")
+        self._create_event({"kind": "heartbeat", "datetime": "1"}, "2024-01-01T00:00:01Z")
+        latest_heartbeat = self._create_event({"kind": "heartbeat", "datetime": "2"}, "2024-01-01T00:00:02Z")
+        self._create_event({"kind": "log_record", "log_record": {}}, "2024-01-01T00:00:00Z")
+
+        with self.assertNumQueries(2):
+            questions = list(
+                QuestionWithValuesDatabaseStorage.objects.order_by("asked").with_events(kinds=["result", "heartbeat"])
+            )
+
+        questions = {question.id: question for question in questions}
+
+        with self.assertNumQueries(0):
+            self.assertEqual(questions[self.q.id].result, result)
+            self.assertEqual(questions[self.q.id].latest_heartbeat, latest_heartbeat)
+            self.assertIsNone(questions[another_question.id].result)
+            self.assertIsNone(questions[another_question.id].latest_heartbeat)
+
+        # Events of kinds that weren't prefetched are still queried
+        with self.assertNumQueries(1):
+            self.assertEqual(len(questions[self.q.id].log_records), 1)
+
+    def test_accessors_use_events_of_all_kinds_prefetched_for_subclasses(self):
+        log_record = self._create_event({"kind": "log_record", "log_record": {}}, "2024-01-01T00:00:00Z")
+        question = Question.objects.select_subclasses().with_events().get(id=self.q.id)
+        self.assertIsInstance(question, QuestionWithValuesDatabaseStorage)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(question.log_records, [log_record])
+            self.assertEqual(question.exceptions, [])
+            self.assertIsNone(question.delivery_acknowledgement)
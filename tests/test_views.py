@@ -3,7 +3,7 @@ from unittest.mock import patch
 from django.test.testcases import TestCase
 from django.urls import reverse
 
-from django_twined.models import ServiceRevision
+from django_twined.models import ServiceRevision, service_revisions
 
 NAMESPACE = "my-org"
 NAME = "my-service"
@@ -67,6 +67,51 @@ class TestGetServiceRevision(TestCase):
             },
         )
 
+    def test_get_service_revision_with_revision_range(self):
+        """Test that the latest service revision within a revision range is returned."""
+        for tag in ("1.0.0", "1.2.0", "1.10.0", "2.0.0"):
+            ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag=tag)
+
+        response = self.client.get(
+            reverse("services", kwargs={"namespace": NAMESPACE, "name": NAME}),
+            data={"revision_range": ">=1.2,<2"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["revision_tag"], "1.10.0")
+
+    def test_invalid_revision_range_causes_error_response(self):
+        response = self.client.get(
+            reverse("services", kwargs={"namespace": NAMESPACE, "name": NAME}),
+            data={"revision_range": "1.2 or later"},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Invalid revision range: '1.2 or later'."})
+
+    def test_revision_range_with_no_matching_revision_causes_error_response(self):
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="1.0.0")
+
+        response = self.client.get(
+            reverse("services", kwargs={"namespace": NAMESPACE, "name": NAME}),
+            data={"revision_range": ">=2"},
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_service_revision_not_modified(self):
+        """Test that a 304 response is returned when the client's ETag matches the service revision found."""
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="1.0.0", is_default=True)
+        url = reverse("services", kwargs={"namespace": NAMESPACE, "name": NAME})
+
+        etag = self.client.get(url).headers["ETag"]
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="2.0.0", is_default=True)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["revision_tag"], "2.0.0")
+
 
 class TestRegisterServiceRevision(TestCase):
     def test_register_service_revision_without_revision_tag_causes_error_response(self):
@@ -131,3 +176,102 @@ class TestRegisterServiceRevision(TestCase):
         self.assertEqual(response.json(), {})
         self.assertEqual(response.status_code, 201)
         self.assertTrue(ServiceRevision.objects.get(namespace=NAMESPACE, name=NAME, tag=revision_tag).is_default)
+
+
+class TestBulkRegisterServiceRevisions(TestCase):
+    def _post(self, data):
+        return self.client.post(reverse("services-bulk"), data=data, content_type="application/json")
+
+    def test_bulk_register_service_revisions(self):
+        """Test that many service revisions are registered at once, with one default per service."""
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="1.0.0", is_default=True)
+
+        response = self._post(
+            [
+                {"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.0.0"},
+                {"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.10.0"},
+                {"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.2.0"},
+                {"namespace": NAMESPACE, "name": "another-service", "revision_tag": "0.1.0", "is_default": False},
+                {"namespace": NAMESPACE, "name": "another-service", "revision_tag": "branch", "is_default": True},
+                {"namespace": NAMESPACE, "revision_tag": "0.1.0"},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result["status"], result.get("is_default")) for result in response.json()["results"]],
+            [
+                ("already_registered", False),
+                ("created", True),
+                ("created", False),
+                ("created", False),
+                ("created", True),
+                ("invalid", None),
+            ],
+        )
+
+        self.assertEqual(
+            set(ServiceRevision.objects.filter(is_default=True).values_list("name", "tag")),
+            {(NAME, "1.10.0"), ("another-service", "branch")},
+        )
+        self.assertIsNotNone(ServiceRevision.objects.get(name=NAME, tag="1.10.0").version_sort_key)
+
+    def test_bulk_registration_makes_existing_revision_default(self):
+        """Test that an already registered revision given `is_default: true` is made the default."""
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="1.0.0")
+        ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="2.0.0", is_default=True)
+
+        response = self._post([{"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.0.0", "is_default": True}])
+
+        self.assertEqual(response.json()["results"][0]["status"], "already_registered")
+        self.assertTrue(response.json()["results"][0]["is_default"])
+        self.assertEqual(ServiceRevision.objects.get(is_default=True).tag, "1.0.0")
+
+    def test_bulk_registration_reports_only_inserted_revisions_as_created(self):
+        """Test that revisions registered concurrently, or by an earlier entry, aren't reported as created."""
+        insert = service_revisions.insert_ignoring_conflicts
+
+        def insert_after_concurrent_registration(model, instances, key_fields):
+            ServiceRevision.objects.create(namespace=NAMESPACE, name=NAME, tag="1.1.0")
+            return insert(model, instances, key_fields)
+
+        with patch.object(service_revisions, "insert_ignoring_conflicts", insert_after_concurrent_registration):
+            response = self._post(
+                [
+                    {"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.0.0"},
+                    {"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.0.0"},
+                    {"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.1.0"},
+                ]
+            )
+
+        self.assertEqual(
+            [result["status"] for result in response.json()["results"]],
+            ["created", "already_registered", "already_registered"],
+        )
+        self.assertEqual(ServiceRevision.objects.filter(namespace=NAMESPACE, name=NAME).count(), 2)
+
+    def test_bulk_registration_callback_given_saved_revisions(self):
+        saved = []
+
+        def is_default(revision):
+            saved.append(revision.pk is not None and not revision._state.adding)
+            return False
+
+        with patch("django_twined.views.SERVICE_REVISION_IS_DEFAULT_CALLBACK", is_default):
+            self._post([{"namespace": NAMESPACE, "name": NAME, "revision_tag": "1.0.0"}])
+
+        self.assertEqual(saved, [True])
+
+    def test_bulk_registration_queries(self):
+        """Test that the number of queries doesn't depend on the number of revisions registered."""
+        entries = [{"namespace": NAMESPACE, "name": NAME, "revision_tag": f"1.{i}.0"} for i in range(20)]
+
+        with patch("django_twined.views.SERVICE_REVISION_IS_DEFAULT_CALLBACK", return_value=False):
+            with self.assertNumQueries(4):
+                self._post(entries)
+
+        self.assertEqual(ServiceRevision.objects.filter(namespace=NAMESPACE, name=NAME).count(), 20)
+
+    def test_invalid_body_causes_error_response(self):
+        self.assertEqual(self._post({"namespace": NAMESPACE}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("services-bulk")).status_code, 405)